@@ -1,7 +1,72 @@
+from __future__ import print_function
+
 from pyspark import SparkContext
 from pyspark.sql import SQLContext
-from numpy.random import choice
-import os, errno
+from itertools import groupby
+import argparse
+import os
+import sys
+
+from parties import load_keywords, load_exclude_handles
+from keyword_matcher import KeywordMatcher
+from archive import ARCHIVE, STORE, MANIFEST, PERIODS, DEFAULT_PERIODS, day_range, period_days, read_periods
+from tweet_schema import MALFORMED_POLICIES, CORRUPT_RECORD, dutch_tweets_flagging_malformed, malformed_rdd, \
+    exclude_handles, report_filters
+from sampling import Reservoir
+from dedupe import DEDUPE_MODES, drop_duplicates, partition_by_id, drop_seen
+from cache import CACHE, ResultCache, input_fingerprint, content_hash, cache_key
+from output import write_sorted
+from metrics import Counters, Timings, plan_counters, spark_stages, profile_accumulator, profiled_map, write_profile, \
+    write_metrics
+
+# command line options
+parser = argparse.ArgumentParser(description="Select 200 random tweets per party")
+parser.add_argument('--period', action='append', choices=list(PERIODS),
+                    help="period to select tweets from, can be given several times (default: the poll periods and "
+                         "the two weeks before the election)")
+parser.add_argument('--output', default="/home/s1220535/gone-with-polls/200tweets/{period}/{party}.txt",
+                    help="file to write the tweets of each party to, {period} and {party} are replaced by their name")
+parser.add_argument('--tweets', type=int, default=200, help="number of tweets to select per party")
+parser.add_argument('--seed', type=int, default=2017, help="seed of the random selection, the same seed selects the "
+                                                           "same tweets")
+parser.add_argument('--stratify-day', action='store_true',
+                    help="divide the tweets of a party evenly over the days of the period, the part of a day without "
+                         "enough tweets is filled with tweets of the other days")
+parser.add_argument('--archive', default=ARCHIVE, help="root of the raw tweet archive")
+parser.add_argument('--store', default=STORE,
+                    help="Parquet store of Dutch tweets written by ingest-dutch-tweets.py, read when it has all days")
+parser.add_argument('--manifest', default=MANIFEST,
+                    help="manifest of the raw archive written by build-manifest.py, '' to list the days with globs")
+parser.add_argument('--check-manifest', action='store_true',
+                    help="list the days the manifest has and read those whose files changed since with globs")
+parser.add_argument('--malformed', choices=sorted(MALFORMED_POLICIES), default='count',
+                    help="count, drop or fail on records that are not valid JSON")
+parser.add_argument('--compare-inference', action='store_true',
+                    help="also infer the schema of the input, to report how long that takes")
+parser.add_argument('--keywords-file', action='append',
+                    help="file with more keywords, a keyword,party line per keyword, can be given several times")
+parser.add_argument('--exclude-file', action='append',
+                    help="file with more handles to exclude, a handle per line, can be given several times")
+parser.add_argument('--metrics', default="/home/s1220535/gone-with-polls/200tweets/metrics.json",
+                    help="file to write the counters and timings of the run to, as JSON")
+parser.add_argument('--profile', help="file to write a cProfile profile of the classification of tweets to")
+parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='exact',
+                    help="drop the duplicate deliveries of a tweet with a shuffle of the Dutch tweets (exact), or with "
+                         "a Bloom filter of the ids seen (bloom), or keep them (off)")
+parser.add_argument('--dedupe-fpr', type=float, default=0.001,
+                    help="rate of unique tweets the Bloom filter drops as duplicates")
+parser.add_argument('--dedupe-capacity', type=int, default=100000,
+                    help="tweets per partition the Bloom filter is sized for at first, it grows beyond that")
+parser.add_argument('--cache', default=CACHE,
+                    help="directory on the local disk to cache the samples in, to write them again without reading "
+                         "the tweets when the input, rules and options are the same, '' for none")
+parser.add_argument('--cache-size', type=int, default=2000, help="size of the cache in MB, the entries used least "
+                                                                 "recently are removed beyond it")
+args = parser.parse_args()
+args.period = args.period or DEFAULT_PERIODS
+
+# wall-clock time of every stage of the run, see metrics.py
+timings = Timings()
 
 # initialisation
 sc = SparkContext(appName="Select 200 Random Tweets Per Party Over Time Period")
@@ -9,126 +74,39 @@ sc.setLogLevel('ERROR')
 
 sqlc = SQLContext(sc)
 
-# real dataframe, two weeks before election
-dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/03/{0[0-9],1[0-4]}/*/*")
-
-# real dataframe, poll 4 period
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/02/{1[5-9],2[0-8]}/*/*")
-
-# real dataframe, poll 3 period
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/02/{0[0-9],1[0-4]}/*/*")
-
-# real dataframe, poll 2 period
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/01/{1[5-9],2[0-8]}/*/*")
-
-# real dataframe, poll 1 period
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/01/{0[0-9],1[0-4]}/*/*")
-
-# test dataframe
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/01/01/*/*")
-
-#
-# Dictionary mapping the keywords to the party they belong to.
-#
-KEYWORDS = {
-    "Volkspartij voor Vrijheid en Democratie": 'vvd',
-    "VVD": 'vvd',
-    "Mark Rutte": 'vvd',
-    "Rutte": 'vvd',
-    "Klaas Dijkhoff": 'vvd',
-    "markrutte": 'vvd',
-    "dijkhoff": 'vvd',
-    "Partij voor de Vrijheid": 'pvv',
-    "PVV": 'pvv',
-    "Geert Wilders": 'pvv',
-    "Wilders": 'pvv',
-    "geertwilderspvv": 'pvv',
-    "Christen-Democratish Appel": 'cda',
-    "CDA": 'cda',
-    "Sybrand van Haersma Buma": 'cda',
-    "Sybrand Buma": 'cda',
-    "Buma": 'cda',
-    "cdavandaag": 'cda',
-    "sybrandbuma": 'cda',
-    "Democraten 66": 'd66',
-    "D66": 'd66',
-    "Alexander Pechtold": 'd66',
-    "Pechtold": 'd66',
-    "d66": 'd66',
-    "APechtold": 'd66',
-    "GroenLinks": 'gl',
-    "GL": 'gl',
-    "Jesse Klaver": 'gl',
-    "Klaver": 'gl',
-    "groenlinks": 'gl',
-    "jesseklaver": 'gl',
-    "Socialistische Partij": 'sp',
-    "SP": 'sp',
-    "Emile Roemer": 'sp',
-    "Roemer": 'sp',
-    "Lilian Marijnissen": 'sp',
-    "SPnl": 'sp',
-    "emileroemer": 'sp',
-    "MarijnissenL": 'sp',
-    "Partij van de Arbeid": 'pvda',
-    "PvdA": 'pvda',
-    "Lodewijk Asscher": 'pvda',
-    "Asscher": 'pvda',
-    "LodewijkA": 'pvda',
-    "ChristenUnie": 'cu',
-    "CU": 'cu',
-    "Gert-Jan Segers": 'cu',
-    "Segers": 'cu',
-    "christenunie": 'cu',
-    "gertjansegers": 'cu',
-    "Partij voor de Dieren": 'pvdd',
-    "PvdD": 'pvdd',
-    "Marianne Thieme": 'pvdd',
-    "Thieme": 'pvdd',
-    "PartijvdDieren": 'pvdd',
-    "mariannethieme": 'pvdd',
-    "50Plus": '50p',
-    "Henk Krol": '50p',
-    "Krol": '50p',
-    "50pluspartij": '50p',
-    "HenkKrol": '50p',
-    "Staatkundig Gereformeerde Partij": 'sgp',
-    "SGP": 'sgp',
-    "Kees van der Staaij": 'sgp',
-    "Staaij": 'sgp',
-    "SGPnieuws": 'sgp',
-    "keesvdstaaij": 'sgp',
-    "Denk": 'denk',
-    "Tunahan Kuzu": 'denk',
-    "Kuzu": 'denk',
-    "DenkNL": 'denk',
-    "tunahankuzu": 'denk',
-    "Forum voor Democratie": 'fvd',
-    "FvD": 'fvd',
-    "Thierry Baudet": 'fvd',
-    "Baudet": 'fvd',
-    "fvdemocratie": 'fvd',
-    "thierrybaudet": 'fvd',
-}
-
-#
-# List of Twitter handles (without the @) that we exclude. Includes parties own handles and major news outlets.
-#
-EXCLUDE_HANDLES = ['VVD', 'markrutte', 'dijkhoff', 'geertwilderspvv', 'cdavandaag', 'sybrandbuma', 'd66',
-                   'APechtold', 'groenlinks', 'jesseklaver', 'SPnl', 'emileroemer', 'MarijnissenL', 'PvdA',
-                   'LodewijkA', 'christenunie', 'gertjansegers', 'PartijvdDieren', 'mariannethieme',
-                   '50pluspartij', 'HenkKrol', 'SGPnieuws', 'keesvdstaaij', 'DenkNL', 'tunahankuzu',
-                   'fvdemocratie', 'thierrybaudet', 'NUnl', 'RTLnieuws', 'NPOpolitiek', 'MarioGibbels',
-                   'nieuwsuittwente', 'telegraaf', 'NOS', 'ADnl', 'FD_Nieuws', 'financieelblad', 'Metro', 'ndnl', 'nrc',
-                   'NRC_commentaar', 'refdag', 'trouw', 'volkskrant', 'BarneveldseKrnt', 'BNDeStem', 'brabantsdagblad',
-                   'delimburger', 'dvhn_nl', 'ED_Eindhoven', 'ED_Regio', 'frieschdagblad', 'DeGelderlander',
-                   'gooieneemlander', 'hdhaarlem', 'lc_nl', 'leidschdagblad', 'nhdagblad', 'parool', 'pzcredactie',
-                   'De_Stentor', 'tubantia', 'foknieuws', 'quotevanvandaag', 'CoronelKart', 'Gemeente', 'Politiek',
-                   '2eKamertweets']
-
+# ship the shared modules to the executors
+for module in ['parties.py', 'keyword_matcher.py', 'tweet_schema.py', 'periods.py', 'archive.py', 'approximate.py',
+               'manifest.py', 'sampling.py', 'metrics.py', 'output.py', 'dedupe.py', 'cache.py']:
+    sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), module))
+
+# the keywords, and the handles whose tweets are dropped, both extended with those of the given files
+keywords = load_keywords(args.keywords_file)
+excluded = load_exclude_handles(args.exclude_file)
+
+# compile the keywords once, every executor receives a single copy
+matcher = sc.broadcast(KeywordMatcher(keywords))
+
+# the key of the samples in the cache: the files of the input, the rules and the options that change them, see cache.py
+# the SparkContext removes the per-user counts the vote pipelines keep on the cluster filesystem, when they are evicted
+cache = ResultCache(args.cache, args.cache_size * 1000000, sc) if args.cache else None
+if cache is not None:
+    with timings.stage('cache lookup'):
+        inputs = input_fingerprint(sc, sqlc, period_days(args.period), args.store, args.archive, args.manifest,
+                                   args.check_manifest)
+    # the samples of the days hold N tweets each, unlike those of earlier runs
+    samples_key = cache_key('full day samples', inputs, content_hash(keywords, excluded), args.period, args.tweets,
+                            args.seed, args.stratify_day, args.dedupe,
+                            args.dedupe_fpr if args.dedupe == 'bloom' else None)
+
+# the tweets every stage in the Python workers keeps or drops
+counters = Counters(sc, ['classified', 'no_party', 'multiple_parties'] +
+                   (['duplicates'] if args.dedupe == 'bloom' else []))
+
+# the profile of mapTweetToParty, if asked for
+profile = profile_accumulator(sc) if args.profile else None
 
 #
-# method mapping a tweet to a party based on keywords and excluded handles
+# method mapping a tweet to a party based on keywords
 #
 def mapTweetToParty(tweet):
     # parse a tweet as a dictionary
@@ -136,87 +114,125 @@ def mapTweetToParty(tweet):
     # encode the tweet text as utf8 (Tweets are utf8)
     text = tweet['text'].encode('utf8')
 
-    # check if we should exclude handle
-    screen_name = tweet['screen_name']
-    if screen_name in EXCLUDE_HANDLES:
-        return (None, text)
+    # the value we sample: the tweet id (which determines its random key, see sampling.py) and its text
+    value = (tweet['id'], text)
 
-    # remove hashtags and twitter handle symbols from text, convert to lower case and split text in words
-    words = text.replace('@', '').replace('#', '').lower().split()
-    # establish an empty set of all parties matched, a set so duplicate parties are already filtered
-    parties = set()
-
-    # iterate over every keyword
-    for keyword, party in KEYWORDS.items():
-        # check if keyword occurs in the sentence
-        if keyword.lower() in words:
-            # if it occurs, the tweet matches that keyword's party
-            parties.add(party)
+    # find the set of all parties of which a keyword (a single word or a phrase) occurs in the tweet,
+    # a set so duplicate parties are already filtered
+    # the matcher removes hashtags and twitter handle symbols from the text, converts it to lower case and
+    # splits it in words, it then finds all keywords in one pass over those words
+    parties = matcher.value.match(text)
 
     # if a tweet does not match exactly one party, we don't count it as a vote
     if len(parties) != 1:
-        return (None, text)
-    # else we return the party the tweet matches
+        counters.add('no_party' if not parties else 'multiple_parties')
+        return (None, value)
+    # else we return the period of the tweet, the party it matches and, if we stratify, its day
     else:
-        return (parties.pop(), text)
+        counters.add('classified')
+        return ((tweet['period'], parties.pop(), tweet['day'] if args.stratify_day else None), value)
+
+
+# number of tweets per party we wish to extract
+N = args.tweets
+
+# number of days in every period
+days = dict((period, len(day_range(*PERIODS[period]))) for period in args.period)
 
 
 #
-# below are the helper functions we need for combineByKey
+# number of tweets to select from a day of a period: the tweets are divided evenly over the days when we stratify
 #
+def quota(period, day):
+    if day is None:
+        return N
+    index = day_range(*PERIODS[period]).index(day)
+    return N // days[period] + (1 if index < N % days[period] else 0)
+
 
-# this is the createCombiner function
-# it creates a 'single value' combiner (in our case a set with one item) from a single value
-def create_combiner(value):
-    return [value]
+# this sampler keeps, for every key, the N tweets with the smallest random keys, see sampling.py
+# when we stratify, a day keeps N tweets as well, so the tweets beyond its quota can fill the quota of other days
+reservoir = Reservoir(N, args.seed)
 
 
-# this is the mergeValue function
-# it merges a single value into an existing combiner
-# in our case, we add the value to an existing set
-def merge_value(combiner, value):
-    combiner.append(value)
-    return combiner
+#
+# for every party in every period, save the tweets, combining the samples of its days: the quota of every day, filled
+# up to N with the other tweets of all days if some days have fewer tweets than their quota
+# write every tweet on one line (remove any newlines from the tweets)
+# should result in a file of max. N lines, every line containing exactly one tweet about that party
+# the rows are ((period, party, day), sample), sorted
+#
+def write_samples(rows):
+    parties = ((key, reservoir.select([(quota(tuple[0][0], tuple[0][2]), tuple[1]) for tuple in samples], N))
+               for key, samples in groupby(rows, lambda tuple: tuple[0][:2]))
+    write_sorted(parties, lambda tuple: tuple[0], lambda key: args.output.format(period=key[0], party=key[1]),
+                 lambda tuple: [t.replace('\n', '').replace('\r', '') + '\n' for t in tuple[1]])
 
 
-# this is the mergeCombiners function
-# it merges two combiners into one combiner
-# in our case, we just need to combine two sets into one
-def merge_combiners(combiner1, combiner2):
-    return combiner1 + combiner2
+# a run with the same input, rules and options has selected these tweets before: write them without reading any tweet
+if cache is not None and samples_key in cache:
+    print("samples from the cache at {}".format(args.cache))
+    write_samples(cache.get(samples_key))
+    write_metrics(args.metrics, os.path.basename(__file__), args, {'cached': 'samples'}, timings.values(),
+                  spark_stages(sc), [])
+    sys.exit(0)
 
 
+#
+# drop the duplicate deliveries of a tweet from the Dutch tweets, or with a Bloom filter, partition them by id for
+# drop_seen, see dedupe.py
+#
+def dedupe(dutch):
+    if args.dedupe == 'exact':
+        return drop_duplicates(dutch)
+    return partition_by_id(dutch) if args.dedupe == 'bloom' else dutch
+
+
+# read the tweets of all periods in a single scan, tagged with their period
+# from the Dutch tweet store if it has all their days, otherwise from the raw archive with the pinned schema, so no
+# pass over the archive is needed to infer it
+# the tweets of the excluded handles (extended with those of the given files) are dropped right away, in the JVM, by a
+# broadcast anti join, before any tweet is shipped to a Python worker
+with timings.stage('read setup'):
+    dataFrame = read_periods(sc, sqlc, args.period, args.store, args.archive, args.malformed, args.compare_inference,
+                             manifest=args.manifest, check_manifest=args.check_manifest)
+    dataFrame = exclude_handles(sqlc, dataFrame, excluded)
+
+# join => drop the tweets of the excluded handles (above)
 # where => filter so that we only have Dutch tweets remaining
-# select => select, from a tweet, only the text and the screen name of the tweeter
+# select => select, from a tweet, only its period, day, id and text
+# window, where => drop the duplicate deliveries of a tweet (or with a Bloom filter, mapPartitions in Python)
 # map => for every tweet that is now left, determine what party it matches
 # filter => filter out all tweets that have 'None' as a party (ie. no match, or multiple matches)
-# combineByKey => combine all seperate tweets into one key-value pair: (party, [list of tweet texts])
-tweets = dataFrame.where(dataFrame.lang == 'nl').select('text', 'user.screen_name').rdd \
-    .map(mapTweetToParty) \
+# aggregateByKey => sample, map-side, at most N tweets per key: ((period, party, day), [sample of tweet texts])
+malformed = sc.accumulator(0)
+dutch = dedupe(dutch_tweets_flagging_malformed(dataFrame, 'period', 'day', 'id', 'text'))
+samples = malformed_rdd(dutch, malformed)
+if args.dedupe == 'bloom':
+    samples = drop_seen(samples, counters, capacity=args.dedupe_capacity, fpr=args.dedupe_fpr)
+samples = profiled_map(samples, mapTweetToParty, profile) \
     .filter(lambda tuple: tuple[0] is not None) \
-    .combineByKey(create_combiner, merge_value, merge_combiners)
-
-# number of tweets per party we wish to extract
-N = 200
-
-# for every party, save the tweets
-for party, tweets in tweets.collect():
-    # to this filename
-    filename = "/home/s1220535/gone-with-polls/200tweets/{}/{}.txt".format('pre-election', party)
-
-    # check if folder exists
-    # from: https://stackoverflow.com/a/12517490
-    if not os.path.exists(os.path.dirname(filename)):
-        try:
-            os.makedirs(os.path.dirname(filename))
-        except OSError as exc:  # Guard against race condition
-            if exc.errno != errno.EEXIST:
-                raise
-
-    # write file for party
-    f = open(filename, 'w+')
-    # write every tweet on one line (remove any newlines from the tweets)
-    # should result in a file of max. 200 lines, every line containing exactly one tweet about that party
-    f.writelines(map(lambda t: t.replace('\n', '').replace('\r', '') + '\n',
-                     choice(tweets, size=min(N, len(tweets)), replace=False).tolist()))
-    f.close()
+    .aggregateByKey(reservoir.zero(), reservoir.add, reservoir.merge)
+
+# write the samples, see write_samples, and store them in the cache as they are written
+# this runs the whole job
+with timings.stage('job'):
+    rows = samples.sortByKey().toLocalIterator()
+    write_samples(cache.store(samples_key, rows) if cache is not None else rows)
+
+# report the rows read and dropped at every stage of the DataFrame part of the job
+plan = report_filters(dutch)
+counts = plan_counters(plan)
+
+# report the malformed records, counted during the job
+if CORRUPT_RECORD in dataFrame.columns:
+    counts['malformed'] = malformed.value
+    print("malformed records: {}".format(counts['malformed']))
+
+counts.update(counters.values())
+if args.dedupe != 'off':
+    print("duplicate deliveries removed: {}".format(counts['duplicates']))
+write_metrics(args.metrics, os.path.basename(__file__), args, counts, timings.values(), spark_stages(sc), plan)
+
+if profile is not None:
+    write_profile(profile, args.profile)
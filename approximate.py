@@ -0,0 +1,78 @@
+from __future__ import division
+
+import hashlib
+import math
+
+import pyspark.sql.functions as sqlfunc
+
+#
+# Approximate preview of the vote counts, from a deterministic sample of the input.
+#
+# The sample is either a fraction of the archive files (or of the tweets, when reading the store), which saves most
+# of the reading, or a fraction of the users, which reads everything but classifies and counts only the tweets of
+# the sampled users. Both are chosen by a seeded hash, so the same fraction and seed always give the same sample.
+#
+# The votes of the sample are counted exactly, the users tweeting about every party with a HyperLogLog sketch (see
+# sql_classifier.count_votes_and_users), and both are extrapolated by the fraction, with an interval for the sampling
+# (and the sketch) error. When users are sampled, every sampled user has all their tweets, so the extrapolation is
+# unbiased. When files are sampled, a user tweeting a lot is more likely to be in the sample than one tweeting once,
+# so the vote totals are rougher, and mostly too high for parties with many heavy tweeters; check-approximate.py
+# compares a preview with the exact counts.
+#
+
+# resolution of the samples: a fraction is rounded to a multiple of 1 / SAMPLE_BUCKETS
+SAMPLE_BUCKETS = 1000000
+
+
+#
+# whether a key (such as a file path) is in the sample of the given fraction, on the driver
+#
+def in_sample(key, fraction, seed=2017):
+    digest = hashlib.md5(u'{}\x00{}'.format(seed, key).encode('utf8')).hexdigest()
+    return int(digest[:8], 16) % SAMPLE_BUCKETS < int(round(fraction * SAMPLE_BUCKETS))
+
+
+#
+# condition that the value of a column (such as a screen name or a tweet id) is in the sample of the given fraction,
+# evaluated in the JVM
+#
+def sample_condition(column, fraction, seed=2017):
+    bucket = sqlfunc.expr('pmod(hash({}, {}), {})'.format(int(seed), column, SAMPLE_BUCKETS))
+    return bucket < int(round(fraction * SAMPLE_BUCKETS))
+
+
+#
+# z-score of a two-sided confidence level of the normal distribution, by bisection on erf
+#
+def z_score(confidence):
+    low, high = 0.0, 10.0
+    for _ in range(60):
+        middle = (low + high) / 2
+        if math.erf(middle / math.sqrt(2)) < confidence:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+#
+# the estimate of a total from its count in a sample of the given fraction, and the bounds of its interval
+# each unit is in the sample with probability fraction, so the count varies by count * (1 - fraction); a sketch with
+# relative standard deviation rsd adds its own error
+#
+def extrapolate(count, fraction, confidence=0.95, rsd=0.0):
+    estimate = count / fraction
+    error = z_score(confidence) * math.sqrt(count * (1 - fraction) + (rsd * count) ** 2) / fraction
+    return int(round(estimate)), int(max(0, math.floor(estimate - error))), int(math.ceil(estimate + error))
+
+
+# header of the files written by estimate_line
+ESTIMATE_HEADER = "party,votes,low,high,users,users_low,users_high\r\n"
+
+
+#
+# the line of a party in the output of a preview: the extrapolated votes and users, each with its interval
+#
+def estimate_line(party, votes, users, fraction, confidence=0.95, rsd=0.02):
+    return "{},{},{},{},{},{},{}\r\n".format(party, *(extrapolate(votes, fraction, confidence) +
+                                                      extrapolate(users, fraction, confidence, rsd)))
@@ -0,0 +1,225 @@
+from __future__ import print_function
+
+from datetime import datetime
+from timeit import default_timer as timer
+
+import pyspark.sql.functions as sqlfunc
+
+from tweet_schema import TWEET_SCHEMA, CORRUPT_RECORD, read_tweets, report_read, input_bytes, tweet_time
+from periods import ARCHIVE, ARCHIVE_YEAR, PERIODS, DEFAULT_PERIODS, day_range, period_days, day_path
+from manifest import MANIFEST, archive_name, read_manifest, files_for_days, files_for_range, stale_days, \
+    relative_path, epoch_seconds, hadoop_path
+from approximate import in_sample, sample_condition
+
+#
+# Access to the tweets of the archive, by day.
+#
+# The raw archive is stored as ARCHIVE/MM/DD/HH/* JSON files. ingest-dutch-tweets.py converts it, one day at a time,
+# into a Parquet store holding only the Dutch tweets and the fields of TWEET_SCHEMA, partitioned by day as
+# STORE/day=YYYY-MM-DD. When the store holds every requested day, the pipelines read it instead of the raw archive.
+# The periods and the layout of the raw archive are defined in periods.py, which does not need Spark.
+# When a manifest of the raw archive is given (see manifest.py), the files of the days it has are read from its list
+# instead of listed with globs, and the files without Dutch tweets are skipped. A job over a time range reads only the
+# files the manifest has tweets of the range in, see read_days.
+# For a preview, only a deterministic sample of the files (or of the tweets of the store) is read, see approximate.py.
+#
+
+# Parquet store of Dutch tweets written by ingest-dutch-tweets.py, relative to the home directory on the cluster
+STORE = "gone-with-the-polls/dutch-tweets"
+
+
+#
+# path of the store partition of one day
+#
+def partition_path(day, store=STORE):
+    return "{}/day={}".format(store, day)
+
+
+#
+# names of the directories directly below a path, empty if the path does not exist
+#
+def list_dirs(sc, path):
+    filesystem, path = hadoop_path(sc, path)
+    if not filesystem.exists(path):
+        return []
+    return sorted(status.getPath().getName() for status in filesystem.listStatus(path) if status.isDirectory())
+
+
+#
+# (path, size) of the files matching a path with globs
+#
+def glob_files(sc, pattern):
+    filesystem, path = hadoop_path(sc, pattern)
+    return [(status.getPath().toString(), status.getLen()) for status in filesystem.globStatus(path) or []
+            if status.isFile()]
+
+
+#
+# days of which the raw archive has a directory
+#
+def archive_days(sc, archive=ARCHIVE):
+    days = []
+    for month in list_dirs(sc, archive):
+        for day in list_dirs(sc, "{}/{}".format(archive, month)):
+            days.append("{}-{}-{}".format(ARCHIVE_YEAR, month, day))
+    return days
+
+
+#
+# days of which the store has a partition, directories starting with _ are partitions still being written
+#
+def stored_days(sc, store=STORE):
+    return [name[len('day='):] for name in list_dirs(sc, store) if name.startswith('day=')]
+
+
+#
+# days (YYYY-MM-DD) of the tweets of a time range (start, end), both seconds since the epoch, end not included
+#
+def range_days(time_range):
+    start, end = time_range
+    return day_range(datetime.utcfromtimestamp(start).strftime('%Y-%m-%d'),
+                     datetime.utcfromtimestamp(max(start, end - 1)).strftime('%Y-%m-%d'))
+
+
+#
+# (start, end) seconds since the epoch of a time range given as two UTC times 'YYYY-MM-DD[ HH:MM:SS]', see
+# manifest.epoch_seconds
+#
+def parse_time_range(start, end):
+    return epoch_seconds(start), epoch_seconds(end)
+
+
+#
+# the paths to read for the given days of the raw archive, and their total size
+# the files of the days the manifest has, if any, the files of the other days are listed with day_path globs
+# with check_manifest, the days the manifest has are listed as well, and those whose files changed since the manifest
+# was built are read with globs, see stale_days
+# with a time range (start, end), only the files of the manifest with tweets in the range are read
+# with a sample fraction, only the files in the sample are read, so the files of the other days are listed as well
+#
+def archive_paths(sc, sqlc, days, archive=ARCHIVE, manifest=None, sample=None, seed=2017, time_range=None,
+                  check_manifest=False):
+    frame = read_manifest(sc, sqlc, manifest)
+    covered, files = set(), []
+    if frame is not None:
+        stale = stale_days(sc, frame, archive, days) if check_manifest else set()
+        if stale:
+            print("the manifest at {} is out of date for {} days, reading them with globs, run build-manifest.py to "
+                  "update it".format(manifest, len(stale)))
+        covered, files = files_for_days(frame, archive_name(sc, archive), [day for day in days if day not in stale])
+        if time_range is not None:
+            in_range = set(files_for_range(frame, archive_name(sc, archive), *time_range)[0])
+            files = [(path, size) for path, size in files if path in in_range]
+        print("the manifest at {} has {} of {} days, reading {} files of them".format(
+            manifest, len(covered), len(days), len(files)))
+
+    globs = [day_path(day, archive) for day in days if day not in covered]
+    if sample is not None:
+        # the files of the other days are listed, so they can be sampled as well
+        for glob in globs:
+            files.extend(glob_files(sc, glob))
+        selected = sorted((path, size) for path, size in files if in_sample(relative_path(path), sample, seed))
+        print("reading a sample of {} of {} files".format(len(selected), len(files)))
+        if not selected:
+            raise ValueError("no file of the days is in the sample, use a larger fraction")
+        return [path for path, _ in selected], sum(size for _, size in selected)
+
+    paths, size = [path for path, _ in files], sum(size for _, size in files)
+    # with no file to read at all, Spark could not even read the schema
+    if not paths and not globs:
+        globs = [day_path(day, archive) for day in days]
+    return paths + globs, size + (input_bytes(sc, globs) if globs else 0)
+
+
+#
+# the tweets of a DataFrame created in a time range (start, end), both seconds since the epoch, end not included, and
+# the malformed records, if they are kept, so they are still counted
+#
+def in_time_range(dataFrame, time_range):
+    time = tweet_time(sqlfunc.col('created_at')).cast('long')
+    condition = (time >= time_range[0]) & (time < time_range[1])
+    if CORRUPT_RECORD in dataFrame.columns:
+        condition = condition | sqlfunc.col(CORRUPT_RECORD).isNotNull()
+    return dataFrame.where(condition)
+
+
+#
+# read the tweets of the given days, with a day column (YYYY-MM-DD)
+# from the store, pruned to the partitions of those days, if it holds all of them, otherwise from the raw archive
+# with a time range (start, end), see parse_time_range, only the tweets created in it are kept, and with a manifest
+# only its files with tweets in it are read; the days should be those of range_days
+#
+def read_days(sc, sqlc, days, store=STORE, archive=ARCHIVE, malformed='count', compare_inference=False,
+              manifest=None, sample=None, seed=2017, time_range=None, check_manifest=False):
+    missing = sorted(set(days) - set(stored_days(sc, store))) if store else days
+
+    if not missing:
+        print("reading {} days from the store at {}".format(len(days), store))
+        # the filter only references the partition column, so Spark only lists and reads those partitions
+        day = sqlfunc.col('day').cast('string')
+        dataFrame = sqlc.read.parquet(store).where(day.isin(days)).withColumn('day', day)
+        # the store has no archive files, so a preview samples its tweets instead
+        if sample is not None:
+            dataFrame = dataFrame.where(sample_condition('id', sample, seed))
+        return in_time_range(dataFrame, time_range) if time_range is not None else dataFrame
+
+    if store and len(missing) < len(days):
+        print("the store at {} lacks {} of {} days, run ingest-dutch-tweets.py to add them".format(
+            store, len(missing), len(days)))
+
+    paths, size = archive_paths(sc, sqlc, days, archive, manifest, sample, seed, time_range, check_manifest)
+    start = timer()
+    dataFrame = read_tweets(sqlc, paths, malformed)
+    report_read(sc, sqlc, paths, timer() - start, compare_inference, size)
+
+    # the day of a tweet is the day directory of its file: .../MM/DD/HH/file
+    path = sqlfunc.input_file_name()
+    month = sqlfunc.regexp_extract(path, '/([0-9]{2})/[0-9]{2}/[^/]+/[^/]+$', 1)
+    day = sqlfunc.regexp_extract(path, '/([0-9]{2})/[^/]+/[^/]+$', 1)
+    dataFrame = dataFrame.withColumn('day', sqlfunc.concat_ws('-', sqlfunc.lit(str(ARCHIVE_YEAR)), month, day))
+    return in_time_range(dataFrame, time_range) if time_range is not None else dataFrame
+
+
+#
+# tag every tweet with the periods its day belongs to, in a period column
+# a tweet in several (overlapping) periods occurs once for every period
+#
+def tag_periods(dataFrame, periods):
+    tags = []
+    for period in periods:
+        first, last = PERIODS[period]
+        tags.append(sqlfunc.when(sqlfunc.col('day').between(first, last), sqlfunc.lit(period)))
+    return dataFrame.select('*', sqlfunc.explode(sqlfunc.array(*tags)).alias('period')) \
+        .where(sqlfunc.col('period').isNotNull())
+
+
+#
+# read the tweets of all the given periods in a single scan, tagged with their period
+# with a sample fraction, only a deterministic sample of the archive files, or of the tweets of the store, is read
+#
+def read_periods(sc, sqlc, periods, store=STORE, archive=ARCHIVE, malformed='count', compare_inference=False,
+                 manifest=None, sample=None, seed=2017, check_manifest=False):
+    dataFrame = read_days(sc, sqlc, period_days(periods), store, archive, malformed, compare_inference, manifest,
+                          sample, seed, check_manifest=check_manifest)
+    return tag_periods(dataFrame, periods)
+
+
+#
+# convert the raw archive files of one day to a store partition of Dutch tweets
+# the partition is written next to the store and renamed into place when complete, so that a failed ingest never
+# leaves a partial day behind and the other partitions are never touched
+#
+def ingest_day(sc, sqlc, day, store=STORE, archive=ARCHIVE, malformed='drop'):
+    tweets = read_tweets(sqlc, [day_path(day, archive)], malformed)
+    columns = [field.name for field in TWEET_SCHEMA.fields]
+
+    filesystem, target = hadoop_path(sc, partition_path(day, store))
+    _, temporary = hadoop_path(sc, "{}/_ingesting_day={}".format(store, day))
+    filesystem.delete(temporary, True)
+
+    tweets.where(tweets.lang == 'nl').select(*columns).write.parquet(temporary.toString())
+
+    filesystem.delete(target, True)
+    if not filesystem.rename(temporary, target):
+        raise IOError("could not move {} to {}".format(temporary.toString(), target.toString()))
+    return tweets
@@ -0,0 +1,126 @@
+from __future__ import print_function
+
+from timeit import default_timer as timer
+
+from pyspark import SparkContext
+from pyspark.sql import SQLContext
+import argparse
+import os
+
+from parties import load_keywords, load_exclude_handles
+from keyword_matcher import KeywordMatcher
+from archive import ARCHIVE, STORE, MANIFEST, PERIODS, read_periods
+from tweet_schema import dutch_tweets, exclude_handles
+from sql_classifier import classify_keywords
+
+#
+# Benchmark comparing the ways to classify tweets by keywords on the same input: one tweet at a time in Python
+# workers (the RDD path of twitter-vote-count.py), in Arrow batches with pandas UDFs, and with Spark SQL expressions.
+# The Dutch tweets are cached first, so every run classifies the same tweets from memory and only the
+# classification is timed. Every run counts the tweets per party, and the counts are checked against the RDD path.
+#
+
+parser = argparse.ArgumentParser(description="Benchmark keyword classification of the RDD path against pandas UDFs")
+parser.add_argument('--period', action='append', choices=list(PERIODS),
+                    help="period to classify the tweets of, can be given several times (default: test)")
+parser.add_argument('--batch-size', type=int, action='append',
+                    help="number of tweets in an Arrow batch, can be given several times (default: 1000, 10000)")
+parser.add_argument('--no-sql', action='store_true', help="do not time the Spark SQL expressions")
+parser.add_argument('--repeat', type=int, default=3, help="number of timed runs, the fastest is reported")
+parser.add_argument('--archive', default=ARCHIVE, help="root of the raw tweet archive")
+parser.add_argument('--store', default=STORE,
+                    help="Parquet store of Dutch tweets written by ingest-dutch-tweets.py, read when it has all days")
+parser.add_argument('--manifest', default=MANIFEST,
+                    help="manifest of the raw archive written by build-manifest.py, '' to list the days with globs")
+parser.add_argument('--check-manifest', action='store_true',
+                    help="list the days the manifest has and read those whose files changed since with globs")
+args = parser.parse_args()
+args.period = args.period or ['test']
+args.batch_size = args.batch_size or [1000, 10000]
+
+# initialisation
+sc = SparkContext(appName="Benchmark Keyword Classification")
+sc.setLogLevel('ERROR')
+
+sqlc = SQLContext(sc)
+
+# ship the shared modules to the executors
+for module in ['parties.py', 'keyword_matcher.py', 'tweet_schema.py', 'periods.py', 'archive.py',
+               'pandas_classifier.py']:
+    sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), module))
+
+# imported after the modules are shipped, pandas and pyarrow are only needed by this benchmark and the pandas mode
+from pandas_classifier import set_batch_size, classify_keyword_batches
+
+keywords = load_keywords()
+matcher = sc.broadcast(KeywordMatcher(keywords))
+
+# the Dutch tweets of the periods, cached, so the runs do not include reading them
+dataFrame = exclude_handles(sqlc, read_periods(sc, sqlc, args.period, args.store, args.archive, 'drop',
+                                              manifest=args.manifest, check_manifest=args.check_manifest),
+                            load_exclude_handles())
+dutch = dutch_tweets(dataFrame, 'period', 'text', 'user.screen_name').cache()
+tweets = dutch.count()
+
+
+#
+# the classification of the RDD path of twitter-vote-count.py: the party of a row, if it matches exactly one
+#
+def mapTweetToParty(tweet):
+    tweet = tweet.asDict()
+    text = tweet['text'].encode('utf8')
+
+    parties = matcher.value.match(text)
+
+    if len(parties) != 1:
+        return None
+    else:
+        return parties.pop()
+
+
+def rdd_counts():
+    return dict(dutch.rdd.map(mapTweetToParty)
+                .filter(lambda party: party is not None)
+                .map(lambda party: (party, 1))
+                .reduceByKey(lambda a, b: a + b)
+                .collect())
+
+
+def pandas_counts():
+    return dict((row.party, row['count']) for row in
+                classify_keyword_batches(dutch, matcher).groupBy('party').count().collect())
+
+
+def sql_counts():
+    return dict((row.party, row['count']) for row in
+                classify_keywords(dutch, keywords).groupBy('party').count().collect())
+
+
+#
+# time one way of counting, returning the fastest of the runs and the counts of the last run
+#
+def benchmark(count):
+    best = None
+    for _ in range(args.repeat):
+        start = timer()
+        counts = count()
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, counts
+
+
+print("tweets: {}".format(tweets))
+
+rdd_time, expected = benchmark(rdd_counts)
+print("rdd:                      {:.3f} s ({:.0f} tweets/s)".format(rdd_time, tweets / rdd_time))
+
+for size in args.batch_size:
+    set_batch_size(sqlc, size)
+    elapsed, counts = benchmark(pandas_counts)
+    print("pandas, batches of {:<6} {:.3f} s ({:.0f} tweets/s), {:.1f}x, counts {}".format(
+        size, elapsed, tweets / elapsed, rdd_time / elapsed, 'match' if counts == expected else 'DIFFER'))
+
+if not args.no_sql:
+    elapsed, counts = benchmark(sql_counts)
+    print("sql:                      {:.3f} s ({:.0f} tweets/s), {:.1f}x, counts {}".format(
+        elapsed, tweets / elapsed, rdd_time / elapsed, 'match' if counts == expected else 'DIFFER'))
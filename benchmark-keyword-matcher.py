@@ -0,0 +1,94 @@
+from __future__ import print_function
+
+from timeit import default_timer as timer
+import argparse
+import random
+
+from parties import KEYWORDS
+from keyword_matcher import KeywordMatcher, tokenize
+
+#
+# Microbenchmark comparing the compiled keyword matcher with the original keyword loop of mapTweetToParty.
+# Runs locally, without Spark, over generated tweets mixing filler words, single-word keywords and phrases.
+#
+
+parser = argparse.ArgumentParser(description="Benchmark the compiled keyword matcher against the keyword loop")
+parser.add_argument('--tweets', type=int, default=100000, help="number of generated tweets")
+parser.add_argument('--words', type=int, default=18, help="average number of words per tweet")
+parser.add_argument('--hit-rate', type=float, default=0.3, help="fraction of tweets mentioning a keyword")
+parser.add_argument('--repeat', type=int, default=3, help="number of timed runs, the fastest is reported")
+parser.add_argument('--seed', type=int, default=2017)
+args = parser.parse_args()
+
+FILLER = ['de', 'het', 'een', 'en', 'van', 'ik', 'je', 'dat', 'is', 'niet', 'op', 'te', 'met', 'voor', 'zijn',
+          'maar', 'ook', 'als', 'dan', 'nog', 'wel', 'debat', 'verkiezingen', 'stemmen', 'vandaag', 'morgen',
+          'https://t.co/x1y2z3', 'RT', 'lol', 'echt', 'Nederland', 'kabinet', 'partij', 'peiling']
+
+
+#
+# the original keyword loop of mapTweetToParty, kept here as the baseline
+#
+def legacy_match(text):
+    words = text.replace('@', '').replace('#', '').lower().split()
+    parties = set()
+    for keyword, party in KEYWORDS.items():
+        if keyword.lower() in words:
+            parties.add(party)
+    return parties
+
+
+#
+# generate tweets: filler words, with a keyword (prefixed by @ or # now and then) inserted in a fraction of them
+#
+def generate_tweets(count, words, hit_rate, rng):
+    keywords = sorted(KEYWORDS)
+    tweets = []
+    for _ in range(count):
+        tweet = [rng.choice(FILLER) for _ in range(max(1, int(rng.gauss(words, words / 3.0))))]
+        # every further keyword is half as likely, so some tweets mention several parties
+        chance = hit_rate
+        while rng.random() < chance:
+            keyword = rng.choice(keywords)
+            tweet.insert(rng.randint(0, len(tweet)), rng.choice(['', '', '@', '#']) + keyword)
+            chance /= 2.0
+        tweets.append(' '.join(tweet))
+    return tweets
+
+
+#
+# time one function over all tweets, returning the fastest of the runs and the results of the last run
+#
+def benchmark(function, tweets, repeat):
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        results = [function(tweet) for tweet in tweets]
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+tweets = generate_tweets(args.tweets, args.words, args.hit_rate, random.Random(args.seed))
+
+start = timer()
+matcher = KeywordMatcher(KEYWORDS)
+build_time = timer() - start
+
+legacy_time, legacy_results = benchmark(legacy_match, tweets, args.repeat)
+compiled_time, compiled_results = benchmark(matcher.match, tweets, args.repeat)
+
+# the matcher finds everything the loop finds, plus the multi-word phrases the loop can never match
+missed = sum(1 for old, new in zip(legacy_results, compiled_results) if not old <= new)
+phrases = sum(1 for old, new in zip(legacy_results, compiled_results) if new - old)
+single = sum(1 for old, new in zip(legacy_results, compiled_results) if len(old) == 1)
+single_compiled = sum(1 for new in compiled_results if len(new) == 1)
+
+print("tweets:                  {}".format(len(tweets)))
+print("average words per tweet: {:.1f}".format(sum(len(tokenize(t)) for t in tweets) / float(len(tweets))))
+print("matcher build time:      {:.3f} ms".format(build_time * 1000))
+print("keyword loop:            {:.3f} s ({:.0f} tweets/s)".format(legacy_time, len(tweets) / legacy_time))
+print("compiled matcher:        {:.3f} s ({:.0f} tweets/s)".format(compiled_time, len(tweets) / compiled_time))
+print("speedup:                 {:.1f}x".format(legacy_time / compiled_time))
+print("tweets with extra phrase matches:       {}".format(phrases))
+print("tweets matching exactly one party:      {} (loop) / {} (matcher)".format(single, single_compiled))
+print("loop matches missed by the matcher:     {}".format(missed))
@@ -0,0 +1,218 @@
+from __future__ import print_function
+
+from collections import OrderedDict
+from datetime import datetime
+from timeit import default_timer as timer
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+
+from periods import PERIODS, day_range
+from synthetic_archive import COMPRESSIONS, TweetGenerator, write_archive
+
+#
+# Scaling benchmark of the Spark pipelines on synthetic archives.
+#
+# For every scale (a number of archive lines), a synthetic archive is generated (see synthetic_archive.py), or reused
+# if one with the same settings exists, and every pipeline is run on it with spark-submit in local mode. From the
+# Spark event log of the run it records the input and shuffle bytes and the peak memory, next to the wall time and
+# the throughput, as a JSON line in a history file, and reports the change in wall time since the last run of the
+# same pipeline on the same archive, so regressions are visible.
+#
+
+# the pipelines: the script and its options, and the output files relative to the output directory
+# the result cache is off, every run reads the whole archive
+PIPELINES = OrderedDict([
+    ('keywords', (['twitter-vote-count.py', '--cache', ''], '{period}.csv')),
+    ('keywords-sql', (['twitter-vote-count.py', '--mode', 'sql', '--cache', ''], '{period}.csv')),
+    ('retweets', (['twitter-vote-count-altmethod.py', '--cache', ''], '{period}.csv')),
+    ('combined', (['twitter-vote-count-combined.py'], '{period}.csv')),
+    ('200-tweets', (['200-tweets-per-party.py', '--cache', ''], '{period}/{party}.txt')),
+])
+
+# the executor metrics of which the peak is recorded, by the name they get in the history
+PEAK_METRICS = OrderedDict([
+    ('jvm_heap', 'JVMHeapMemory'),
+    ('jvm_rss', 'ProcessTreeJVMRSS'),
+    ('python_rss', 'ProcessTreePythonRSS'),
+])
+
+parser = argparse.ArgumentParser(description="Benchmark the pipelines in Spark local mode on synthetic archives of "
+                                             "several sizes")
+parser.add_argument('--scale', type=int, action='append',
+                    help="number of archive lines, can be given several times (default: 10000, 100000, 1000000)")
+parser.add_argument('--pipeline', action='append', choices=list(PIPELINES),
+                    help="pipeline to run, can be given several times (default: all)")
+parser.add_argument('--repeat', type=int, default=1, help="number of runs of every pipeline at every scale")
+parser.add_argument('--work', default='benchmark-work',
+                    help="directory for the archives, event logs and results of the runs")
+parser.add_argument('--history', default='benchmark-history.jsonl', help="file to append the results to")
+parser.add_argument('--tolerance', type=float, default=0.1,
+                    help="relative increase in wall time since the last run reported as a regression")
+parser.add_argument('--spark-submit', default='spark-submit', help="spark-submit command")
+parser.add_argument('--master', default='local[*]', help="Spark master, the benchmark is meant for local mode")
+parser.add_argument('--driver-memory', default='4g', help="memory of the driver, which runs the tasks in local mode")
+parser.add_argument('--compression', choices=sorted(COMPRESSIONS), default='bz2', help="compression of the archive")
+parser.add_argument('--dutch-share', type=float, default=0.1, help="fraction of tweets in Dutch")
+parser.add_argument('--retweet-ratio', type=float, default=0.3, help="fraction of tweets retweeting another user")
+parser.add_argument('--keyword-hit-rate', type=float, default=0.2, help="fraction of tweets mentioning a party")
+parser.add_argument('--ambiguous-rate', type=float, default=0.1,
+                    help="fraction of the tweets mentioning a party that also mention another party")
+parser.add_argument('--users', type=int, default=10000, help="number of users")
+parser.add_argument('--user-skew', type=float, default=1.1, help="exponent of the Zipf distribution of the tweets "
+                                                                 "over the users")
+parser.add_argument('--seed', type=int, default=2017, help="seed of the generator")
+args = parser.parse_args()
+args.scale = args.scale or [10000, 100000, 1000000]
+args.pipeline = args.pipeline or list(PIPELINES)
+
+# the archives are generated for the days of the test period, which the pipelines are run on
+PERIOD = 'test'
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+#
+# the archive of the given scale, generated unless the archive with the same settings already exists
+#
+def archive(scale):
+    settings = OrderedDict([
+        ('lines', scale), ('period', PERIOD), ('compression', args.compression), ('dutch_share', args.dutch_share),
+        ('retweet_ratio', args.retweet_ratio), ('keyword_hit_rate', args.keyword_hit_rate),
+        ('ambiguous_rate', args.ambiguous_rate), ('users', args.users), ('user_skew', args.user_skew),
+        ('seed', args.seed),
+    ])
+    root = os.path.join(args.work, 'archive-{}'.format(scale))
+    # the settings are written in the root, which the pipelines never read: they read root/MM/DD/HH/*
+    marker = os.path.join(root, 'settings.json')
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == settings:
+                return root, settings
+        shutil.rmtree(root)
+
+    start = timer()
+    generator = TweetGenerator(args.seed, args.dutch_share, args.retweet_ratio, args.keyword_hit_rate,
+                               args.ambiguous_rate, args.users, args.user_skew)
+    write_archive(root, day_range(*PERIODS[PERIOD]), scale, generator, compression=args.compression)
+    with open(marker, 'w') as f:
+        json.dump(settings, f)
+    print("generated {} lines in {} in {:.1f} s".format(scale, root, timer() - start))
+    return root, settings
+
+
+#
+# the totals and peaks of a run from its Spark event log: input, shuffle and peak memory
+#
+def event_log_metrics(directory):
+    metrics = OrderedDict([('input_bytes', 0), ('input_records', 0), ('shuffle_write_bytes', 0),
+                           ('shuffle_read_bytes', 0), ('peak_execution_memory_bytes', 0)])
+    peaks = {}
+
+    def peak(executor, values):
+        role = 'driver' if executor == 'driver' else 'executor'
+        for name, metric in PEAK_METRICS.items():
+            key = 'peak_{}_{}_bytes'.format(role, name)
+            if metric in values:
+                peaks[key] = max(peaks.get(key, 0), values[metric])
+
+    logs = [os.path.join(directory, name) for name in os.listdir(directory)] if os.path.isdir(directory) else []
+    if not logs:
+        return metrics
+    with open(max(logs, key=os.path.getmtime)) as f:
+        for line in f:
+            event = json.loads(line)
+            kind = event.get('Event')
+            if kind == 'SparkListenerTaskEnd':
+                task = event.get('Task Metrics') or {}
+                metrics['input_bytes'] += task.get('Input Metrics', {}).get('Bytes Read', 0)
+                metrics['input_records'] += task.get('Input Metrics', {}).get('Records Read', 0)
+                metrics['shuffle_write_bytes'] += task.get('Shuffle Write Metrics', {}).get('Shuffle Bytes Written', 0)
+                read = task.get('Shuffle Read Metrics', {})
+                metrics['shuffle_read_bytes'] += read.get('Remote Bytes Read', 0) + read.get('Local Bytes Read', 0)
+                metrics['peak_execution_memory_bytes'] = max(metrics['peak_execution_memory_bytes'],
+                                                             task.get('Peak Execution Memory', 0))
+                # the peaks of the executor while the task ran (Spark 3)
+                peak(event.get('Task Info', {}).get('Executor ID'), event.get('Task Executor Metrics') or {})
+            elif kind == 'SparkListenerStageExecutorMetrics':
+                peak(event.get('Executor ID'), event.get('Executor Metrics') or {})
+
+    metrics.update(sorted(peaks.items()))
+    return metrics
+
+
+#
+# run a pipeline on an archive, returning its wall time, exit code and event log metrics
+#
+def run(name, root, number):
+    script, output = PIPELINES[name]
+    directory = os.path.abspath(os.path.join(args.work, 'runs', '{}-{}-{}'.format(name, os.path.basename(root),
+                                                                                   number)))
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    events = os.path.join(directory, 'events')
+    os.makedirs(events)
+
+    command = [args.spark_submit, '--master', args.master, '--driver-memory', args.driver_memory,
+               '--conf', 'spark.eventLog.enabled=true',
+               '--conf', 'spark.eventLog.dir=file://{}'.format(events), '--conf', 'spark.eventLog.compress=false',
+               '--conf', 'spark.eventLog.logStageExecutorMetrics=true',
+               '--conf', 'spark.executor.processTreeMetrics.enabled=true',
+               os.path.join(HERE, script[0])] + script[1:] + [
+               '--archive', os.path.abspath(root), '--store', '', '--manifest', '', '--period', PERIOD,
+               '--output', os.path.join(directory, 'output', output),
+               '--metrics', os.path.join(directory, 'metrics.json')]
+
+    with open(os.path.join(directory, 'log.txt'), 'w') as log:
+        start = timer()
+        code = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT)
+        wall = timer() - start
+    return wall, code, event_log_metrics(events)
+
+
+#
+# the last result in the history of the same pipeline, archive and Spark master, or None
+#
+def last_result(history, result):
+    same = [old for old in history if all(old.get(key) == result[key] for key in ('pipeline', 'archive', 'master'))]
+    return same[-1] if same else None
+
+
+history = []
+if os.path.exists(args.history):
+    with open(args.history) as f:
+        history = [json.loads(line) for line in f if line.strip()]
+
+try:
+    commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE).decode('ascii').strip()
+except (OSError, subprocess.CalledProcessError):
+    commit = None
+
+for scale in args.scale:
+    root, settings = archive(scale)
+    for name in args.pipeline:
+        for number in range(args.repeat):
+            wall, code, metrics = run(name, root, number)
+            result = OrderedDict([
+                ('time', datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')), ('commit', commit),
+                ('host', platform.node()), ('pipeline', name), ('master', args.master), ('archive', settings),
+                ('exit_code', code), ('wall_seconds', round(wall, 3)),
+                ('lines_per_second', round(scale / wall, 1)),
+            ])
+            result.update(metrics)
+
+            previous = last_result(history, result)
+            change = ''
+            if previous is not None and previous.get('exit_code') == 0 and code == 0:
+                ratio = wall / previous['wall_seconds'] - 1
+                change = ", {:+.0%} since {}{}".format(ratio, previous['commit'] or previous['time'],
+                                                       " REGRESSION" if ratio > args.tolerance else "")
+            print("{:>9} lines {:<13} {}: {:.1f} s, {:.0f} lines/s, shuffle {:.1f} MB{}".format(
+                scale, name, 'ok' if code == 0 else 'FAILED ({})'.format(code), wall, scale / wall,
+                metrics['shuffle_write_bytes'] / 1e6, change))
+
+            history.append(result)
+            with open(args.history, 'a') as f:
+                f.write(json.dumps(result) + '\n')
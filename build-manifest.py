@@ -0,0 +1,56 @@
+from __future__ import print_function
+
+from pyspark import SparkContext
+from pyspark.sql import SQLContext
+from timeit import default_timer as timer
+import argparse
+
+from archive import ARCHIVE, archive_days, day_range
+from manifest import MANIFEST, archive_name, epoch_seconds, read_manifest, update_manifest, files_for_range
+
+# command line options
+parser = argparse.ArgumentParser(description="Build or update the manifest of the raw tweet archive, a row per file "
+                                             "with its size, records, Dutch tweets and first and last tweet time. "
+                                             "Only the files that are new or changed are read.")
+parser.add_argument('--archive', default=ARCHIVE, help="root of the raw tweet archive")
+parser.add_argument('--manifest', default=MANIFEST, help="path of the manifest")
+parser.add_argument('--first', help="first day to update (YYYY-MM-DD), default the first day of the archive")
+parser.add_argument('--last', help="last day to update (YYYY-MM-DD), default the last day of the archive")
+parser.add_argument('--rebuild', action='store_true', help="also read the files that are already in the manifest")
+parser.add_argument('--from', dest='start',
+                    help="instead of updating, list the files with tweets from this UTC time (YYYY-MM-DD[ HH:MM:SS])")
+parser.add_argument('--to', dest='end', help="... up to this UTC time, not included")
+parser.add_argument('--all-files', action='store_true', help="also list the files without Dutch tweets")
+args = parser.parse_args()
+
+# initialisation
+sc = SparkContext(appName="Build Manifest Of Tweet Archive")
+sc.setLogLevel('ERROR')
+
+sqlc = SQLContext(sc)
+
+if args.start or args.end:
+    manifest = read_manifest(sc, sqlc, args.manifest)
+    if manifest is None:
+        parser.error("there is no manifest at {}".format(args.manifest))
+    if not (args.start and args.end):
+        parser.error("give both --from and --to")
+
+    # the minimal list of files with tweets in the time range, which twitter-vote-series.py --from --to reads instead
+    # of globs
+    paths, size = files_for_range(manifest, archive_name(sc, args.archive), epoch_seconds(args.start),
+                                  epoch_seconds(args.end), not args.all_files)
+    for path in paths:
+        print(path)
+    print("{} files, {:.1f} MB".format(len(paths), size / 1e6))
+else:
+    # the days of the archive to update, all of them unless a first or last day is given
+    days = None
+    if args.first or args.last:
+        days = archive_days(sc, args.archive)
+        days = sorted(set(days) & set(day_range(args.first or days[0], args.last or days[-1]))) if days else []
+
+    start = timer()
+    kept, added, removed = update_manifest(sc, sqlc, args.manifest, args.archive, days, args.rebuild)
+    print("updated {} in {:.1f} s: {} files kept, {} added or changed, {} removed".format(
+        args.manifest, timer() - start, kept, added, removed))
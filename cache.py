@@ -0,0 +1,209 @@
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+from archive import ARCHIVE, STORE, stored_days
+from manifest import MANIFEST, read_manifest, archive_name, list_archive, list_files, hadoop_path
+from output import atomic_file
+
+#
+# Content-addressed cache of the results of the pipelines, on the local disk of the driver.
+#
+# A result is stored under a key hashed from everything it depends on: the files the job would read (their paths,
+# sizes and modification times, from the manifest of the archive for the days it has and listed otherwise, so a
+# rerun with a stale manifest is as stale as its read), the keyword, handle and excluded handle tables in use, the
+# method and the options that change the result, but not the output paths. A rerun with the same key writes its
+# output from the cache without reading any tweet. The vote pipelines in rdd mode also keep the per-user party
+# counts under a key without the options of the final aggregation (bot cutoff, bootstrap), so a change to only those
+# counts the votes from the cached counts instead of the archive.
+#
+# Every entry is a single gzipped file of pickled records, except the per-user counts, which are as large as the data
+# and stay on the cluster filesystem as a pickle file of their RDD, which the local disk only keeps a marker of, with
+# its path and size. Reading an entry marks it as used, and once the cache is larger than its size limit, the entries
+# used least recently are removed.
+#
+
+# the cache, on the local disk of the driver
+CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'gone-with-the-polls')
+
+# the entries kept on the cluster filesystem, relative to the home directory there
+DATASETS = 'gone-with-the-polls-cache'
+
+# pickle protocol of the entries, which Python 2 and 3 both read
+PROTOCOL = 2
+
+
+#
+# fingerprint of the input of a job over the given days, as archive.read_days reads it: the files of their partitions
+# of the store if it holds all of them, otherwise the files of their directories of the raw archive, as the manifest
+# has them for the days it has, unless check_manifest is set, and listed for the other days
+#
+def input_fingerprint(sc, sqlc, days, store=STORE, archive=ARCHIVE, manifest=MANIFEST, check_manifest=False):
+    if store and not set(days) - set(stored_days(sc, store)):
+        inputs = [("{}/day={}".format(store, day), list_files(sc, "{}/day={}".format(store, day))) for day in days]
+    else:
+        frame = None if check_manifest else read_manifest(sc, sqlc, manifest)
+        known = {}
+        if frame is not None:
+            rows = frame.where((frame.archive == archive_name(sc, archive)) & frame.day.isin(list(days))) \
+                .select('day', 'path', 'size', 'modified').collect()
+            for row in rows:
+                known.setdefault(row.day, {})[row.path] = (row.size, row.modified)
+        inputs = [(day, known[day] if day in known else list_archive(sc, archive, [day])) for day in days]
+    digest = hashlib.sha256()
+    for root, files in inputs:
+        digest.update(json.dumps([root, sorted(files.items())]).encode('utf8'))
+    return digest.hexdigest()
+
+
+#
+# hash of the content of tables (dicts, sets or lists of strings), whatever their order
+#
+def content_hash(*tables):
+    digest = hashlib.sha256()
+    for table in tables:
+        entries = sorted(table.items()) if isinstance(table, dict) else sorted(table)
+        digest.update(json.dumps(entries).encode('utf8'))
+    return digest.hexdigest()
+
+
+#
+# the key of a result from the values it depends on, which must be JSON serializable
+#
+def cache_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf8')).hexdigest()
+
+
+class ResultCache(object):
+
+    #
+    # the cache in a directory, of at most max_bytes, with its RDD entries in the directory datasets on the cluster
+    # filesystem of the SparkContext sc, if given
+    #
+    def __init__(self, directory=CACHE, max_bytes=2000000000, sc=None, datasets=DATASETS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sc = sc
+        self.datasets = datasets
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pickle.gz')
+
+    def _marker(self, key):
+        return os.path.join(self.directory, key + '.dataset')
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    #
+    # the records of an entry, as an iterator; the entry is marked as used
+    #
+    def get(self, key):
+        path = self._path(key)
+        os.utime(path, None)
+        with gzip.open(path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    #
+    # pass on the records of an iterator, storing them under a key as they go; the entry is only added once the
+    # iterator is exhausted, so a job that fails half way leaves no entry behind
+    #
+    def store(self, key, records):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix='.' + key + '.')
+        try:
+            with os.fdopen(descriptor, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as f:
+                    for record in records:
+                        pickle.dump(record, f, PROTOCOL)
+                        yield record
+            getattr(os, 'replace', os.rename)(temporary, self._path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict(keep=key)
+
+    #
+    # store the records of an iterator under a key
+    #
+    def put(self, key, records):
+        for _ in self.store(key, records):
+            pass
+
+    #
+    # whether an RDD is stored under a key
+    #
+    def has_rdd(self, key):
+        return os.path.exists(self._marker(key))
+
+    #
+    # the RDD stored under a key, read from the cluster filesystem; the entry is marked as used
+    #
+    def get_rdd(self, key):
+        os.utime(self._marker(key), None)
+        with open(self._marker(key)) as f:
+            return self.sc.pickleFile(json.load(f)['path'])
+
+    #
+    # store the records of an RDD under a key, on the cluster filesystem, so they never pass through the driver; the
+    # RDD is written next to its place and renamed into it when complete, and only then gets its marker
+    #
+    def put_rdd(self, key, rdd):
+        filesystem, target = hadoop_path(self.sc, "{}/{}".format(self.datasets, key))
+        _, temporary = hadoop_path(self.sc, "{}/_writing_{}".format(self.datasets, key))
+        filesystem.delete(temporary, True)
+        rdd.saveAsPickleFile(filesystem.makeQualified(temporary).toString())
+        filesystem.delete(target, True)
+        if not filesystem.rename(temporary, target):
+            raise IOError("could not rename {} to {}".format(temporary.toString(), target.toString()))
+        with atomic_file(self._marker(key)) as f:
+            json.dump({'path': filesystem.makeQualified(target).toString(),
+                       'bytes': filesystem.getContentSummary(target).getLength()}, f)
+        self.evict(keep=key)
+
+    #
+    # (modification time, bytes, key, path) of every entry; the RDD entries only if there is a SparkContext to remove
+    # them with
+    #
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.pickle.gz'):
+                entries.append((os.path.getmtime(path), os.path.getsize(path), name[:-len('.pickle.gz')], path))
+            elif name.endswith('.dataset') and self.sc is not None:
+                with open(path) as f:
+                    size = json.load(f)['bytes']
+                entries.append((os.path.getmtime(path), size, name[:-len('.dataset')], path))
+        return entries
+
+    #
+    # remove an entry, and for an RDD entry its files on the cluster filesystem, before its marker
+    #
+    def _remove(self, path):
+        if path.endswith('.dataset'):
+            with open(path) as f:
+                filesystem, dataset = hadoop_path(self.sc, json.load(f)['path'])
+            filesystem.delete(dataset, True)
+        os.remove(path)
+
+    #
+    # remove the entries used least recently until the cache is at most max_bytes, except the entry of the given key
+    #
+    def evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, key, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                self._remove(path)
+                total -= size
@@ -0,0 +1,55 @@
+from __future__ import print_function, division
+
+import argparse
+import io
+
+from periods import PERIODS, DEFAULT_PERIODS
+
+#
+# Compares the preview written by a vote count with --approximate (see approximate.py) with the exact votes of the
+# same periods. Runs locally, without Spark, over the files the two runs wrote.
+#
+
+parser = argparse.ArgumentParser(description="Compare the votes of a preview with the exact votes, per period and "
+                                             "party")
+parser.add_argument('--period', action='append', choices=list(PERIODS),
+                    help="period to compare, can be given several times (default: the poll periods and the two weeks "
+                         "before the election)")
+parser.add_argument('--preview', default="/home/s1895508/votes_approx_{period}.csv",
+                    help="file with the preview of each period, {period} is replaced by the period name")
+parser.add_argument('--exact', default="/home/s1895508/votes_{period}.csv",
+                    help="file with the exact votes of each period, {period} is replaced by the period name")
+args = parser.parse_args()
+args.period = args.period or DEFAULT_PERIODS
+
+
+#
+# {party: [fields after the party]} of an output file, without its header if any
+#
+def read_counts(path):
+    counts = {}
+    with io.open(path, encoding='utf8') as lines:
+        for line in lines:
+            fields = line.strip().split(',')
+            if len(fields) > 1 and fields[1].isdigit():
+                counts[fields[0]] = [int(field) for field in fields[1:]]
+    return counts
+
+
+inside, total = 0, 0
+for period in args.period:
+    preview = read_counts(args.preview.format(period=period))
+    exact = read_counts(args.exact.format(period=period))
+
+    print("{}:".format(period))
+    print("  {:<16} {:>9} {:>21} {:>9} {:>8}".format('party', 'estimate', 'interval', 'exact', 'error'))
+    for party in sorted(set(preview) | set(exact)):
+        estimate, low, high = preview.get(party, [0, 0, 0])[:3]
+        votes = exact.get(party, [0])[0]
+        total += 1
+        inside += low <= votes <= high
+        error = "{:+.1%}".format((estimate - votes) / votes) if votes else '-'
+        print("  {:<16} {:>9} {:>21} {:>9} {:>8}{}".format(party, estimate, "[{}, {}]".format(low, high), votes, error,
+                                                          '' if low <= votes <= high else '  outside'))
+
+print("{} of {} exact counts inside their interval".format(inside, total))
@@ -0,0 +1,117 @@
+from __future__ import division
+
+import hashlib
+import math
+
+from pyspark.sql.window import Window
+import pyspark.sql.functions as sqlfunc
+
+#
+# De-duplication of the tweets, by tweet id.
+#
+# The archive holds some tweets more than once, delivered again in another file or hour, which would count twice for
+# their user. Only the Dutch tweets are de-duplicated, after the columns the pipeline needs (including the id) are
+# selected, so the shuffle is small. A tweet tagged with several (overlapping) periods is kept once in each of them.
+#
+# exact => keep the first delivery of every id per period, with a shuffle of the Dutch tweets in the JVM; the rows it
+#           drops are counted from the plan metrics (see metrics.plan_counters)
+# bloom => hash-partition the Dutch tweets by id in the JVM, without sorting them, and drop, in the Python workers,
+#           the tweets a Bloom filter of the ids seen by the partition already holds; the filter takes a bounded number
+#           of bits per tweet however long the range, at the cost of dropping a unique tweet with probability fpr
+# off => keep every delivery
+#
+
+DEDUPE_MODES = ['exact', 'bloom', 'off']
+
+
+#
+# keep one row per id and per value of the given key columns, and every row without an id (malformed records)
+# the condition is not a plain limit on the row number, so Spark keeps it as a filter and counts the rows it drops
+#
+def drop_duplicates(dataFrame, keys=('period',)):
+    window = Window.partitionBy(*(list(keys) + ['id'])).orderBy('id')
+    return dataFrame.withColumn('delivery', sqlfunc.row_number().over(window)) \
+        .where(sqlfunc.col('id').isNull() | (sqlfunc.col('delivery') == 1)) \
+        .drop('delivery')
+
+
+#
+# the two hashes of a key from which the bit positions of every filter are derived (double hashing)
+#
+def _hashes(key):
+    digest = hashlib.md5(key.encode('utf8')).hexdigest()
+    return int(digest[:16], 16), int(digest[16:], 16) | 1
+
+
+class BloomFilter(object):
+
+    #
+    # a Bloom filter sized for capacity keys with a false positive rate of fpr
+    #
+    def __init__(self, capacity, fpr):
+        self.capacity = capacity
+        self.size = int(math.ceil(-capacity * math.log(fpr) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, hashes):
+        return [(hashes[0] + i * hashes[1]) % self.size for i in range(self.hashes)]
+
+    def contains(self, hashes):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(hashes))
+
+    def add(self, hashes):
+        for position in self._positions(hashes):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class SeenFilter(object):
+
+    #
+    # the keys seen so far, in Bloom filters of growing capacity: when a filter is full, one of twice its capacity
+    # and half its false positive rate is added, so the rate of all of them together stays below fpr however many
+    # keys there are
+    #
+    def __init__(self, capacity=100000, fpr=0.001):
+        self.fpr = fpr
+        self.filters = [BloomFilter(capacity, fpr / 2)]
+
+    #
+    # whether a key (a string) was seen before, probably; if not, it is seen from now on
+    #
+    def seen(self, key):
+        hashes = _hashes(key)
+        if any(bloom.contains(hashes) for bloom in self.filters):
+            return True
+        last = self.filters[-1]
+        if last.count >= last.capacity:
+            last = BloomFilter(last.capacity * 2, self.fpr / 2 ** (len(self.filters) + 1))
+            self.filters.append(last)
+        last.add(hashes)
+        return False
+
+
+#
+# the rows of a DataFrame hash-partitioned by id, for drop_seen, which needs every delivery of a tweet in the same
+# partition
+#
+def partition_by_id(dataFrame, partitions=None):
+    return dataFrame.repartition(partitions, 'id') if partitions else dataFrame.repartition('id')
+
+
+#
+# drop the rows of an RDD built from partition_by_id whose id (and period, or other key columns) a filter of every
+# partition has seen, counting them in the given Counters (see metrics.py) as duplicates
+#
+def drop_seen(rdd, counters, keys=('period',), capacity=100000, fpr=0.001):
+    def keep(iterator):
+        seen = SeenFilter(capacity, fpr)
+        for row in iterator:
+            if seen.seen(u'\x00'.join([str(row.id)] + [u'{}'.format(getattr(row, key)) for key in keys])):
+                counters.add('duplicates')
+            else:
+                yield row
+
+    return rdd.mapPartitions(keep)
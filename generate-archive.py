@@ -0,0 +1,43 @@
+from __future__ import print_function
+
+from timeit import default_timer as timer
+import argparse
+
+from periods import PERIODS, day_range
+from synthetic_archive import COMPRESSIONS, TweetGenerator, write_archive
+
+# command line options
+parser = argparse.ArgumentParser(description="Generate a synthetic tweet archive, shaped like the raw archive "
+                                             "(MM/DD/HH/* files of JSON lines)")
+parser.add_argument('output', help="root of the archive to write, the pipelines read it with --archive")
+parser.add_argument('--tweets', type=int, default=100000, help="number of lines to write, over all days")
+parser.add_argument('--period', choices=list(PERIODS), default='test', help="period of which to write the days")
+parser.add_argument('--hours', type=int, default=24, help="number of hour directories per day")
+parser.add_argument('--files-per-hour', type=int, default=2, help="number of files per hour directory")
+parser.add_argument('--compression', choices=sorted(COMPRESSIONS), default='bz2',
+                    help="compression of the files, the real archive is compressed with bzip2")
+parser.add_argument('--dutch-share', type=float, default=0.1, help="fraction of tweets in Dutch")
+parser.add_argument('--retweet-ratio', type=float, default=0.3,
+                    help="fraction of tweets retweeting another user, half of them a party handle")
+parser.add_argument('--keyword-hit-rate', type=float, default=0.2, help="fraction of tweets mentioning a party")
+parser.add_argument('--ambiguous-rate', type=float, default=0.1,
+                    help="fraction of the tweets mentioning a party that also mention another party")
+parser.add_argument('--users', type=int, default=10000, help="number of users")
+parser.add_argument('--user-skew', type=float, default=1.1,
+                    help="exponent of the Zipf distribution of the tweets over the users, 0 divides them evenly")
+parser.add_argument('--excluded-share', type=float, default=0.01, help="fraction of tweets of excluded handles")
+parser.add_argument('--delete-share', type=float, default=0.05, help="fraction of lines that are deletion notices")
+parser.add_argument('--duplicate-share', type=float, default=0.0,
+                    help="fraction of lines that deliver a recent tweet again, to check the de-duplication")
+parser.add_argument('--seed', type=int, default=2017, help="seed of the generator, the same seed writes the same "
+                                                           "archive")
+args = parser.parse_args()
+
+generator = TweetGenerator(args.seed, args.dutch_share, args.retweet_ratio, args.keyword_hit_rate,
+                           args.ambiguous_rate, args.users, args.user_skew, args.excluded_share, args.delete_share,
+                           args.duplicate_share)
+
+start = timer()
+lines = write_archive(args.output, day_range(*PERIODS[args.period]), args.tweets, generator, args.hours,
+                      args.files_per_hour, args.compression)
+print("wrote {} lines to {} in {:.2f} s".format(lines, args.output, timer() - start))
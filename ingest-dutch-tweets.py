@@ -0,0 +1,48 @@
+from __future__ import print_function
+
+from pyspark import SparkContext
+from pyspark.sql import SQLContext
+from timeit import default_timer as timer
+import argparse
+
+from archive import ARCHIVE, STORE, archive_days, stored_days, day_range, ingest_day
+from tweet_schema import MALFORMED_POLICIES, count_malformed
+
+# command line options
+parser = argparse.ArgumentParser(description="Convert the raw tweet archive to a day-partitioned Parquet store "
+                                             "of Dutch tweets. Days already in the store are skipped.")
+parser.add_argument('--archive', default=ARCHIVE, help="root of the raw tweet archive")
+parser.add_argument('--store', default=STORE, help="path of the Parquet store")
+parser.add_argument('--first', help="first day to ingest (YYYY-MM-DD), default the first day of the archive")
+parser.add_argument('--last', help="last day to ingest (YYYY-MM-DD), default the last day of the archive")
+parser.add_argument('--overwrite', action='store_true', help="also convert days that are already in the store")
+parser.add_argument('--malformed', choices=sorted(MALFORMED_POLICIES), default='drop',
+                    help="drop, fail on or count (with an extra pass per day) records that are not valid JSON")
+args = parser.parse_args()
+
+# initialisation
+sc = SparkContext(appName="Ingest Dutch Tweets Into Parquet Store")
+sc.setLogLevel('ERROR')
+
+sqlc = SQLContext(sc)
+
+# the days of the archive we wish to ingest
+days = archive_days(sc, args.archive)
+if days and (args.first or args.last):
+    days = sorted(set(days) & set(day_range(args.first or days[0], args.last or days[-1])))
+
+# only convert the days the store does not have yet, existing partitions are never rewritten
+if not args.overwrite:
+    stored = set(stored_days(sc, args.store))
+    days = [day for day in days if day not in stored]
+
+print("ingesting {} days into {}".format(len(days), args.store))
+
+for day in days:
+    start = timer()
+    tweets = ingest_day(sc, sqlc, day, args.store, args.archive, args.malformed)
+
+    if args.malformed == 'count':
+        print("{}: done in {:.1f} s, {} malformed records".format(day, timer() - start, count_malformed(tweets)))
+    else:
+        print("{}: done in {:.1f} s".format(day, timer() - start))
@@ -0,0 +1,94 @@
+#
+# Compiled keyword matcher: finds every party mentioned in a tweet in a single scan over its words.
+#
+# Single-word keywords are looked up in a word -> party hash index. Multi-word keywords (such as "Mark Rutte" or
+# "Partij van de Arbeid") are stored in a trie over words, so a phrase is matched by walking the trie from the
+# word it starts at. The walk is bounded by the longest phrase, so one tweet costs O(words).
+#
+
+
+#
+# split a tweet in lower case words, after removing hashtags and twitter handle symbols
+#
+def tokenize(text):
+    return text.replace('@', '').replace('#', '').lower().split()
+
+
+class KeywordMatcher(object):
+
+    #
+    # build the word index and phrase trie from a dictionary mapping keywords to parties
+    #
+    def __init__(self, keywords):
+        # word -> party, for keywords consisting of one word
+        self.words = {}
+        # word -> (party or None, {next word -> (party or None, {...})}), for keywords of multiple words
+        self.phrases = {}
+
+        for keyword, party in keywords.items():
+            words = tokenize(keyword)
+            if not words:
+                continue
+
+            if len(words) == 1:
+                self._add_word(words[0], party, keyword)
+            else:
+                self._add_phrase(words, party, keyword)
+
+    def _add_word(self, word, party, keyword):
+        if self.words.get(word, party) != party:
+            raise ValueError("keyword '{}' maps to both '{}' and '{}'".format(keyword, self.words[word], party))
+        self.words[word] = party
+
+    def _add_phrase(self, words, party, keyword):
+        children = self.phrases
+        node = None
+        for word in words:
+            node = children.get(word)
+            if node is None:
+                node = children[word] = [None, {}]
+            children = node[1]
+
+        if node[0] not in (None, party):
+            raise ValueError("keyword '{}' maps to both '{}' and '{}'".format(keyword, node[0], party))
+        node[0] = party
+
+    #
+    # return the set of parties of which a keyword occurs in the given words
+    #
+    def match_words(self, words):
+        parties = set()
+        index = self.words
+        phrases = self.phrases
+        length = len(words)
+
+        for i in range(length):
+            word = words[i]
+
+            party = index.get(word)
+            if party is not None:
+                parties.add(party)
+
+            # walk the phrase trie for phrases starting at this word
+            node = phrases.get(word)
+            j = i + 1
+            while node is not None and j < length:
+                node = node[1].get(words[j])
+                j += 1
+                if node is not None and node[0] is not None:
+                    parties.add(node[0])
+
+        return parties
+
+    #
+    # return the set of parties of which a keyword occurs in the given tweet text
+    #
+    def match(self, text):
+        return self.match_words(tokenize(text))
+
+    #
+    # return the party of which a keyword occurs in the given words if there is exactly one, otherwise None
+    #
+    def party(self, words):
+        parties = self.match_words(words)
+        return parties.pop() if len(parties) == 1 else None
@@ -0,0 +1,357 @@
+from __future__ import print_function
+
+from collections import Counter
+from multiprocessing import Pool, cpu_count
+import bz2
+import glob
+import gzip
+import json
+import os
+import zlib
+
+from periods import ARCHIVE, PERIODS, period_days, day_path
+from votes import PartyCounter
+
+#
+# Running the pipelines on a single machine with a process pool, without Spark.
+#
+# The raw archive files of the requested days are divided over tasks. Every task parses its files one line at a time
+# (plain, gzip or bzip2 compressed) and aggregates the Dutch tweets into partial results: the party counts of every
+# user, hashed into shards, or the tweet samples of every party, the same partial results Spark aggregates map-side.
+# The shards of the same users are then merged into votes in parallel, and the samples merged in the main process.
+#
+# The rules are those of the Spark pipelines, and the results are written in the same format by run-locally.py, so
+# both can be checked against each other. As there, the duplicate deliveries of a tweet are dropped (exact): the tasks
+# then hash what every Dutch tweet adds to a result into shards by tweet id instead, and every shard keeps only the
+# first delivery of every (period, id), as the deliveries of a tweet can be in the files of different tasks, before
+# they are added to partial results.
+#
+
+# what to do with lines that are not valid JSON, as tweet_schema.MALFORMED_POLICIES
+MALFORMED_POLICIES = ['count', 'drop', 'fail']
+
+# what to do with the duplicate deliveries of a tweet, the modes of dedupe.DEDUPE_MODES that need no Spark
+DEDUPE_MODES = ['exact', 'off']
+
+
+#
+# the text of a tweet as the Spark pipelines see it: encoded as utf8 under Python 2, where the pipelines run
+#
+def utf8(text):
+    return text.encode('utf8') if bytes is str else text
+
+
+#
+# open a raw archive file for reading bytes, decompressing it if it is compressed
+#
+def open_archive_file(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'rb')
+    return open(path, 'rb')
+
+
+#
+# the tweets of a raw archive file, as dictionaries, one line at a time
+# lines that are not JSON objects are counted in counts['malformed'], or skipped, or raise a ValueError, by policy
+#
+def read_tweets(path, counts, malformed='count'):
+    with open_archive_file(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                tweet = json.loads(line.decode('utf8', 'replace'))
+            except ValueError:
+                tweet = None
+            if isinstance(tweet, dict):
+                yield tweet
+            elif malformed == 'fail':
+                raise ValueError("malformed record in {}: {}".format(path, line[:100]))
+            elif malformed == 'count':
+                counts['malformed'] += 1
+
+
+#
+# the value of a nested field of a tweet, such as ('user', 'screen_name'), or None if it is missing
+#
+def field(tweet, *names):
+    for name in names:
+        if not isinstance(tweet, dict):
+            return None
+        tweet = tweet.get(name)
+    return tweet
+
+
+#
+# the (path, day, periods) of the raw archive files of the given periods, the largest first, so that tasks taking
+# the largest files start first
+#
+def archive_files(periods, archive=ARCHIVE):
+    files = []
+    for day in period_days(periods):
+        tagged = [period for period in periods if PERIODS[period][0] <= day <= PERIODS[period][1]]
+        for path in glob.glob(day_path(day, archive)):
+            if os.path.isfile(path):
+                files.append((os.path.getsize(path), path, day, tagged))
+    return [(path, day, tagged) for _, path, day, tagged in sorted(files, reverse=True)]
+
+
+#
+# divide the files over a number of tasks, dealing the largest files out first, so the tasks are about as large
+#
+def divide(files, tasks):
+    return [chunk for chunk in (files[i::tasks] for i in range(tasks)) if chunk]
+
+
+#
+# A job aggregates the Dutch tweets of the files of a task (tagged with their day and period) into a partial result,
+# merges partial results into the final result, and defines what is shipped to the workers: a job is pickled into
+# every task, so it holds the compiled keywords or handles and not the tweets.
+# A job has the handles whose tweets are dropped in excluded.
+#
+class Job(object):
+
+    #
+    # the partial result of a task without tweets
+    #
+    def zero(self):
+        raise NotImplementedError
+
+    #
+    # what a Dutch tweet of a period adds to a partial result, small enough to be shipped between processes, or None
+    # if it adds nothing
+    #
+    def record(self, tweet, period, day):
+        raise NotImplementedError
+
+    #
+    # add the record of a tweet to a partial result
+    #
+    def add_record(self, partial, record):
+        raise NotImplementedError
+
+    #
+    # add a Dutch tweet of a period to a partial result, unless it is a tweet of an excluded handle
+    #
+    def add(self, partial, tweet, period, day):
+        if field(tweet, 'user', 'screen_name') in self.excluded:
+            return
+        record = self.record(tweet, period, day)
+        if record is not None:
+            self.add_record(partial, record)
+
+    #
+    # merge the partial results of all tasks into the result
+    #
+    def merge(self, pool, partials):
+        raise NotImplementedError
+
+
+class VoteCount(Job):
+
+    #
+    # count votes per party per period, with a classifier mapping a tweet (a dictionary) to a party or None, for the
+    # given parties, the per-user counts are hashed on the user into the given number of shards
+    # tweets of the excluded handles are not counted
+    #
+    def __init__(self, classify, parties, excluded, shards):
+        self.classify = classify
+        self.counter = PartyCounter(parties)
+        self.excluded = excluded
+        self.shards = shards
+
+    def zero(self):
+        return [{} for _ in range(self.shards)]
+
+    def record(self, tweet, period, day):
+        party = self.classify(tweet)
+        return None if party is None else (period, field(tweet, 'user', 'screen_name'), party)
+
+    def add_record(self, partial, record):
+        period, screen_name, party = record
+
+        # crc32 rather than hash, which differs between processes for strings under Python 3
+        user = (period, screen_name)
+        shard = partial[zlib.crc32(u'{}:{}'.format(period, screen_name).encode('utf8')) % self.shards]
+        counts = shard.get(user)
+        if counts is None:
+            counts = shard[user] = self.counter.zero()
+        self.counter.add(counts, party)
+
+    #
+    # the votes per (period, party) of the users of one shard, from the partial counts of every task
+    #
+    def merge_shard(self, shards):
+        users = {}
+        for shard in shards:
+            for user, counts in shard.items():
+                if user in users:
+                    self.counter.merge(users[user], counts)
+                else:
+                    users[user] = counts
+
+        votes = Counter()
+        for (period, _), counts in users.items():
+            party = self.counter.winner(counts)
+            if party is not None:
+                votes[(period, party)] += 1
+        return votes
+
+    def merge(self, pool, partials):
+        votes = Counter()
+        for shard_votes in pool.map(_merge_shard, [(self, [partial[i] for partial in partials])
+                                                   for i in range(self.shards)]):
+            votes.update(shard_votes)
+        return votes
+
+
+def _merge_shard(task):
+    job, shards = task
+    return job.merge_shard(shards)
+
+
+class KeywordParty(object):
+
+    #
+    # classifier mapping a tweet to the party of which keywords occur in its text, if exactly one, with a
+    # KeywordMatcher
+    #
+    def __init__(self, matcher):
+        self.matcher = matcher
+
+    def __call__(self, tweet):
+        parties = self.matcher.match(utf8(tweet.get('text') or u''))
+        return parties.pop() if len(parties) == 1 else None
+
+
+class RetweetParty(object):
+
+    #
+    # classifier mapping a retweet to the party of the retweeted handle, with a dictionary of lower case handles
+    #
+    def __init__(self, handles):
+        self.handles = handles
+
+    def __call__(self, tweet):
+        rt_screen_name = field(tweet, 'retweeted_status', 'user', 'screen_name')
+        if rt_screen_name is None:
+            return None
+        return self.handles.get(rt_screen_name.lower())
+
+
+class TweetSample(Job):
+
+    #
+    # sample tweets per (period, party, day or None) with a Reservoir, with a classifier mapping a tweet to a party
+    # or None, stratified by day or not
+    # tweets of the excluded handles are not sampled
+    #
+    def __init__(self, classify, excluded, reservoir, stratify_day):
+        self.classify = classify
+        self.excluded = excluded
+        self.reservoir = reservoir
+        self.stratify_day = stratify_day
+
+    def zero(self):
+        return {}
+
+    def record(self, tweet, period, day):
+        party = self.classify(tweet)
+        if party is None:
+            return None
+        return (period, party, day if self.stratify_day else None), (tweet.get('id'), utf8(tweet.get('text') or u''))
+
+    def add_record(self, partial, record):
+        key, value = record
+        sample = partial.get(key)
+        if sample is None:
+            sample = partial[key] = self.reservoir.zero()
+        self.reservoir.add(sample, value)
+
+    def merge(self, pool, partials):
+        samples = {}
+        for partial in partials:
+            for key, sample in partial.items():
+                if key in samples:
+                    self.reservoir.merge(samples[key], sample)
+                else:
+                    samples[key] = sample
+        return samples
+
+
+#
+# run a job over the Dutch tweets of the files of one task, returning its partial result and the malformed count
+# with a number of shards, the partial result is instead, for every shard, the (period, id, record) of the Dutch
+# tweets whose id hashes to it, with the record of the tweet (see Job.record), for _dedupe_shard
+#
+def _run_task(task):
+    job, files, malformed, shards = task
+    partial = job.zero() if shards is None else [[] for _ in range(shards)]
+    counts = Counter()
+    for path, day, periods in files:
+        for tweet in read_tweets(path, counts, malformed):
+            if tweet.get('lang') != 'nl':
+                continue
+            for period in periods:
+                if shards is None:
+                    job.add(partial, tweet, period, day)
+                elif field(tweet, 'user', 'screen_name') not in job.excluded:
+                    # the tweets without a record are kept as well, so their duplicates are counted as Spark does
+                    tweet_id = tweet.get('id')
+                    partial[zlib.crc32(u'{}'.format(tweet_id).encode('utf8')) % shards].append(
+                        (period, tweet_id, job.record(tweet, period, day)))
+    return partial, counts['malformed']
+
+
+#
+# add the records of one shard, from every task in the order of the tasks, to a partial result, keeping only the first
+# of every (period, id) and every record without an id; returns the partial result and the number of duplicates
+#
+def _dedupe_shard(task):
+    job, shards = task
+    partial = job.zero()
+    seen = set()
+    duplicates = 0
+    for shard in shards:
+        for period, tweet_id, record in shard:
+            if tweet_id is not None:
+                if (period, tweet_id) in seen:
+                    duplicates += 1
+                    continue
+                seen.add((period, tweet_id))
+            if record is not None:
+                job.add_record(partial, record)
+    return partial, duplicates
+
+
+#
+# run a job over the tweets of the given periods in the raw archive, with a pool of processes, dropping the duplicate
+# deliveries of a tweet (exact) or not (off)
+# returns the result of the job, the number of malformed records and the number of duplicate deliveries dropped
+#
+def run(job, periods, archive=ARCHIVE, processes=None, malformed='count', tasks_per_process=4, dedupe='exact'):
+    pool = Pool(processes)
+    try:
+        files = archive_files(periods, archive)
+        tasks = divide(files, (processes or cpu_count()) * tasks_per_process)
+        shards = (processes or cpu_count()) if dedupe == 'exact' else None
+
+        partials = []
+        malformed_count = 0
+        for partial, count in pool.imap(_run_task, [(job, chunk, malformed, shards) for chunk in tasks]):
+            partials.append(partial)
+            malformed_count += count
+
+        duplicates = 0
+        if shards is not None:
+            deduped = pool.map(_dedupe_shard, [(job, [partial[i] for partial in partials]) for i in range(shards)])
+            partials = [partial for partial, _ in deduped]
+            duplicates = sum(count for _, count in deduped)
+
+        return job.merge(pool, partials), malformed_count, duplicates
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,225 @@
+from __future__ import print_function
+
+from calendar import timegm
+from datetime import datetime
+
+import pyspark.sql.functions as sqlfunc
+from pyspark.sql.types import StructType, StructField, StringType, LongType
+
+from tweet_schema import CORRUPT_RECORD, read_tweets, tweet_time
+from periods import ARCHIVE, ARCHIVE_YEAR
+
+#
+# Manifest of the raw archive: a small Parquet table with a row per archive file.
+#
+# Every row holds the path of the file relative to the archive root (MM/DD/HH/file), the day of its directory, its
+# size and modification time, its number of records, Dutch tweets and malformed records, and the first and last
+# created_at of its tweets, in seconds since the epoch. build-manifest.py builds it once with a single pass over the
+# archive, and after that only reads the files that are new or changed.
+#
+# With it the pipelines read an explicit list of files instead of listing the day directories with globs, and skip
+# the files without Dutch tweets (or malformed records, which they count) altogether. The days the manifest does not
+# have are read with globs as before. The pipelines trust the manifest, so run build-manifest.py after files are
+# added to or changed in the days it has; with --check-manifest they list those days to find the ones whose files
+# changed since, and read them with globs instead.
+#
+
+# the manifest, relative to the home directory on the cluster
+MANIFEST = "gone-with-the-polls/archive-manifest"
+
+MANIFEST_SCHEMA = StructType([
+    StructField('archive', StringType()),
+    StructField('path', StringType()),
+    StructField('day', StringType()),
+    StructField('size', LongType()),
+    StructField('modified', LongType()),
+    StructField('records', LongType()),
+    StructField('dutch', LongType()),
+    StructField('malformed', LongType()),
+    StructField('min_created_at', LongType()),
+    StructField('max_created_at', LongType()),
+])
+
+
+#
+# Hadoop file system of a path and the path itself, qualified (e.g. hdfs://namenode/data/...), so that HDFS and local
+# paths are handled alike and the same archive always has the same name in the manifest
+#
+def hadoop_path(sc, path):
+    path = sc._jvm.org.apache.hadoop.fs.Path(path)
+    filesystem = path.getFileSystem(sc._jsc.hadoopConfiguration())
+    return filesystem, filesystem.makeQualified(path)
+
+
+#
+# {path relative to the given one: (size, modification time)} of the files below a path, without the hidden files,
+# the files being written and the markers such as _SUCCESS; empty if the path does not exist
+# the listing is recursive, so it costs one call per file rather than one per directory level
+#
+def list_files(sc, path):
+    filesystem, root = hadoop_path(sc, path)
+    if not filesystem.exists(root):
+        return {}
+    prefix = root.toString()
+    files = {}
+    iterator = filesystem.listFiles(root, True)
+    while iterator.hasNext():
+        status = iterator.next()
+        name = status.getPath().toString()[len(prefix):].lstrip('/')
+        if not any(part.startswith(('.', '_')) for part in name.split('/')):
+            files[name] = (status.getLen(), status.getModificationTime())
+    return files
+
+
+#
+# the qualified name of an archive root, as the manifest knows it
+#
+def archive_name(sc, archive=ARCHIVE):
+    return hadoop_path(sc, archive)[1].toString()
+
+
+#
+# path of an archive file relative to the archive root: MM/DD/HH/file
+#
+def relative_path(path):
+    return '/'.join(path.rstrip('/').split('/')[-4:])
+
+
+#
+# day (YYYY-MM-DD) of an archive file from its relative path
+#
+def path_day(path):
+    return "{}-{}-{}".format(ARCHIVE_YEAR, *path.split('/')[:2])
+
+
+#
+# seconds since the epoch of a UTC time given as 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'
+#
+def epoch_seconds(time):
+    return timegm(datetime.strptime(time, '%Y-%m-%d %H:%M:%S' if ' ' in time else '%Y-%m-%d').timetuple())
+
+
+#
+# {relative path: (size, modification time)} of the files of the archive, of the given days only if any
+#
+def list_archive(sc, archive=ARCHIVE, days=None):
+    prefixes = [''] if days is None else ["{}/{}/".format(day[5:7], day[8:10]) for day in days]
+    files = {}
+    for prefix in prefixes:
+        for path, status in list_files(sc, archive + '/' + prefix).items():
+            # skip anything not at the depth of the archive files
+            if len((prefix + path).split('/')) == 4:
+                files[prefix + path] = status
+    return files
+
+
+#
+# the manifest as a DataFrame, None if there is none
+#
+def read_manifest(sc, sqlc, manifest=MANIFEST):
+    if not manifest:
+        return None
+    filesystem, path = hadoop_path(sc, manifest)
+    if not filesystem.exists(path):
+        return None
+    return sqlc.read.parquet(manifest)
+
+
+#
+# {relative path: (records, dutch, malformed, min created_at, max created_at)} of the given archive files, in a
+# single pass over them; files without any record have no entry
+#
+def file_stats(sqlc, archive, paths):
+    tweets = read_tweets(sqlc, ["{}/{}".format(archive, path) for path in paths], 'count')
+    path = sqlfunc.regexp_extract(sqlfunc.input_file_name(), '([^/]+/[^/]+/[^/]+/[^/]+)$', 1)
+    time = tweet_time(sqlfunc.col('created_at')).cast('long')
+    stats = tweets.groupBy(path.alias('path')).agg(
+        sqlfunc.count('*'),
+        sqlfunc.sum(sqlfunc.when(sqlfunc.col('lang') == 'nl', 1).otherwise(0)),
+        sqlfunc.sum(sqlfunc.when(sqlfunc.col(CORRUPT_RECORD).isNotNull(), 1).otherwise(0)),
+        sqlfunc.min(time),
+        sqlfunc.max(time))
+    return dict((row[0], tuple(row[1:])) for row in stats.collect())
+
+
+#
+# bring the manifest up to date with the archive, for the given days only if any
+# the files that are new or changed since the manifest was built are read, the others keep their row, as do the rows
+# of other archives; the manifest is written next to the old one and renamed into place when complete
+# returns the number of files kept, added (or changed) and removed
+#
+def update_manifest(sc, sqlc, manifest=MANIFEST, archive=ARCHIVE, days=None, rebuild=False):
+    root = archive_name(sc, archive)
+    listed = list_archive(sc, archive, days)
+
+    old = read_manifest(sc, sqlc, manifest)
+    rows, known = [], {}
+    for row in (old.collect() if old is not None else []):
+        if row.archive != root or (days is not None and row.day not in days):
+            rows.append(tuple(row))
+        elif not rebuild:
+            known[row.path] = row
+
+    changed = []
+    for path, (size, modified) in sorted(listed.items()):
+        row = known.get(path)
+        if row is not None and row.size == size and row.modified == modified:
+            rows.append(tuple(row))
+        else:
+            changed.append(path)
+
+    stats = file_stats(sqlc, root, changed) if changed else {}
+    for path in changed:
+        rows.append((root, path, path_day(path)) + listed[path] + stats.get(path, (0, 0, 0, None, None)))
+
+    filesystem, target = hadoop_path(sc, manifest)
+    _, temporary = hadoop_path(sc, "{}._updating".format(manifest))
+    filesystem.delete(temporary, True)
+    sqlc.createDataFrame(rows, MANIFEST_SCHEMA).coalesce(1).write.parquet(temporary.toString())
+    filesystem.delete(target, True)
+    if not filesystem.rename(temporary, target):
+        raise IOError("could not move {} to {}".format(temporary.toString(), target.toString()))
+
+    removed = len(set(known) - set(listed))
+    return len(known) - removed - len(set(known) & set(changed)), len(changed), removed
+
+
+#
+# the files of the manifest to read for the given days of an archive
+# returns the days the manifest has files of, and the (full path, size) of the files to read; with dutch_only, the
+# files without Dutch tweets and without malformed records are left out
+#
+def files_for_days(manifest, archive, days, dutch_only=True):
+    rows = manifest.where((manifest.archive == archive) & manifest.day.isin(list(days))) \
+        .select('path', 'day', 'size', 'dutch', 'malformed').collect()
+    rows = sorted(rows)
+    covered = set(row.day for row in rows)
+    if dutch_only:
+        rows = [row for row in rows if row.dutch or row.malformed]
+    return covered, [("{}/{}".format(archive, row.path), row.size) for row in rows]
+
+
+#
+# the days of an archive the manifest has files of, among the given days, whose files as listed now differ from those
+# of the manifest (added, removed, or with another size or modification time) since build-manifest.py last ran
+#
+def stale_days(sc, manifest, archive, days):
+    listed = list_archive(sc, archive, days)
+    rows = manifest.where((manifest.archive == archive_name(sc, archive)) & manifest.day.isin(list(days))) \
+        .select('path', 'size', 'modified').collect()
+    known = dict((row.path, (row.size, row.modified)) for row in rows)
+    changed = set(path for path in set(listed) | set(known) if listed.get(path) != known.get(path))
+    return set(path_day(path) for path in changed) & set(path_day(path) for path in known)
+
+
+#
+# the files of the manifest with tweets created in a time range of an archive, from start (included) to end (not
+# included), both seconds since the epoch, see epoch_seconds
+# returns the full paths of the files to read and their total size
+#
+def files_for_range(manifest, archive, start, end, dutch_only=True):
+    condition = (manifest.archive == archive) & (manifest.max_created_at >= start) & (manifest.min_created_at < end)
+    if dutch_only:
+        condition = condition & ((manifest.dutch > 0) | (manifest.malformed > 0))
+    rows = sorted(manifest.where(condition).select('path', 'size').collect())
+    return ["{}/{}".format(archive, row.path) for row in rows], sum(row.size for row in rows)
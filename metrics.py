@@ -0,0 +1,192 @@
+from __future__ import print_function
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from timeit import default_timer as timer
+import cProfile
+import json
+import pstats
+
+from py4j.protocol import Py4JError
+from pyspark.profiler import PStatsParam
+
+from output import write_lines
+
+#
+# Instrumentation of the pipelines: how many tweets and users every stage keeps or drops, where the time goes, and
+# optionally a profile of the Python classification function, written to a metrics JSON file next to the results.
+#
+# The stages that run in the JVM (reading, the Dutch filter, the excluded handles and the exact de-duplication) are
+# counted from the SQL metrics Spark keeps anyway, see tweet_schema.report_filters. The stages in the Python workers
+# count with accumulators, added to in the same pass as the work; a task that is retried counts twice.
+#
+
+
+class Counters(object):
+
+    #
+    # an accumulator for every name; only the accumulators are shipped to the executors with the object
+    #
+    def __init__(self, sc, names):
+        self.accumulators = OrderedDict((name, sc.accumulator(0)) for name in names)
+
+    #
+    # count on an executor
+    #
+    def add(self, name, count=1):
+        self.accumulators[name].add(count)
+
+    #
+    # the counts, on the driver, once the job has run
+    #
+    def values(self):
+        return OrderedDict((name, accumulator.value) for name, accumulator in self.accumulators.items())
+
+
+class Timings(object):
+
+    def __init__(self):
+        self.start = timer()
+        self.stages = OrderedDict()
+
+    #
+    # time the wall-clock time of a stage of the driver, as in: with timings.stage('job'): ...
+    # Spark only runs a job at an action, so the stages of the driver are setting up, the actions, and reporting
+    #
+    @contextmanager
+    def stage(self, name):
+        start = timer()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + timer() - start
+
+    def values(self):
+        values = OrderedDict((name, round(seconds, 3)) for name, seconds in self.stages.items())
+        values['total'] = round(timer() - self.start, 3)
+        return values
+
+
+#
+# the counters of the stages run in the JVM, from the (name, detail, rows in, rows out) of the plan nodes returned by
+# tweet_schema.report_filters: the rows read, and those dropped as not Dutch, as tweets of excluded handles and as
+# duplicate deliveries of a tweet (see dedupe.drop_duplicates)
+#
+def plan_counters(nodes):
+    counters = OrderedDict([('read', 0), ('not_dutch', 0), ('excluded', 0), ('duplicates', 0)])
+    for name, detail, rows_in, rows_out in nodes:
+        if name.startswith('Scan') or name.startswith('FileScan') or name.startswith('BatchScan'):
+            counters['read'] += rows_out
+        elif rows_in is None:
+            continue
+        elif name == 'Filter' and 'lang' in detail:
+            counters['not_dutch'] += rows_in - rows_out
+        elif name.endswith('Join') and detail == 'LeftAnti':
+            counters['excluded'] += rows_in - rows_out
+        elif name == 'Filter' and 'delivery' in detail:
+            counters['duplicates'] += rows_in - rows_out
+    return counters
+
+
+# quantiles of the run time of the tasks of a stage reported by spark_stages, so stragglers show
+TASK_QUANTILES = [0.5, 0.99, 1.0]
+
+
+#
+# wall-clock and executor time, input and shuffle of every Spark stage run so far, and the quantiles of the run time
+# of its tasks, from the status store of the Spark UI, empty if this Spark version does not have it
+#
+def spark_stages(sc):
+    try:
+        store = sc._jsc.sc().statusStore()
+        stages = store.stageList(None)
+    except Py4JError:
+        return []
+
+    quantiles = sc._gateway.new_array(sc._gateway.jvm.double, len(TASK_QUANTILES))
+    for i, quantile in enumerate(TASK_QUANTILES):
+        quantiles[i] = quantile
+
+    result = []
+    for i in range(stages.size()):
+        stage = stages.get(i)
+        submitted, completed = stage.submissionTime(), stage.completionTime()
+        summary = store.taskSummary(stage.stageId(), stage.attemptId(), quantiles)
+        result.append(OrderedDict([
+            ('id', stage.stageId()),
+            ('name', stage.name()),
+            ('status', stage.status().toString()),
+            ('tasks', stage.numTasks()),
+            ('seconds', (completed.get().getTime() - submitted.get().getTime()) / 1000.0
+                if submitted.isDefined() and completed.isDefined() else None),
+            ('executor_run_seconds', stage.executorRunTime() / 1000.0),
+            ('task_run_seconds', OrderedDict(
+                ('p{}'.format(int(quantile * 100)), summary.get().executorRunTime().apply(j) / 1000.0)
+                for j, quantile in enumerate(TASK_QUANTILES)) if summary.isDefined() else None),
+            ('input_records', stage.inputRecords()),
+            ('shuffle_write_bytes', stage.shuffleWriteBytes()),
+        ]))
+    return sorted(result, key=lambda stage: stage['id'])
+
+
+#
+# accumulator collecting the profile of a function on the executors, see profiled_map
+#
+def profile_accumulator(sc):
+    return sc.accumulator(None, PStatsParam)
+
+
+#
+# map an RDD with a function, profiled with cProfile when a profile accumulator is given
+# only the calls of the function itself are profiled, not the rest of the stage
+#
+def profiled_map(rdd, function, profile=None):
+    if profile is None:
+        return rdd.map(function)
+
+    def profile_partition(iterator):
+        profiler = cProfile.Profile()
+        for element in iterator:
+            yield profiler.runcall(function, element)
+        profile.add(_stats(profiler))
+
+    return rdd.mapPartitions(profile_partition, preservesPartitioning=True)
+
+
+def _stats(profiler):
+    stats = pstats.Stats(profiler)
+    # the output stream cannot be shipped to the driver
+    stats.stream = None
+    stats.strip_dirs()
+    return stats
+
+
+#
+# write the profile collected by a profile accumulator to a file, and print its most expensive functions
+#
+def write_profile(profile, filename, lines=20):
+    stats = profile.value
+    if stats is None:
+        print("no calls were profiled")
+        return
+    stats.dump_stats(filename)
+    stats.sort_stats('cumulative').print_stats(lines)
+
+
+#
+# write the metrics of a run to a JSON file
+#
+def write_metrics(filename, script, args, counters, timings, stages, plan):
+    metrics = OrderedDict([
+        ('script', script),
+        ('finished', datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')),
+        ('arguments', OrderedDict(sorted(vars(args).items()))),
+        ('counters', counters),
+        ('timings', timings),
+        ('stages', stages),
+        ('plan', [OrderedDict([('node', name), ('detail', detail), ('rows_in', rows_in), ('rows_out', rows_out)])
+                  for name, detail, rows_in, rows_out in plan]),
+    ])
+    write_lines(filename, [json.dumps(metrics, indent=2), '\n'])
+    print("metrics written to {}".format(filename))
@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+from itertools import groupby
+import os, errno
+import tempfile
+
+#
+# Writing results to files on the driver.
+#
+# Results are streamed from the executors one partition at a time with toLocalIterator, so the driver only holds one
+# partition of the results, and every file is written to a temporary file next to it and renamed into place when it
+# is complete, so a failed or interrupted job never leaves a half-written result behind.
+#
+
+
+#
+# create the folder of a file if it does not exist
+# from: https://stackoverflow.com/a/12517490
+#
+def ensure_dir(filename):
+    directory = os.path.dirname(filename)
+    if directory and not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError as exc:  # Guard against race condition
+            if exc.errno != errno.EEXIST:
+                raise
+
+
+#
+# the umask of the process, which can only be read by setting it
+#
+def current_umask():
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+#
+# open a temporary file next to filename, to be written in the with block, and rename it to filename when the block
+# ends, or remove it if the block fails: with atomic_file(filename) as f: ...
+#
+@contextmanager
+def atomic_file(filename, mode='w'):
+    ensure_dir(filename)
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(filename) or '.',
+                                             prefix='.' + os.path.basename(filename) + '.')
+    try:
+        with os.fdopen(descriptor, mode) as f:
+            yield f
+        # mkstemp makes the file private, give it the permissions open would: 0666 less the umask
+        os.chmod(temporary, 0o666 & ~current_umask())
+        # rename is atomic, os.replace also overwrites an existing file on Windows but is not in Python 2
+        getattr(os, 'replace', os.rename)(temporary, filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+#
+# write lines to a file atomically, lines can be any iterable and are written as they come, after the header if any
+#
+def write_lines(filename, lines, header=None):
+    with atomic_file(filename) as f:
+        if header is not None:
+            f.write(header)
+        for line in lines:
+            f.write(line)
+
+
+#
+# write every group of consecutive rows with the same group(row) to the file filename(group), with the lines given by
+# lines(row); the rows can be any iterable, sorted by group
+# an empty file (with only the header, if any) is written for every group in groups that has no rows
+#
+def write_sorted(rows, group, filename, lines, groups=(), header=None):
+    written = set()
+    for key, rows in groupby(rows, group):
+        write_lines(filename(key), (line for row in rows for line in lines(row)), header)
+        written.add(key)
+
+    for key in groups:
+        if key not in written:
+            write_lines(filename(key), [], header)
+
+
+#
+# stream the (key, value) rows of an RDD to the driver, sorted by key, and write them as write_sorted does
+#
+def write_groups(rdd, group, filename, lines, groups=(), header=None):
+    write_sorted(rdd.sortByKey().toLocalIterator(), group, filename, lines, groups, header)
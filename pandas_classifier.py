@@ -0,0 +1,80 @@
+import pandas as pd
+
+import pyspark.sql.functions as sqlfunc
+from pyspark.sql.types import StringType
+
+#
+# Party classification in Python, vectorized over Arrow batches with pandas UDFs.
+#
+# Spark ships the columns a UDF needs to the Python workers as Arrow record batches, which arrive as pandas Series,
+# instead of pickling every row, so there is no Row object, asDict or encode per tweet. The texts of a batch are
+# tokenized together with pandas string methods, and the words of every tweet are matched with the compiled keyword
+# matcher; retweeted handles are matched with a single vectorized lookup per batch.
+#
+# The classified DataFrames have the same (period, screen_name, party) columns as those of sql_classifier.py, so
+# their votes are counted with sql_classifier.count_votes, in the JVM.
+#
+
+# the Spark setting limiting the number of rows in an Arrow batch
+BATCH_SIZE_SETTING = 'spark.sql.execution.arrow.maxRecordsPerBatch'
+
+
+#
+# set the number of tweets in an Arrow batch: larger batches spread the cost of a call over more tweets, smaller
+# batches need less memory in the Python workers
+#
+def set_batch_size(sqlc, size):
+    sqlc.setConf(BATCH_SIZE_SETTING, str(size))
+
+
+#
+# split a batch of tweet texts in lower case words, after removing hashtags and twitter handle symbols, as
+# keyword_matcher.tokenize does for a single tweet
+#
+def tokenize_batch(texts):
+    return texts.fillna('').str.replace('[@#]', '', regex=True).str.lower().str.split()
+
+
+#
+# pandas UDF mapping the texts of a batch of tweets to the party of which keywords occur in them, or None if they
+# match no party or several, with a broadcast KeywordMatcher
+# the UDF is marked non-deterministic, so Spark never evaluates it twice by pushing a filter on its result down
+#
+def keyword_party_udf(matcher):
+    def classify(texts):
+        party = matcher.value.party
+        return pd.Series([party(words) for words in tokenize_batch(texts)], index=texts.index)
+
+    return sqlfunc.pandas_udf(classify, StringType()).asNondeterministic()
+
+
+#
+# pandas UDF mapping the retweeted screen names of a batch of tweets to the party of the handle, or None if the tweet
+# is not a retweet of a party handle, with a broadcast dictionary of lower case handles
+#
+def retweet_party_udf(handles):
+    def classify(rt_screen_names):
+        return rt_screen_names.str.lower().map(handles.value)
+
+    return sqlfunc.pandas_udf(classify, StringType()).asNondeterministic()
+
+
+#
+# classify tweets (period, text, screen_name) by keywords into (period, screen_name, party)
+# tweets that do not match exactly one party are dropped
+#
+def classify_keyword_batches(dataFrame, matcher):
+    party = keyword_party_udf(matcher)
+    return dataFrame.select('period', 'screen_name', party('text').alias('party')) \
+        .where(sqlfunc.col('party').isNotNull())
+
+
+#
+# classify tweets (period, screen_name, rt_screen_name) by retweeted handle into (period, screen_name, party)
+# tweets that are not a retweet of one of the handles are dropped
+#
+def classify_retweet_batches(dataFrame, handles):
+    party = retweet_party_udf(handles)
+    return dataFrame.where(sqlfunc.col('rt_screen_name').isNotNull()) \
+        .select('period', 'screen_name', party('rt_screen_name').alias('party')) \
+        .where(sqlfunc.col('party').isNotNull())
@@ -0,0 +1,195 @@
+import io
+
+#
+# Party definitions shared by all pipelines: the keywords and retweeted handles that identify a party,
+# and the handles whose tweets are never counted.
+#
+# The lists below can be extended with files, see load_keywords, load_handles and load_exclude_handles.
+#
+
+#
+# Dictionary mapping the keywords to the party they belong to.
+#
+KEYWORDS = {
+    "Volkspartij voor Vrijheid en Democratie": 'vvd',
+    "VVD": 'vvd',
+    "Mark Rutte": 'vvd',
+    "Rutte": 'vvd',
+    "Klaas Dijkhoff": 'vvd',
+    "markrutte": 'vvd',
+    "dijkhoff": 'vvd',
+    "Partij voor de Vrijheid": 'pvv',
+    "PVV": 'pvv',
+    "Geert Wilders": 'pvv',
+    "Wilders": 'pvv',
+    "geertwilderspvv": 'pvv',
+    "Christen-Democratish Appel": 'cda',
+    "CDA": 'cda',
+    "Sybrand van Haersma Buma": 'cda',
+    "Sybrand Buma": 'cda',
+    "Buma": 'cda',
+    "cdavandaag": 'cda',
+    "sybrandbuma": 'cda',
+    "Democraten 66": 'd66',
+    "D66": 'd66',
+    "Alexander Pechtold": 'd66',
+    "Pechtold": 'd66',
+    "d66": 'd66',
+    "APechtold": 'd66',
+    "GroenLinks": 'gl',
+    "GL": 'gl',
+    "Jesse Klaver": 'gl',
+    "Klaver": 'gl',
+    "groenlinks": 'gl',
+    "jesseklaver": 'gl',
+    "Socialistische Partij": 'sp',
+    "SP": 'sp',
+    "Emile Roemer": 'sp',
+    "Roemer": 'sp',
+    "Lilian Marijnissen": 'sp',
+    "SPnl": 'sp',
+    "emileroemer": 'sp',
+    "MarijnissenL": 'sp',
+    "Partij van de Arbeid": 'pvda',
+    "PvdA": 'pvda',
+    "Lodewijk Asscher": 'pvda',
+    "Asscher": 'pvda',
+    "LodewijkA": 'pvda',
+    "ChristenUnie": 'cu',
+    "CU": 'cu',
+    "Gert-Jan Segers": 'cu',
+    "Segers": 'cu',
+    "christenunie": 'cu',
+    "gertjansegers": 'cu',
+    "Partij voor de Dieren": 'pvdd',
+    "PvdD": 'pvdd',
+    "Marianne Thieme": 'pvdd',
+    "Thieme": 'pvdd',
+    "PartijvdDieren": 'pvdd',
+    "mariannethieme": 'pvdd',
+    "50Plus": '50p',
+    "Henk Krol": '50p',
+    "Krol": '50p',
+    "50pluspartij": '50p',
+    "HenkKrol": '50p',
+    "Staatkundig Gereformeerde Partij": 'sgp',
+    "SGP": 'sgp',
+    "Kees van der Staaij": 'sgp',
+    "Staaij": 'sgp',
+    "SGPnieuws": 'sgp',
+    "keesvdstaaij": 'sgp',
+    "Denk": 'denk',
+    "Tunahan Kuzu": 'denk',
+    "Kuzu": 'denk',
+    "DenkNL": 'denk',
+    "tunahankuzu": 'denk',
+    "Forum voor Democratie": 'fvd',
+    "FvD": 'fvd',
+    "Thierry Baudet": 'fvd',
+    "Baudet": 'fvd',
+    "fvdemocratie": 'fvd',
+    "thierrybaudet": 'fvd',
+}
+
+#
+# Dictionary mapping the mentioned handles to the party they belong to.
+#
+HANDLES = {
+    'vvd': 'vvd',
+    'markrutte': 'vvd',
+    'dijkhoff': 'vvd',
+    'geertwilderspvv': 'pvv',
+    'cdavandaag': 'cda',
+    'sybrandbuma': 'cda',
+    'd66': 'd66',
+    'apechtold': 'd66',
+    'groenlinks': 'gl',
+    'jesseklaver': 'gl',
+    'spnl': 'sp',
+    'emileroemer': 'sp',
+    'marijnissenl': 'sp',
+    'pvda': 'pvda',
+    'lodewijka': 'pvda',
+    'christenunie': 'cu',
+    'gertjansegers': 'cu',
+    'partijvddieren': 'pvdd',
+    'mariannethieme': 'pvdd',
+    '50pluspartij': '50p',
+    'henkkrol': '50p',
+    'sgpnieuws': 'sgp',
+    'keesvdstaaij': 'sgp',
+    'denknl': 'denk',
+    'tunahankuzu': 'denk',
+    'fvdemocratie': 'fvd',
+    'thierrybaudet': 'fvd',
+}
+
+#
+# List of Twitter handles (without the @) that we exclude. Includes parties own handles and major news outlets.
+#
+EXCLUDE_HANDLES = ['VVD', 'markrutte', 'dijkhoff', 'geertwilderspvv', 'cdavandaag', 'sybrandbuma', 'd66',
+                   'APechtold', 'groenlinks', 'jesseklaver', 'SPnl', 'emileroemer', 'MarijnissenL', 'PvdA',
+                   'LodewijkA', 'christenunie', 'gertjansegers', 'PartijvdDieren', 'mariannethieme',
+                   '50pluspartij', 'HenkKrol', 'SGPnieuws', 'keesvdstaaij', 'DenkNL', 'tunahankuzu',
+                   'fvdemocratie', 'thierrybaudet', 'NUnl', 'RTLnieuws', 'NPOpolitiek', 'MarioGibbels',
+                   'nieuwsuittwente', 'telegraaf', 'NOS', 'ADnl', 'FD_Nieuws', 'financieelblad', 'Metro', 'ndnl', 'nrc',
+                   'NRC_commentaar', 'refdag', 'trouw', 'volkskrant', 'BarneveldseKrnt', 'BNDeStem', 'brabantsdagblad',
+                   'delimburger', 'dvhn_nl', 'ED_Eindhoven', 'ED_Regio', 'frieschdagblad', 'DeGelderlander',
+                   'gooieneemlander', 'hdhaarlem', 'lc_nl', 'leidschdagblad', 'nhdagblad', 'parool', 'pzcredactie',
+                   'De_Stentor', 'tubantia', 'foknieuws', 'quotevanvandaag', 'CoronelKart', 'Gemeente', 'Politiek',
+                   '2eKamertweets']
+
+
+#
+# the entries of a list file: one per line, blank lines and lines starting with # are ignored
+#
+def read_entries(filename):
+    with io.open(filename, encoding='utf8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+#
+# the (name, party) pairs of a file with a name,party entry per line
+# the name is everything before the last comma, so keywords may contain commas
+#
+def read_parties(filename):
+    for entry in read_entries(filename):
+        name, _, party = entry.rpartition(',')
+        if not name.strip() or not party.strip():
+            raise ValueError("{}: expected 'name,party', got '{}'".format(filename, entry))
+        yield name.strip(), party.strip()
+
+
+#
+# the keywords, extended with those of the given files (keyword,party per line)
+#
+def load_keywords(filenames=None):
+    keywords = dict(KEYWORDS)
+    for filename in filenames or []:
+        keywords.update(read_parties(filename))
+    return keywords
+
+
+#
+# the retweeted handles in lower case, so a retweet is matched with a single lookup, extended with those of the given
+# files (handle,party per line, with or without the @)
+#
+def load_handles(filenames=None):
+    handles = dict((handle.lower(), party) for handle, party in HANDLES.items())
+    for filename in filenames or []:
+        handles.update((handle.lstrip('@').lower(), party) for handle, party in read_parties(filename))
+    return handles
+
+
+#
+# the excluded handles, extended with those of the given files (a handle per line, with or without the @)
+# handles are matched exactly, as they are written
+#
+def load_exclude_handles(filenames=None):
+    handles = set(EXCLUDE_HANDLES)
+    for filename in filenames or []:
+        handles.update(handle.lstrip('@') for handle in read_entries(filename))
+    return frozenset(handles)
@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+#
+# The periods we count votes over and the days of the raw tweet archive they cover.
+#
+# This module does not depend on Spark, so the local engine (local_engine.py) can use it as well as the Spark
+# pipelines, which import it through archive.py.
+#
+
+# root of the raw tweet archive
+ARCHIVE = "/data/doina/Twitter-Archive.org"
+
+# year of the tweets in the archive, which is not part of its paths
+ARCHIVE_YEAR = 2017
+
+#
+# Periods we count votes over, by name: (first day, last day), both included.
+# The poll periods are the two weeks before each of the polls we compare with.
+#
+PERIODS = OrderedDict([
+    ('poll-1', ('2017-01-01', '2017-01-14')),
+    ('poll-2', ('2017-01-15', '2017-01-28')),
+    ('poll-3', ('2017-02-01', '2017-02-14')),
+    ('poll-4', ('2017-02-15', '2017-02-28')),
+    ('pre-election', ('2017-03-01', '2017-03-14')),
+    ('test', ('2017-01-01', '2017-01-01')),
+])
+
+# periods processed when none are given
+DEFAULT_PERIODS = ['poll-1', 'poll-2', 'poll-3', 'poll-4', 'pre-election']
+
+
+#
+# list of days (YYYY-MM-DD) from first to last, both included
+#
+def day_range(first, last):
+    day = datetime.strptime(first, '%Y-%m-%d')
+    end = datetime.strptime(last, '%Y-%m-%d')
+    days = []
+    while day <= end:
+        days.append(day.strftime('%Y-%m-%d'))
+        day += timedelta(days=1)
+    return days
+
+
+#
+# sorted list of all days of the given periods
+#
+def period_days(periods):
+    days = set()
+    for period in periods:
+        days.update(day_range(*PERIODS[period]))
+    return sorted(days)
+
+
+#
+# path (with globs) of the raw archive files of one day
+#
+def day_path(day, archive=ARCHIVE):
+    return "{}/{}/{}/*/*".format(archive, day[5:7], day[8:10])
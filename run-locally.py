@@ -0,0 +1,145 @@
+from __future__ import print_function
+
+from multiprocessing import cpu_count
+from timeit import default_timer as timer
+import argparse
+
+from parties import load_keywords, load_handles, load_exclude_handles
+from keyword_matcher import KeywordMatcher
+from periods import ARCHIVE, PERIODS, DEFAULT_PERIODS, day_range
+from sampling import Reservoir
+from output import write_lines
+from local_engine import MALFORMED_POLICIES, DEDUPE_MODES, VoteCount, TweetSample, KeywordParty, RetweetParty, run
+
+#
+# Run the pipelines of twitter-vote-count.py, twitter-vote-count-altmethod.py and 200-tweets-per-party.py on this
+# machine, over the raw archive, with a pool of processes instead of Spark, see local_engine.py.
+# The files are written in the same format as those of the Spark pipelines, so for the same input they are the same.
+#
+
+
+#
+# the options of every pipeline
+#
+def add_common_arguments(parser, output):
+    parser.add_argument('--period', action='append', choices=list(PERIODS),
+                        help="period to process, can be given several times (default: the poll periods and the two "
+                             "weeks before the election)")
+    parser.add_argument('--output', default=output,
+                        help="file to write the results to, {period} (and {party}) are replaced by their name")
+    parser.add_argument('--archive', default=ARCHIVE, help="root of the raw tweet archive")
+    parser.add_argument('--malformed', choices=MALFORMED_POLICIES, default='count',
+                        help="count, drop or fail on records that are not valid JSON")
+    parser.add_argument('--processes', type=int, default=cpu_count(),
+                        help="number of worker processes (default: the number of cores)")
+    parser.add_argument('--exclude-file', action='append',
+                        help="file with more handles to exclude, a handle per line, can be given several times")
+    parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='exact',
+                        help="drop the duplicate deliveries of a tweet, as the Spark pipelines do (exact), or keep "
+                             "them (off)")
+
+
+#
+# write the vote counts of every period to its own file, a line per party with the number of votes they get
+#
+def write_votes(votes, periods, output):
+    for period in periods:
+        parties = sorted(party for vote_period, party in votes if vote_period == period)
+        write_lines(output.format(period=period),
+                    ["{},{}\r\n".format(party, votes[(period, party)]) for party in parties])
+
+
+#
+# write the tweets sampled for every party in every period to its own file, the samples of its days one after the
+# other, each cut to the quota of its day and filled up to size with the other tweets of all days, as
+# 200-tweets-per-party.py does
+#
+def write_samples(samples, reservoir, quota, size, output):
+    groups = {}
+    for key in sorted(samples):
+        groups.setdefault(key[:2], []).append(key)
+
+    for (period, party), keys in sorted(groups.items()):
+        write_lines(output.format(period=period, party=party),
+                    [t.replace('\n', '').replace('\r', '') + '\n'
+                     for t in reservoir.select([(quota(period, key[2]), samples[key]) for key in keys], size)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the vote pipelines on this machine, without Spark")
+    pipelines = parser.add_subparsers(dest='pipeline')
+
+    keywords_parser = pipelines.add_parser('twitter-vote-count', help="count votes per party based on keywords")
+    add_common_arguments(keywords_parser, "/home/s1895508/votes_{period}.csv")
+    keywords_parser.add_argument('--keywords-file', action='append',
+                                 help="file with more keywords, a keyword,party line per keyword, can be given "
+                                      "several times")
+
+    retweets_parser = pipelines.add_parser('twitter-vote-count-altmethod',
+                                           help="count votes per party based on retweeted party handles")
+    add_common_arguments(retweets_parser, "/home/s1220535/votes_alt_{period}.csv")
+    retweets_parser.add_argument('--handles-file', action='append',
+                                 help="file with more party handles, a handle,party line per handle, can be given "
+                                      "several times")
+
+    sample_parser = pipelines.add_parser('200-tweets-per-party', help="select 200 random tweets per party")
+    add_common_arguments(sample_parser, "/home/s1220535/gone-with-polls/200tweets/{period}/{party}.txt")
+    sample_parser.add_argument('--keywords-file', action='append',
+                               help="file with more keywords, a keyword,party line per keyword, can be given "
+                                    "several times")
+    sample_parser.add_argument('--tweets', type=int, default=200, help="number of tweets to select per party")
+    sample_parser.add_argument('--seed', type=int, default=2017,
+                               help="seed of the random selection, the same seed selects the same tweets")
+    sample_parser.add_argument('--stratify-day', action='store_true',
+                               help="divide the tweets of a party evenly over the days of the period, the part of a "
+                                    "day without enough tweets is filled with tweets of the other days")
+
+    args = parser.parse_args()
+    if args.pipeline is None:
+        parser.error("choose a pipeline")
+    args.period = args.period or DEFAULT_PERIODS
+    excluded = load_exclude_handles(args.exclude_file)
+
+    start = timer()
+    if args.pipeline == 'twitter-vote-count':
+        keywords = load_keywords(args.keywords_file)
+        job = VoteCount(KeywordParty(KeywordMatcher(keywords)), keywords.values(), excluded, args.processes)
+        votes, malformed, duplicates = run(job, args.period, args.archive, args.processes, args.malformed,
+                                           dedupe=args.dedupe)
+        write_votes(votes, args.period, args.output)
+
+    elif args.pipeline == 'twitter-vote-count-altmethod':
+        handles = load_handles(args.handles_file)
+        job = VoteCount(RetweetParty(handles), handles.values(), excluded, args.processes)
+        votes, malformed, duplicates = run(job, args.period, args.archive, args.processes, args.malformed,
+                                           dedupe=args.dedupe)
+        write_votes(votes, args.period, args.output)
+
+    else:
+        N = args.tweets
+        days = dict((period, len(day_range(*PERIODS[period]))) for period in args.period)
+
+        # number of tweets to select from a day of a period, as in 200-tweets-per-party.py
+        def quota(period, day):
+            if day is None:
+                return N
+            index = day_range(*PERIODS[period]).index(day)
+            return N // days[period] + (1 if index < N % days[period] else 0)
+
+        reservoir = Reservoir(N, args.seed)
+        job = TweetSample(KeywordParty(KeywordMatcher(load_keywords(args.keywords_file))), excluded, reservoir,
+                          args.stratify_day)
+        samples, malformed, duplicates = run(job, args.period, args.archive, args.processes, args.malformed,
+                                             dedupe=args.dedupe)
+        write_samples(samples, reservoir, quota, N, args.output)
+
+    print("done in {:.2f} s with {} processes".format(timer() - start, args.processes))
+    if args.malformed == 'count':
+        print("malformed records: {}".format(malformed))
+    if args.dedupe != 'off':
+        print("duplicate deliveries removed: {}".format(duplicates))
+
+
+# the worker processes import this file when they are not forked, so the pipeline only runs in the main process
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import hashlib
+import heapq
+import struct
+
+#
+# Bounded uniform sampling of tweets, mergeable across partitions.
+#
+# Every tweet gets a pseudo-random key, derived from a seed and the tweet id, and a sample keeps the N tweets with
+# the smallest keys in a bounded heap. The N smallest keys of a union are the N smallest of the N smallest of each
+# part, so per-partition samples merge into a uniform sample of exactly N (or all, if there are fewer) with O(N)
+# memory per key, and the same seed always gives the same sample.
+#
+
+
+#
+# pseudo-random key in [0, 1) for an identity (such as a tweet id), the same for the same seed and identity on every
+# executor
+#
+def random_key(seed, identity):
+    digest = hashlib.md5('{}:{}'.format(seed, identity).encode('utf8')).digest()
+    return struct.unpack('>Q', digest[:8])[0] / 18446744073709551616.0
+
+
+class Reservoir(object):
+
+    #
+    # a sampler keeping N values per key, values are (identity, value) pairs
+    # the sample of a key is a heap of (-random key, value), so the largest random key is at the top and is the first
+    # to be replaced by a value with a smaller random key
+    #
+    def __init__(self, size, seed):
+        self.size = size
+        self.seed = seed
+
+    #
+    # zero value of aggregateByKey: an empty sample
+    #
+    def zero(self):
+        return []
+
+    #
+    # seqFunc of aggregateByKey: offer a value to a sample
+    #
+    def add(self, sample, value):
+        return self._offer(sample, (-random_key(self.seed, value[0]), value[1]))
+
+    #
+    # combFunc of aggregateByKey: merge two samples into the first
+    #
+    def merge(self, sample1, sample2):
+        for item in sample2:
+            self._offer(sample1, item)
+        return sample1
+
+    def _offer(self, sample, item):
+        if len(sample) < self.size:
+            heapq.heappush(sample, item)
+        elif item[0] > sample[0][0]:
+            heapq.heapreplace(sample, item)
+        return sample
+
+    #
+    # the (random key, value) pairs of a sample, by ascending random key, so that samples can be merged on the driver
+    #
+    def items(self, sample):
+        return [(-key, value) for key, value in sorted(sample, reverse=True)]
+
+    #
+    # the values of a sample, by ascending random key, so that any prefix is a uniform sample as well
+    #
+    def values(self, sample):
+        return [value for _, value in self.items(sample)]
+
+    #
+    # the values selected from the samples of the strata of a group (such as the days of a period), [(quota, sample)]:
+    # the first quota values of every stratum, then, if some strata have fewer values than their quota, the other
+    # values of all strata with the smallest random keys, up to size values in all
+    #
+    def select(self, samples, size):
+        selected, rest = [], []
+        for quota, sample in samples:
+            items = self.items(sample)
+            selected.extend(value for _, value in items[:quota])
+            rest.extend(items[quota:])
+        return selected + [value for _, value in sorted(rest)[:size - len(selected)]]
@@ -0,0 +1,58 @@
+from __future__ import print_function
+
+from operator import add
+
+#
+# Skew handling for the per-user aggregation of the vote pipelines.
+#
+# The tweets of a user are combined map-side into one array of party counts per map partition (see votes.py), so a
+# reduce task receives one array per map partition for each of its users. For a handful of hyperactive accounts that
+# is still all map partitions on one task. Those heavy users are found from a sample of the classified tweets, and
+# their arrays are spread over several reduce tasks by salting their key with the map partition, then merged in a
+# second, small, aggregation of the heavy users only. The counts, and so the votes, are exactly those of the plain
+# aggregation.
+#
+
+
+#
+# the heavy keys of an RDD of (key, value) pairs, with their estimated number of pairs: the keys of which the sample
+# holds more than factor times the average number of pairs of a reduce task
+# the RDD is computed for the sample, so it should be cached when it is used again
+#
+def heavy_keys(rdd, fraction=0.01, factor=1.0, partitions=None, seed=2017):
+    partitions = partitions or rdd.getNumPartitions()
+    sample = rdd.sample(False, fraction, seed).map(lambda pair: (pair[0], 1)).reduceByKey(add).cache()
+    total = sample.values().sum()
+    threshold = factor * total / float(partitions)
+    heavy = sample.filter(lambda pair: pair[1] > threshold).collectAsMap()
+    sample.unpersist()
+    return dict((key, int(count / fraction)) for key, count in heavy.items())
+
+
+#
+# aggregateByKey of an RDD of (key, value) pairs, with the heavy keys salted with the index of their map partition
+# modulo the number of salts, so the partial aggregates of a heavy key are merged by several reduce tasks first
+#
+def salted_aggregate(rdd, heavy, salts, zero, seqFunc, combFunc):
+    if not heavy or salts < 2:
+        return rdd.aggregateByKey(zero, seqFunc, combFunc)
+    heavy = rdd.context.broadcast(frozenset(heavy))
+
+    def salt(index, iterator):
+        for key, value in iterator:
+            yield (key, index % salts if key in heavy.value else None), value
+
+    partial = rdd.mapPartitionsWithIndex(salt, preservesPartitioning=False).aggregateByKey(zero, seqFunc, combFunc)
+    plain = partial.filter(lambda pair: pair[0][1] is None).map(lambda pair: (pair[0][0], pair[1]))
+    salted = partial.filter(lambda pair: pair[0][1] is not None).map(lambda pair: (pair[0][0], pair[1])) \
+        .reduceByKey(combFunc)
+    return plain.union(salted)
+
+
+#
+# print the heaviest keys found by heavy_keys
+#
+def report_heavy(heavy, lines=5):
+    print("heavy users: {}".format(len(heavy)))
+    for key, count in sorted(heavy.items(), key=lambda pair: -pair[1])[:lines]:
+        print("  {}: ~{} tweets".format(key, count))
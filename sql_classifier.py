@@ -0,0 +1,113 @@
+import pyspark.sql.functions as sqlfunc
+
+from keyword_matcher import tokenize
+
+#
+# Party classification and vote counting expressed as DataFrame expressions, so that the whole vote count runs
+# inside the JVM and no tweet is shipped to a Python worker.
+#
+# The rules are the same as those of mapTweetToParty in twitter-vote-count.py and twitter-vote-count-altmethod.py:
+# a tweet votes for a party if it matches exactly one party, and a user votes for the party they tweet about most,
+# unless several parties are tied for most. The tweets of excluded handles are dropped before, by
+# tweet_schema.exclude_handles.
+# Votes are counted per period, tweets are tagged with their period by archive.read_periods.
+#
+
+
+#
+# column with the words of the tweet text, after removing hashtags and twitter handle symbols and converting the
+# text to lower case, as keyword_matcher.tokenize does
+#
+def words_column(text):
+    return sqlfunc.split(sqlfunc.lower(sqlfunc.regexp_replace(text, '[@#]', '')), '\\s+')
+
+
+#
+# build the (party, number of parties matched) columns for the keywords
+# single-word keywords are looked up in the word array, phrases are searched in the words joined by single spaces
+#
+def keyword_party_columns(text, keywords):
+    words = words_column(text)
+    padded = sqlfunc.concat(sqlfunc.lit(' '), sqlfunc.concat_ws(' ', words), sqlfunc.lit(' '))
+
+    # party -> list of conditions, one per keyword of that party
+    conditions = {}
+    for keyword, party in keywords.items():
+        keyword_words = tokenize(keyword)
+        if not keyword_words:
+            continue
+        if len(keyword_words) == 1:
+            condition = sqlfunc.array_contains(words, keyword_words[0])
+        else:
+            condition = padded.contains(' {} '.format(' '.join(keyword_words)))
+        conditions.setdefault(party, []).append(condition)
+
+    matched = sqlfunc.lit(0)
+    party_column = sqlfunc.lit(None).cast('string')
+    for party in sorted(conditions):
+        condition = conditions[party][0]
+        for other in conditions[party][1:]:
+            condition = condition | other
+        matched = matched + sqlfunc.when(condition, 1).otherwise(0)
+        party_column = sqlfunc.when(condition, sqlfunc.lit(party)).otherwise(party_column)
+
+    return party_column, matched
+
+
+#
+# classify tweets (period, text, screen_name) by keywords into (period, screen_name, party)
+# tweets that do not match exactly one party are dropped
+# the columns kept next to the party can be given, the streaming pipeline keeps the time of the tweet instead of its
+# period
+#
+def classify_keywords(dataFrame, keywords, columns=('period', 'screen_name')):
+    party, matched = keyword_party_columns(sqlfunc.col('text'), keywords)
+    return dataFrame \
+        .select(*(list(columns) + [party.alias('party'), matched.alias('matched')])) \
+        .where(sqlfunc.col('matched') == 1) \
+        .select(*(list(columns) + ['party']))
+
+
+#
+# classify tweets (period, screen_name, rt_screen_name) by retweeted handle into (period, screen_name, party)
+# the handle table is small, so it is broadcast to every executor and joined without a shuffle
+# tweets that are not a retweet of one of the handles are dropped
+# the columns kept next to the party can be given, as for classify_keywords
+#
+def classify_retweets(sqlc, dataFrame, handles, columns=('period', 'screen_name')):
+    table = sqlc.createDataFrame([(handle.lower(), party) for handle, party in sorted(handles.items())],
+                                 ['rt_handle', 'party'])
+    return dataFrame \
+        .where(sqlfunc.col('rt_screen_name').isNotNull()) \
+        .select(*(list(columns) + [sqlfunc.lower(sqlfunc.col('rt_screen_name')).alias('rt_handle')])) \
+        .join(sqlfunc.broadcast(table), 'rt_handle') \
+        .select(*(list(columns) + ['party']))
+
+
+#
+# count votes from classified tweets (period, screen_name, party) into (period, party, votes)
+#
+# groupBy => the number of tweets of every user about every party, per period
+# groupBy => the largest number of tweets of every user about a single party, per period
+# join => keep, for every user, only the parties with that largest number of tweets
+# where => drop the users for whom several parties are tied
+# groupBy => count the users voting for every party, per period
+#
+def count_votes(classified):
+    user = ['period', 'screen_name']
+    counts = classified.groupBy(user + ['party']).agg(sqlfunc.count('*').alias('tweets'))
+    best = counts.groupBy(user).agg(sqlfunc.max('tweets').alias('tweets'))
+    return counts.join(best, user + ['tweets']) \
+        .groupBy(user).agg(sqlfunc.count('*').alias('parties'), sqlfunc.first('party').alias('party')) \
+        .where(sqlfunc.col('parties') == 1) \
+        .groupBy('period', 'party').agg(sqlfunc.count('*').alias('votes'))
+
+
+#
+# count votes from classified tweets (period, screen_name, party) into (period, party, votes, users), with the number
+# of users tweeting about every party counted by a HyperLogLog sketch with relative standard deviation rsd, so it
+# needs no shuffle of the users
+#
+def count_votes_and_users(classified, rsd=0.02):
+    users = classified.groupBy('period', 'party').agg(sqlfunc.approx_count_distinct('screen_name', rsd).alias('users'))
+    return count_votes(classified).join(users, ['period', 'party'], 'outer').na.fill(0)
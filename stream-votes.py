@@ -0,0 +1,125 @@
+from __future__ import print_function
+
+from pyspark import SparkContext
+from pyspark.sql import SQLContext
+
+import argparse
+import os
+
+from parties import load_keywords, load_handles, load_exclude_handles
+from archive import ARCHIVE
+from tweet_schema import exclude_handles
+from sql_classifier import classify_keywords, classify_retweets
+from votes import PartyCounter
+from output import write_lines
+from streaming import seconds, stream_tweets, dutch_stream, user_window_votes, RollingVotes
+
+#
+# Rolling vote counts over tweet files as they arrive, see streaming.py. Needs Spark 3.4 or later, and pandas and
+# pyarrow on the executors.
+#
+# To try it locally, start it on an empty directory and drop archive files into it, for instance those written by
+# generate-archive.py:
+#   spark-submit stream-votes.py --archive /tmp/drop --pattern '' --output /tmp/live.csv --state /tmp/live-state.json
+#       --checkpoint /tmp/live-checkpoint --watermark '1 day'
+#   cp archive/01/01/00/00.json.bz2 /tmp/drop/
+# --once processes the files that are there and stops, the checkpoint remembers which files have been processed.
+#
+
+# command line options
+parser = argparse.ArgumentParser(description="Count Twitter votes per party over sliding windows, updated as new "
+                                             "tweet files arrive")
+parser.add_argument('--method', choices=['keywords', 'retweets'], default='keywords',
+                    help="classify tweets by keywords or by retweeted party handles")
+parser.add_argument('--archive', default=ARCHIVE, help="directory to watch for new tweet files")
+parser.add_argument('--pattern', default='*/*/*/*',
+                    help="glob of the tweet files below the directory, '' for files directly in it (default: the "
+                         "MM/DD/HH/file layout of the archive)")
+parser.add_argument('--output', default="/home/s1220535/votes_live.csv",
+                    help="file to publish the vote totals of every window to, rewritten after every trigger")
+parser.add_argument('--state', default="/home/s1220535/votes_live_state.json",
+                    help="file to save the vote totals of the windows to, with the checkpoint it allows a restart")
+parser.add_argument('--checkpoint', default="gone-with-the-polls/live-checkpoint",
+                    help="checkpoint of the query: the files processed and the per-user counts and votes")
+parser.add_argument('--window', type=seconds, default='14 days',
+                    help="length of a window, such as '14 days' or '6 hours'")
+parser.add_argument('--slide', type=seconds, default='1 day', help="time between the starts of two windows")
+parser.add_argument('--watermark', type=seconds, default='2 hours',
+                    help="how late a tweet may arrive and still be counted, the longer, the more state is kept")
+parser.add_argument('--trigger', default='1 minute', help="time between two micro-batches")
+parser.add_argument('--once', action='store_true', help="process the files that are there and stop")
+parser.add_argument('--max-files', type=int, default=100, help="maximum number of new files per micro-batch")
+parser.add_argument('--partitions', type=int, default=16,
+                    help="number of state partitions, fixed by the checkpoint once the query has run")
+parser.add_argument('--rocksdb', action='store_true',
+                    help="keep the per-user counts in RocksDB instead of executor memory (Spark 3.2 and later)")
+parser.add_argument('--malformed', choices=['drop', 'fail'], default='drop',
+                    help="drop or fail on records that are not valid JSON")
+parser.add_argument('--keywords-file', action='append',
+                    help="file with more keywords, a keyword,party line per keyword, can be given several times")
+parser.add_argument('--handles-file', action='append',
+                    help="file with more party handles, a handle,party line per handle, can be given several times")
+parser.add_argument('--exclude-file', action='append',
+                    help="file with more handles to exclude, a handle per line, can be given several times")
+args = parser.parse_args()
+
+# initialisation
+sc = SparkContext(appName="Count Twitter Votes Per Party Over Sliding Windows")
+sc.setLogLevel('ERROR')
+
+sqlc = SQLContext(sc)
+# the windows start at whole UTC days and hours, whatever the time zone of the cluster
+sqlc.setConf('spark.sql.session.timeZone', 'UTC')
+sqlc.setConf('spark.sql.shuffle.partitions', str(args.partitions))
+if args.rocksdb:
+    sqlc.setConf('spark.sql.streaming.stateStore.providerClass',
+                 'org.apache.spark.sql.execution.streaming.state.RocksDBStateStoreProvider')
+
+# ship the shared modules to the executors
+for module in ['parties.py', 'keyword_matcher.py', 'tweet_schema.py', 'votes.py', 'output.py', 'streaming.py']:
+    sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), module))
+
+# the Dutch tweets in the new files, without those of the excluded handles, dropped in the JVM by a broadcast anti join
+tweets = stream_tweets(sqlc, args.archive, args.pattern, args.max_files, args.malformed)
+tweets = dutch_stream(exclude_handles(sqlc, tweets, load_exclude_handles(args.exclude_file)))
+
+# classify the tweets in the JVM with the rules of the batch pipelines, see sql_classifier.py
+if args.method == 'keywords':
+    keywords = load_keywords(args.keywords_file)
+    classified = classify_keywords(tweets, keywords, ['time', 'screen_name'])
+    counter = PartyCounter(keywords.values())
+else:
+    handles = load_handles(args.handles_file)
+    classified = classify_retweets(sqlc, tweets, handles, ['time', 'screen_name'])
+    counter = PartyCounter(handles.values())
+
+# the tweets of every user in every window, per party, and their vote in the state store; only the changes of the
+# votes come out
+changes = user_window_votes(classified, counter, args.window, args.slide, args.watermark)
+
+# the totals of all windows, on the driver, picking up where a previous run stopped
+rolling = RollingVotes(args.window, args.watermark)
+rolling.load(args.state)
+
+
+#
+# add the changes of the votes in a micro-batch to the totals, and publish them
+#
+def publish(batch, batch_id):
+    rows = batch.select('start', 'end', 'party', 'change').toLocalIterator()
+    if not rolling.update(batch_id, (tuple(row) for row in rows)):
+        print("batch {} was already included".format(batch_id))
+        return
+
+    rolling.save(args.state)
+    write_lines(args.output, rolling.lines(), header="window_start,window_end,party,votes,state\r\n")
+    print("batch {}: {} windows, {} open".format(batch_id, len(rolling.totals),
+                                                 sum(1 for window in rolling.totals if rolling.is_open(window))))
+
+
+# append => every trigger, the changes of the votes of the users with new tweets are passed to publish
+writer = changes.writeStream.outputMode('append').foreachBatch(publish).option('checkpointLocation', args.checkpoint)
+writer = writer.trigger(once=True) if args.once else writer.trigger(processingTime=args.trigger)
+
+query = writer.start()
+query.awaitTermination()
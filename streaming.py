@@ -0,0 +1,183 @@
+from datetime import datetime
+import json
+import os
+
+import pandas as pd
+
+import pyspark.sql.functions as sqlfunc
+from pyspark.sql.streaming.state import GroupStateTimeout
+
+from tweet_schema import TWEET_SCHEMA, MALFORMED_POLICIES, dutch_tweets, tweet_time
+from output import write_lines
+
+#
+# Rolling vote counts over a stream of tweet files, with Structured Streaming.
+#
+# New files in the watched directory are read as they arrive, classified with the same rules as the batch pipelines
+# and counted per user in sliding windows of tweet time. The tweets of every user in every window are counted per
+# party in Spark's state store, next to the party the user votes for in the window, with applyInPandasWithState
+# (Spark 3.4 and later). A watermark on the tweet time bounds that state: the state of a window is dropped once no
+# tweet that is late by less than the watermark can still fall in it.
+#
+# Every trigger, Spark emits the changes of the votes: a vote taken back from a party (-1) and given to another (+1)
+# when a user's vote in a window changes. The driver only keeps the vote totals of every window, adds the changes
+# to them and publishes them. The totals are saved with the number of the last batch they include, so a batch Spark
+# replays after a restart is not counted twice.
+#
+
+# seconds in every unit of a duration
+UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800}
+
+
+#
+# number of seconds of a duration such as '2 hours' or '1 day'
+#
+def seconds(duration):
+    parts = duration.split()
+    if len(parts) != 2 or not parts[0].isdigit() or parts[1].lower().rstrip('s') not in UNITS:
+        raise ValueError("not a duration: {}".format(duration))
+    return int(parts[0]) * UNITS[parts[1].lower().rstrip('s')]
+
+
+#
+# stream of the tweets in the files that arrive in a directory, with the pinned schema and their time in a time column
+# pattern is the glob of the files below the directory, for the archive layout MM/DD/HH/file
+# records that are not valid JSON are dropped or fail the query, a stream cannot count them with an extra pass
+#
+def stream_tweets(sqlc, directory, pattern='*/*/*/*', max_files=None, malformed='drop'):
+    reader = sqlc.readStream.schema(TWEET_SCHEMA).option('mode', MALFORMED_POLICIES[malformed])
+    if max_files is not None:
+        reader = reader.option('maxFilesPerTrigger', max_files)
+    tweets = reader.json('{}/{}'.format(directory, pattern) if pattern else directory)
+    # deletion notices have no time, nor anything else of a tweet
+    return tweets.where(sqlfunc.col('created_at').isNotNull()) \
+        .withColumn('time', tweet_time(sqlfunc.col('created_at')))
+
+
+#
+# the Dutch tweets of a stream as (time, text, screen_name, rt_screen_name), what both classifications need
+#
+def dutch_stream(tweets):
+    return dutch_tweets(tweets, 'time', 'text', 'user.screen_name',
+                        sqlfunc.col('retweeted_status.user.screen_name').alias('rt_screen_name'))
+
+
+# the state of a user in a window: their tweets per party, and the party they vote for, '' if none
+VOTE_STATE = 'counts array<long>, party string'
+
+# the changes of the votes: a vote in the window from start to end (seconds since the epoch) added to (1) or taken
+# back from (-1) a party
+VOTE_CHANGES = 'start long, end long, party string, change int'
+
+
+#
+# the changes of the votes of the users in every sliding window, from the classified tweets (time, screen_name,
+# party), with the winner of a user's counts given by counter (see votes.py)
+# a window is length seconds long, one starts every slide seconds, and the state of the users of a window is dropped
+# once the watermark, watermark seconds before the latest tweet seen, has passed its end
+#
+def user_window_votes(classified, counter, length, slide, watermark):
+    window = sqlfunc.window('time', '{} seconds'.format(length), '{} seconds'.format(slide))
+    windowed = classified \
+        .withWatermark('time', '{} seconds'.format(watermark)) \
+        .select('time', window.alias('window'), 'screen_name', 'party') \
+        .select('time', sqlfunc.col('window.start').cast('long').alias('start'),
+                sqlfunc.col('window.end').cast('long').alias('end'), 'screen_name', 'party')
+
+    def update(key, batches, state):
+        start, end = int(key[0]), int(key[1])
+        if state.hasTimedOut:
+            # the window has passed the watermark, its votes are final
+            state.remove()
+            return
+
+        counts, old = counter.zero(), ''
+        if state.exists:
+            counter.merge(counts, state.get[0])
+            old = state.get[1]
+        for batch in batches:
+            for party in batch['party']:
+                counter.add(counts, party)
+        new = counter.winner(counts) or ''
+        state.update((list(counts), new))
+        state.setTimeoutTimestamp(max(end * 1000, state.getCurrentWatermarkMs() + 1))
+
+        changes = ([(start, end, old, -1)] if old else []) + ([(start, end, new, 1)] if new else [])
+        if new != old:
+            yield pd.DataFrame(changes, columns=['start', 'end', 'party', 'change'])
+
+    return windowed.groupBy('start', 'end', 'screen_name') \
+        .applyInPandasWithState(update, VOTE_CHANGES, VOTE_STATE, 'append', GroupStateTimeout.EventTimeTimeout)
+
+
+class RollingVotes(object):
+
+    #
+    # the vote totals per window, for windows of length seconds and the watermark of the stream in seconds
+    #
+    def __init__(self, length, watermark):
+        self.length = length
+        self.watermark = watermark
+        # the number of the last batch included
+        self.batch = -1
+        # (start, end) of every window => {party: votes}
+        self.totals = {}
+        self.latest = 0
+
+    #
+    # include the changes (start, end, party, change) of a batch, unless it was included before
+    # returns whether the batch was included
+    #
+    def update(self, batch, rows):
+        if batch <= self.batch:
+            return False
+
+        for start, end, party, change in rows:
+            totals = self.totals.setdefault((start, end), {})
+            totals[party] = totals.get(party, 0) + change
+            self.latest = max(self.latest, end)
+
+        self.batch = batch
+        return True
+
+    #
+    # whether a window may still change: the latest tweet is at most a window length before the latest window end, so
+    # a window that ended more than a window length and the watermark before it is past the watermark, it is final
+    #
+    def is_open(self, window):
+        return window[1] > self.latest - self.length - self.watermark
+
+    #
+    # the csv lines of the vote totals of every window, the open windows marked as such
+    #
+    def lines(self):
+        for window in sorted(self.totals):
+            start, end = [datetime.utcfromtimestamp(time).strftime('%Y-%m-%d %H:%M') for time in window]
+            state = 'open' if self.is_open(window) else 'final'
+            for party, votes in sorted(self.totals[window].items()):
+                # a party can lose all its votes when users move to another party
+                if votes:
+                    yield "{},{},{},{},{}\r\n".format(start, end, party, votes, state)
+
+    #
+    # save the state to a file, atomically
+    #
+    def save(self, filename):
+        state = {
+            'batch': self.batch,
+            'latest': self.latest,
+            'totals': [[start, end, totals] for (start, end), totals in self.totals.items()],
+        }
+        write_lines(filename, [json.dumps(state)])
+
+    #
+    # load the state saved to a file, if it exists
+    #
+    def load(self, filename):
+        if not os.path.exists(filename):
+            return
+        with open(filename) as f:
+            state = json.load(f)
+        self.batch = state['batch']
+        self.latest = state['latest']
+        self.totals = dict(((start, end), totals) for start, end, totals in state['totals'])
@@ -0,0 +1,177 @@
+from __future__ import division
+
+from bisect import bisect
+from datetime import datetime, timedelta
+import bz2
+import gzip
+import json
+import os
+import random
+
+from parties import KEYWORDS, HANDLES, EXCLUDE_HANDLES
+
+#
+# Generation of synthetic tweet archives, shaped like the raw archive (MM/DD/HH/* files of JSON lines), so the
+# pipelines can be run and measured without access to the real one.
+#
+# Every line is a tweet with the fields the pipelines read, or a deletion notice, as in the real stream. The share
+# of Dutch tweets, retweets, tweets mentioning a party and tweets mentioning several parties, and how unevenly the
+# tweets are divided over the users, are all configurable, and the same seed always generates the same archive.
+#
+
+DUTCH_WORDS = ['de', 'het', 'een', 'en', 'van', 'ik', 'je', 'dat', 'is', 'niet', 'op', 'te', 'met', 'voor', 'zijn',
+               'maar', 'ook', 'als', 'dan', 'nog', 'wel', 'debat', 'verkiezingen', 'stemmen', 'vandaag', 'morgen',
+               'lol', 'echt', 'Nederland', 'kabinet', 'partij', 'peiling', 'zorg', 'belasting', 'gemeente']
+OTHER_WORDS = ['the', 'a', 'and', 'of', 'to', 'is', 'in', 'that', 'it', 'for', 'on', 'with', 'today', 'news',
+               'election', 'vote', 'people', 'really', 'great', 'new', 'time', 'world', 'love', 'day']
+OTHER_LANGUAGES = ['en', 'en', 'en', 'de', 'fr', 'es', 'tr', 'und']
+
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# file name extension of every compression
+COMPRESSIONS = {'none': '', 'gz': '.gz', 'bz2': '.bz2'}
+
+
+#
+# created_at of a tweet as Twitter writes it, independent of the locale
+#
+def twitter_time(time):
+    return '{} {} {:02d} {:02d}:{:02d}:{:02d} +0000 {}'.format(
+        DAY_NAMES[time.weekday()], MONTH_NAMES[time.month - 1], time.day, time.hour, time.minute, time.second,
+        time.year)
+
+
+class TweetGenerator(object):
+
+    #
+    # a generator of tweets:
+    #   dutch_share => fraction of tweets in Dutch
+    #   retweet_ratio => fraction of tweets retweeting another user, half of them a party handle
+    #   keyword_hit_rate => fraction of tweets mentioning a party keyword
+    #   ambiguous_rate => fraction of the tweets mentioning a party that also mention another party
+    #   users, user_skew => number of users, and the exponent of the Zipf distribution of their tweets (0: uniform)
+    #   excluded_share => fraction of tweets sent by an excluded handle
+    #   delete_share => fraction of lines that are deletion notices rather than tweets
+    #   duplicate_share => fraction of lines that deliver one of the last `recent` tweets again, as the archive does
+    #
+    def __init__(self, seed=2017, dutch_share=0.1, retweet_ratio=0.3, keyword_hit_rate=0.2, ambiguous_rate=0.1,
+                 users=10000, user_skew=1.1, excluded_share=0.01, delete_share=0.05, duplicate_share=0.0,
+                 recent=1000):
+        self.random = random.Random(seed)
+        self.dutch_share = dutch_share
+        self.retweet_ratio = retweet_ratio
+        self.keyword_hit_rate = keyword_hit_rate
+        self.ambiguous_rate = ambiguous_rate
+        self.excluded_share = excluded_share
+        self.delete_share = delete_share
+        self.duplicate_share = duplicate_share
+        self.recent = recent
+        self.delivered = []
+
+        self.users = ['user{}'.format(i) for i in range(users)]
+        total = 0
+        self.cumulative = []
+        for rank in range(1, users + 1):
+            total += 1.0 / rank ** user_skew
+            self.cumulative.append(total)
+
+        self.keywords = {}
+        for keyword, party in sorted(KEYWORDS.items()):
+            self.keywords.setdefault(party, []).append(keyword)
+        self.parties = sorted(self.keywords)
+        self.handles = sorted(HANDLES)
+        self.excluded = sorted(EXCLUDE_HANDLES)
+        self.next_id = 815000000000000000
+
+    def _user(self):
+        if self.random.random() < self.excluded_share:
+            return self.random.choice(self.excluded)
+        return self.users[min(bisect(self.cumulative, self.random.random() * self.cumulative[-1]),
+                              len(self.users) - 1)]
+
+    def _text(self, dutch):
+        words = DUTCH_WORDS if dutch else OTHER_WORDS
+        text = [self.random.choice(words) for _ in range(max(1, int(self.random.gauss(14, 5))))]
+
+        if self.random.random() < self.keyword_hit_rate:
+            parties = [self.random.choice(self.parties)]
+            if self.random.random() < self.ambiguous_rate:
+                parties.append(self.random.choice([party for party in self.parties if party != parties[0]]))
+            for party in parties:
+                keyword = self.random.choice(self.keywords[party])
+                text.insert(self.random.randint(0, len(text)), self.random.choice(['', '', '@', '#']) + keyword)
+        return ' '.join(text)
+
+    #
+    # the next line of the archive at the given time: a tweet, a tweet delivered before, or a deletion notice
+    # without duplicates, no random number is drawn for them, so the same seed generates the same archive as before
+    #
+    def line(self, time):
+        if self.duplicate_share and self.delivered and self.random.random() < self.duplicate_share:
+            return self.random.choice(self.delivered)
+
+        self.next_id += self.random.randint(1, 1000)
+        if self.random.random() < self.delete_share:
+            return {'delete': {'status': {'id': self.next_id - 1, 'user_id': self.random.randint(1, 10 ** 9)},
+                               'timestamp_ms': str(self.next_id)}}
+
+        dutch = self.random.random() < self.dutch_share
+        screen_name = self._user()
+        tweet = {
+            'created_at': twitter_time(time),
+            'id': self.next_id,
+            'id_str': str(self.next_id),
+            'lang': 'nl' if dutch else self.random.choice(OTHER_LANGUAGES),
+            'user': {'screen_name': screen_name, 'lang': 'nl' if dutch else 'en'},
+        }
+
+        if self.random.random() < self.retweet_ratio:
+            retweeted = self.random.choice(self.handles) if self.random.random() < 0.5 else self._user()
+            text = self._text(dutch)
+            tweet['retweeted_status'] = {'id': self.next_id - 1, 'text': text, 'user': {'screen_name': retweeted}}
+            tweet['text'] = 'RT @{}: {}'.format(retweeted, text)
+        else:
+            tweet['text'] = self._text(dutch)
+
+        if self.duplicate_share:
+            self.delivered.append(tweet)
+            if len(self.delivered) > self.recent:
+                del self.delivered[0]
+        return tweet
+
+
+#
+# open an archive file for writing bytes with the given compression
+#
+def open_for_writing(path, compression):
+    if compression == 'gz':
+        return gzip.open(path, 'wb')
+    if compression == 'bz2':
+        return bz2.BZ2File(path, 'wb')
+    return open(path, 'wb')
+
+
+#
+# write an archive of the given number of tweets (lines) to root/MM/DD/HH/NN.json, divided evenly over the given
+# days (YYYY-MM-DD), the hours of every day and a number of files per hour
+# returns the number of lines written
+#
+def write_archive(root, days, tweets, generator, hours=24, files_per_hour=2, compression='bz2'):
+    files = [(day, hour, number) for day in days for hour in range(hours) for number in range(files_per_hour)]
+    written = 0
+    for i, (day, hour, number) in enumerate(files):
+        count = tweets // len(files) + (1 if i < tweets % len(files) else 0)
+        directory = os.path.join(root, day[5:7], day[8:10], '{:02d}'.format(hour))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        start = datetime.strptime(day, '%Y-%m-%d') + timedelta(hours=hour, minutes=60 * number // files_per_hour)
+        path = os.path.join(directory, '{:02d}.json{}'.format(number, COMPRESSIONS[compression]))
+        with open_for_writing(path, compression) as f:
+            for j in range(count):
+                time = start + timedelta(seconds=j * 3600 // files_per_hour // max(count, 1))
+                # json.dumps escapes every non-ASCII character, so the lines are ASCII
+                f.write((json.dumps(generator.line(time)) + '\n').encode('ascii'))
+        written += count
+    return written
@@ -0,0 +1,91 @@
+import pyspark.sql.functions as sqlfunc
+
+from tweet_schema import tweet_time
+from periods import PERIODS
+
+#
+# Vote time series: the votes per party in every time bucket (hour or day) of the days read, from a single scan.
+#
+# Every classified tweet falls in the bucket of its created_at, in UTC. A user votes in a bucket for the party they
+# tweet about most in that bucket, and cumulatively for the party they tweet about most in all buckets up to and
+# including it, in both cases unless several parties are tied. A user keeps their cumulative vote in the buckets they
+# do not tweet in, so every user only emits the buckets where their cumulative vote changes, and the cumulative
+# totals are the running sums of those changes.
+#
+# The result is a small table with a row per bucket and a column per party, for plotting against the polls.
+#
+
+# format of the label of a bucket, which sorts in time order
+BUCKET_FORMATS = {'hour': 'yyyy-MM-dd HH:00', 'day': 'yyyy-MM-dd'}
+
+
+#
+# column with the bucket of a tweet, from its created_at
+# the bucket is in the time zone of the session, which the series script sets to UTC
+#
+def time_bucket(created_at, unit):
+    return sqlfunc.date_format(tweet_time(created_at), BUCKET_FORMATS[unit])
+
+
+#
+# labels of all buckets of the given days, so the buckets without any vote have a row as well
+#
+def day_buckets(days, unit):
+    if unit == 'day':
+        return list(days)
+    return ["{} {:02d}:00".format(day, hour) for day in days for hour in range(24)]
+
+
+#
+# the votes of one user from their counts per bucket [(bucket, counts)], with the winner given by counter (see
+# votes.py): ((bucket, party), (votes, change of cumulative votes)) pairs
+#
+def user_series(counter, buckets):
+    total = counter.zero()
+    previous = None
+    for bucket, counts in sorted(buckets):
+        party = counter.winner(counts)
+        if party is not None:
+            yield (bucket, party), (1, 0)
+        cumulative = counter.winner(counter.merge(total, counts))
+        if cumulative != previous:
+            if previous is not None:
+                yield (bucket, previous), (0, -1)
+            if cumulative is not None:
+                yield (bucket, cumulative), (0, 1)
+            previous = cumulative
+
+
+#
+# the first of the given periods a bucket falls in, '' if none
+#
+def bucket_period(bucket, periods):
+    for period in periods:
+        first, last = PERIODS[period]
+        if first <= bucket[:10] <= last:
+            return period
+    return ''
+
+
+#
+# the lines of the series table from the {(bucket, party): (votes, change)} totals: the bucket, its period, the votes
+# of every party in the bucket and their cumulative votes up to the end of the bucket
+#
+def series_lines(totals, buckets, parties, periods):
+    buckets = sorted(set(buckets) | set(bucket for bucket, _ in totals))
+    cumulative = dict((party, 0) for party in parties)
+    for bucket in buckets:
+        votes = []
+        for party in parties:
+            count, change = totals.get((bucket, party), (0, 0))
+            votes.append(count)
+            cumulative[party] += change
+        yield "{},{},{},{}\r\n".format(bucket, bucket_period(bucket, periods), ','.join(str(count) for count in votes),
+                                       ','.join(str(cumulative[party]) for party in parties))
+
+
+#
+# the header of the series table
+#
+def series_header(parties):
+    return "bucket,period,{},{}\r\n".format(','.join(parties), ','.join(party + '_cumulative' for party in parties))
@@ -0,0 +1,226 @@
+from __future__ import print_function
+
+from timeit import default_timer as timer
+
+from pyspark.sql.types import StructType, StructField, StringType, LongType
+import pyspark.sql.functions as sqlfunc
+
+#
+# Pinned schema of the tweet fields used by the pipelines.
+#
+# Reading the archive with an explicit schema means Spark no longer reads the whole archive once just to infer the
+# (huge, nested) tweet schema, and the JSON parser only converts these fields into rows.
+#
+
+# name of the column in which Spark keeps the raw text of records that are not valid JSON
+CORRUPT_RECORD = '_corrupt_record'
+
+
+# the user object of a tweet, of which we only need the screen name
+def _screen_name():
+    return StructType([StructField('screen_name', StringType())])
+
+
+TWEET_SCHEMA = StructType([
+    StructField('id', LongType()),
+    StructField('created_at', StringType()),
+    StructField('lang', StringType()),
+    StructField('text', StringType()),
+    StructField('user', _screen_name()),
+    StructField('retweeted_status', StructType([StructField('user', _screen_name())])),
+])
+
+#
+# What to do with records that are not valid JSON:
+#   count => keep them in the corrupt record column, drop them from the pipelines and count them
+#   drop => drop them while parsing, without counting
+#   fail => fail the job on the first malformed record
+#
+MALFORMED_POLICIES = {
+    'count': 'PERMISSIVE',
+    'drop': 'DROPMALFORMED',
+    'fail': 'FAILFAST',
+}
+
+
+#
+# read tweets from the archive with the pinned schema
+# paths is a list of paths, which may contain globs
+#
+def read_tweets(sqlc, paths, malformed='count'):
+    schema = TWEET_SCHEMA
+    reader = sqlc.read.option('mode', MALFORMED_POLICIES[malformed])
+    if malformed == 'count':
+        schema = StructType(TWEET_SCHEMA.fields + [StructField(CORRUPT_RECORD, StringType())])
+        reader = reader.option('columnNameOfCorruptRecord', CORRUPT_RECORD)
+
+    return reader.schema(schema).json(paths)
+
+
+#
+# column with the time of a tweet, from its created_at (e.g. 'Sun Jan 01 12:00:00 +0000 2017') without the day name,
+# which Spark 3 can no longer parse
+#
+def tweet_time(created_at):
+    return sqlfunc.to_timestamp(sqlfunc.substring(created_at, 5, 26), 'MMM dd HH:mm:ss Z yyyy')
+
+
+#
+# select the given columns of the Dutch tweets
+#
+def dutch_tweets(dataFrame, *columns):
+    return dataFrame.where(dataFrame.lang == 'nl').select(*columns)
+
+
+#
+# select the given columns of the Dutch tweets, for an RDD pipeline
+# with the 'count' policy, the malformed records are let through the Dutch filter and flagged in a malformed column,
+# so malformed_rdd can count and drop them in the same pass
+#
+def dutch_tweets_flagging_malformed(dataFrame, *columns):
+    if CORRUPT_RECORD not in dataFrame.columns:
+        return dutch_tweets(dataFrame, *columns)
+
+    malformed = sqlfunc.col(CORRUPT_RECORD).isNotNull()
+    return dataFrame.where((dataFrame.lang == 'nl') | malformed).select(malformed.alias('malformed'), *columns)
+
+
+#
+# the RDD of rows of a DataFrame built by dutch_tweets_flagging_malformed, without the malformed records, which are
+# counted in the given accumulator
+#
+def malformed_rdd(dataFrame, accumulator):
+    if 'malformed' not in dataFrame.columns:
+        return dataFrame.rdd
+
+    def keep(row):
+        if row.malformed:
+            accumulator.add(1)
+            return False
+        return True
+
+    return dataFrame.rdd.filter(keep)
+
+
+#
+# drop the tweets of the excluded handles (exact screen names) with a broadcast anti join, so they are dropped in the
+# JVM before any row is shipped to a Python worker, and every executor probes a single hash table of the handles,
+# however many there are
+# rows without a screen name, such as malformed records, are kept
+#
+def exclude_handles(sqlc, dataFrame, handles):
+    if not handles:
+        return dataFrame
+    table = sqlc.createDataFrame([(handle,) for handle in sorted(handles)], ['excluded_screen_name'])
+    return dataFrame.join(sqlfunc.broadcast(table),
+                          sqlfunc.col('user.screen_name') == table.excluded_screen_name, 'left_anti')
+
+
+#
+# count the malformed records of a DataFrame read with the 'count' policy
+# this is a separate pass over the input, so the RDD pipelines use malformed_rdd instead
+#
+def count_malformed(dataFrame):
+    if CORRUPT_RECORD not in dataFrame.columns:
+        return None
+    # also reference id: Spark refuses queries on raw JSON that only reference the corrupt record column
+    return dataFrame.where(sqlfunc.col(CORRUPT_RECORD).isNotNull()).select(CORRUPT_RECORD, 'id').count()
+
+
+#
+# number of leaf fields of a schema
+#
+def count_fields(schema):
+    total = 0
+    for field in schema.fields:
+        total += count_fields(field.dataType) if isinstance(field.dataType, StructType) else 1
+    return total
+
+
+#
+# total size in bytes of the files matching the given paths (which may contain globs)
+#
+def input_bytes(sc, paths):
+    hadoop = sc._jvm.org.apache.hadoop.fs
+    configuration = sc._jsc.hadoopConfiguration()
+    total = 0
+    for path in paths:
+        path = hadoop.Path(path)
+        filesystem = path.getFileSystem(configuration)
+        for status in filesystem.globStatus(path) or []:
+            total += filesystem.getContentSummary(status.getPath()).getLength()
+    return total
+
+
+#
+# report what reading with the pinned schema saves compared to schema inference
+# with infer=True, the inference pass is actually run (and timed) for comparison, otherwise only the input size is
+# listed: schema inference would have parsed every one of those bytes before the job could start
+# the size of the input can be given when it is known, so the paths are not listed again
+#
+def report_read(sc, sqlc, paths, read_time, infer=False, size=None):
+    print("read setup with pinned schema: {:.2f} s, parsing {} fields".format(read_time, count_fields(TWEET_SCHEMA)))
+    print("schema inference pass skipped over {:.1f} MB of input".format(
+        (input_bytes(sc, paths) if size is None else size) / 1e6))
+
+    if infer:
+        start = timer()
+        inferred = sqlc.read.json(paths).schema
+        print("read setup with schema inference: {:.2f} s, parsing {} fields".format(
+            timer() - start, count_fields(inferred)))
+
+
+
+#
+# the (name, detail, rows in, rows out) of the nodes of an executed physical plan that count the rows they output,
+# children before their parents, and the number of rows the plan outputs
+# the detail is the condition of a filter and the type of a join, None for other nodes
+# the rows in are those of the first child, which is the side of a broadcast join that is streamed; nodes that do not
+# count their rows (such as projections) pass on the count of their first child
+# adaptive execution (Spark 3) wraps the plan it finally executed, and its query stages wrap their part of it
+#
+def _plan_rows(plan):
+    name = plan.nodeName()
+    if name.startswith('AdaptiveSparkPlan'):
+        return _plan_rows(plan.executedPlan())
+    if name.endswith('QueryStage'):
+        return _plan_rows(plan.plan())
+
+    nodes = []
+    rows_in = None
+    children = plan.children()
+    for i in range(children.size()):
+        child_nodes, child_rows = _plan_rows(children.apply(i))
+        nodes.extend(child_nodes)
+        if i == 0:
+            rows_in = child_rows
+
+    metric = plan.metrics().get('numOutputRows')
+    if not metric.isDefined():
+        return nodes, rows_in
+    rows_out = metric.get().value()
+
+    detail = None
+    if name == 'Filter':
+        # the conditions of the SQL classification are huge, the start tells enough
+        detail = plan.condition().toString()
+        detail = detail if len(detail) <= 100 else detail[:97] + '...'
+    elif name.endswith('Join'):
+        detail = plan.joinType().toString()
+    nodes.append((name, detail, rows_in, rows_out))
+    return nodes, rows_out
+
+
+#
+# report the number of rows every stage of a DataFrame that has been computed read or output, and the number of rows
+# dropped by its filters and joins, from the metrics Spark collected while running it, so no extra pass is needed
+# returns the (name, detail, rows in, rows out) of the stages, see _plan_rows
+#
+def report_filters(dataFrame):
+    nodes, _ = _plan_rows(dataFrame._jdf.queryExecution().executedPlan())
+    for name, detail, rows_in, rows_out in nodes:
+        if rows_in is not None and (name == 'Filter' or name.endswith('Join')):
+            print("{} ({}): {} rows, dropped {}".format(name, detail, rows_out, rows_in - rows_out))
+        else:
+            print("{}: {} rows".format(name, rows_out))
+    return nodes
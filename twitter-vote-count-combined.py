@@ -0,0 +1,227 @@
+from __future__ import print_function
+
+from pyspark import SparkContext
+from pyspark.sql import SQLContext
+
+import pyspark.sql.functions as sqlfunc
+
+import argparse
+import os
+
+from parties import load_keywords, load_handles, load_exclude_handles
+from keyword_matcher import KeywordMatcher
+from archive import ARCHIVE, STORE, MANIFEST, PERIODS, DEFAULT_PERIODS, read_periods
+from tweet_schema import MALFORMED_POLICIES, CORRUPT_RECORD, dutch_tweets_flagging_malformed, malformed_rdd, \
+    exclude_handles, report_filters
+from votes import PartyCounter
+from dedupe import DEDUPE_MODES, drop_duplicates, partition_by_id, drop_seen
+from output import write_groups
+from metrics import Counters, Timings, plan_counters, spark_stages, profile_accumulator, profiled_map, write_profile, \
+    write_metrics
+
+# command line options
+parser = argparse.ArgumentParser(description="Count Twitter votes per party based on keywords and on retweeted party "
+                                             "handles in a single job")
+parser.add_argument('--either', action='store_true',
+                    help="also count votes of the combined method: a tweet matches a party if its keywords and "
+                         "retweeted handle together match exactly one party")
+parser.add_argument('--period', action='append', choices=list(PERIODS),
+                    help="period to count votes over, can be given several times (default: the poll periods and the "
+                         "two weeks before the election)")
+parser.add_argument('--output', default="/home/s1220535/votes_combined_{period}.csv",
+                    help="file to write the votes of each period to, {period} is replaced by the period name")
+parser.add_argument('--archive', default=ARCHIVE, help="root of the raw tweet archive")
+parser.add_argument('--store', default=STORE,
+                    help="Parquet store of Dutch tweets written by ingest-dutch-tweets.py, read when it has all days")
+parser.add_argument('--manifest', default=MANIFEST,
+                    help="manifest of the raw archive written by build-manifest.py, '' to list the days with globs")
+parser.add_argument('--check-manifest', action='store_true',
+                    help="list the days the manifest has and read those whose files changed since with globs")
+parser.add_argument('--malformed', choices=sorted(MALFORMED_POLICIES), default='count',
+                    help="count, drop or fail on records that are not valid JSON")
+parser.add_argument('--compare-inference', action='store_true',
+                    help="also infer the schema of the input, to report how long that takes")
+parser.add_argument('--keywords-file', action='append',
+                    help="file with more keywords, a keyword,party line per keyword, can be given several times")
+parser.add_argument('--handles-file', action='append',
+                    help="file with more party handles, a handle,party line per handle, can be given several times")
+parser.add_argument('--exclude-file', action='append',
+                    help="file with more handles to exclude, a handle per line, can be given several times")
+parser.add_argument('--metrics', default="/home/s1220535/votes_combined_metrics.json",
+                    help="file to write the counters and timings of the run to, as JSON")
+parser.add_argument('--profile', help="file to write a cProfile profile of the classification of tweets to")
+parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='exact',
+                    help="drop the duplicate deliveries of a tweet with a shuffle of the Dutch tweets (exact), or with "
+                         "a Bloom filter of the ids seen (bloom), or keep them (off)")
+parser.add_argument('--dedupe-fpr', type=float, default=0.001,
+                    help="rate of unique tweets the Bloom filter drops as duplicates")
+parser.add_argument('--dedupe-capacity', type=int, default=100000,
+                    help="tweets per partition the Bloom filter is sized for at first, it grows beyond that")
+args = parser.parse_args()
+args.period = args.period or DEFAULT_PERIODS
+
+# wall-clock time of every stage of the run, see metrics.py
+timings = Timings()
+
+# the methods we count votes with, in the order of the columns of the output
+METHODS = ['keywords', 'retweets', 'either'] if args.either else ['keywords', 'retweets']
+
+# initialisation
+sc = SparkContext(appName="Count Twitter Votes Per Party Over Time Period With All Methods")
+sc.setLogLevel('ERROR')
+
+sqlc = SQLContext(sc)
+
+# ship the shared modules to the executors
+for module in ['parties.py', 'keyword_matcher.py', 'tweet_schema.py', 'periods.py', 'archive.py', 'approximate.py',
+               'manifest.py', 'votes.py', 'metrics.py', 'output.py', 'dedupe.py']:
+    sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), module))
+
+# the keywords, the party handles in lower case, and the handles whose tweets are dropped, all extended with those of
+# the given files
+keywords = load_keywords(args.keywords_file)
+party_handles = load_handles(args.handles_file)
+excluded = load_exclude_handles(args.exclude_file)
+
+# compile the keywords once, every executor receives a single copy
+matcher = sc.broadcast(KeywordMatcher(keywords))
+
+# the party handles are sent once to every executor, so a retweet is matched with a single lookup
+handles = sc.broadcast(party_handles)
+
+# read the tweets of all periods in a single scan, tagged with their period
+# from the Dutch tweet store if it has all their days, otherwise from the raw archive with the pinned schema, so no
+# pass over the archive is needed to infer it
+# the tweets of the excluded handles are dropped right away, in the JVM, by a broadcast anti join
+with timings.stage('read setup'):
+    dataFrame = read_periods(sc, sqlc, args.period, args.store, args.archive, args.malformed, args.compare_inference,
+                             manifest=args.manifest, check_manifest=args.check_manifest)
+    dataFrame = exclude_handles(sqlc, dataFrame, excluded)
+
+# the tweets and users every stage in the Python workers keeps or drops, and the user votes of every method that are
+# lost to ties
+counters = Counters(sc, ['classified', 'no_party', 'users'] + ['tied_users_{}'.format(method) for method in METHODS] +
+                   (['duplicates'] if args.dedupe == 'bloom' else []))
+
+# the profile of mapTweetToParties, if asked for
+profile = profile_accumulator(sc) if args.profile else None
+
+
+#
+# method mapping a tweet to the party it matches with every method, based on keywords and retweeted handles
+# see twitter-vote-count.py and twitter-vote-count-altmethod.py for the methods themselves
+#
+def mapTweetToParties(tweet):
+    tweet = tweet.asDict()
+    text = tweet['text'].encode('utf8')
+
+    # votes are counted per user per period
+    user = (tweet['period'], tweet['screen_name'])
+
+    # the parties of which a keyword occurs in the tweet
+    keyword_parties = matcher.value.match(text)
+
+    # the party of the retweeted handle, if any
+    rt_screen_name = tweet['rt_screen_name']
+    retweet_party = handles.value.get(rt_screen_name.lower()) if rt_screen_name is not None else None
+
+    # a tweet only votes with a method if it matches exactly one party with that method
+    parties = [next(iter(keyword_parties)) if len(keyword_parties) == 1 else None, retweet_party]
+    if args.either:
+        either = keyword_parties | set([retweet_party]) if retweet_party is not None else keyword_parties
+        parties.append(next(iter(either)) if len(either) == 1 else None)
+
+    if all(party is None for party in parties):
+        counters.add('no_party')
+        return user, None
+    counters.add('classified')
+    return user, parties
+
+
+# counts the tweets of every user about every party, for every method, in a fixed-size array, see votes.py
+counter = PartyCounter(list(keywords.values()) + list(party_handles.values()), len(METHODS))
+
+
+#
+# adds the votes of all methods for a party
+#
+def add_votes(votes1, votes2):
+    return [vote1 + vote2 for vote1, vote2 in zip(votes1, votes2)]
+
+
+#
+# the votes of a user: one ((period, party), votes per method) pair for every party the user votes for
+#
+def userVotes(tuple):
+    period = tuple[0][0]
+    winners = counter.winners(tuple[1])
+    counters.add('users')
+    size = len(counter.parties)
+    for i, (method, winner) in enumerate(zip(METHODS, winners)):
+        # a user who tweets about parties with this method, but about several of them equally often
+        if winner is None and any(tuple[1][i * size:(i + 1) * size]):
+            counters.add('tied_users_{}'.format(method))
+    for party in set(winners):
+        if party is not None:
+            yield (period, party), [1 if winner == party else 0 for winner in winners]
+
+
+#
+# drop the duplicate deliveries of a tweet from the Dutch tweets, or with a Bloom filter, partition them by id for
+# drop_seen, see dedupe.py
+#
+def dedupe(dutch):
+    if args.dedupe == 'exact':
+        return drop_duplicates(dutch)
+    return partition_by_id(dutch) if args.dedupe == 'bloom' else dutch
+
+
+# join => drop the tweets of the excluded handles (above)
+# where => filter so that we only have Dutch tweets remaining
+# select => select, from a tweet, only its period, id, the text and the screen names of the tweeter and the retweeted
+#           user
+# window, where => drop the duplicate deliveries of a tweet (or with a Bloom filter, mapPartitions in Python)
+# map => for every tweet that is now left, determine what party it matches with every method
+# filter => filter out all tweets that have 'None' as a party with every method
+# aggregateByKey => counts, map-side, the tweets of every user about every party with every method:
+#           ((period, user), [count per party for method 1, count per party for method 2, ...])
+# flatMap => for each user and method, get the party with largest party count, if no parties are tied, as
+#           ((period, party), [1 for the methods the user votes for the party with, 0 for the others])
+# reduceByKey => combines all user votes into a total party vote count per method per period
+columns = ['period', 'id', 'text', 'user.screen_name',
+           sqlfunc.col('retweeted_status.user.screen_name').alias('rt_screen_name')]
+malformed = sc.accumulator(0)
+dutch = dedupe(dutch_tweets_flagging_malformed(dataFrame, *columns))
+tweets = malformed_rdd(dutch, malformed)
+if args.dedupe == 'bloom':
+    tweets = drop_seen(tweets, counters, capacity=args.dedupe_capacity, fpr=args.dedupe_fpr)
+tweets = profiled_map(tweets, mapTweetToParties, profile) \
+    .filter(lambda tuple: tuple[1] is not None) \
+    .aggregateByKey(counter.zero(), counter.add_methods, counter.merge) \
+    .flatMap(userVotes) \
+    .reduceByKey(add_votes)
+
+# write the vote counts of every period to its own file, a line per party with the number of votes they get with
+# every method, side by side, below a header naming the methods
+# this runs the whole job
+with timings.stage('job'):
+    write_groups(tweets, lambda tuple: tuple[0][0], lambda period: args.output.format(period=period),
+                 lambda tuple: ["{},{}\r\n".format(tuple[0][1], ','.join(str(vote) for vote in tuple[1]))],
+                 args.period, header="party,{}\r\n".format(','.join(METHODS)))
+
+# report the rows read and dropped at every stage of the DataFrame part of the job
+plan = report_filters(dutch)
+counts = plan_counters(plan)
+
+# report the malformed records, counted during the job
+if CORRUPT_RECORD in dataFrame.columns:
+    counts['malformed'] = malformed.value
+    print("malformed records: {}".format(counts['malformed']))
+
+counts.update(counters.values())
+if args.dedupe != 'off':
+    print("duplicate deliveries removed: {}".format(counts['duplicates']))
+write_metrics(args.metrics, os.path.basename(__file__), args, counts, timings.values(), spark_stages(sc), plan)
+
+if profile is not None:
+    write_profile(profile, args.profile)
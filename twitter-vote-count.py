@@ -1,8 +1,127 @@
-from pyspark import SparkContext
+from __future__ import print_function
+
+from pyspark import SparkContext, StorageLevel
 from pyspark.sql import SQLContext
-from itertools import groupby
-from operator import itemgetter
-import os, errno
+import argparse
+import os
+import sys
+
+from parties import load_keywords, load_exclude_handles
+from keyword_matcher import KeywordMatcher
+from archive import ARCHIVE, STORE, MANIFEST, PERIODS, DEFAULT_PERIODS, day_range, period_days, read_periods
+from tweet_schema import MALFORMED_POLICIES, CORRUPT_RECORD, dutch_tweets, dutch_tweets_flagging_malformed, \
+    malformed_rdd, exclude_handles, count_malformed, report_filters
+from votes import PartyCounter, BotCutoff, PoissonBootstrap
+from output import write_sorted
+from sql_classifier import classify_keywords, count_votes, count_votes_and_users
+from metrics import Counters, Timings, plan_counters, spark_stages, profile_accumulator, profiled_map, write_profile, \
+    write_metrics
+from skew import heavy_keys, salted_aggregate, report_heavy
+from approximate import sample_condition, estimate_line, ESTIMATE_HEADER
+from dedupe import DEDUPE_MODES, drop_duplicates, partition_by_id, drop_seen
+from cache import CACHE, DATASETS, ResultCache, input_fingerprint, content_hash, cache_key
+
+# command line options
+parser = argparse.ArgumentParser(description="Count Twitter votes per party based on keywords")
+parser.add_argument('--mode', choices=['rdd', 'sql', 'pandas'], default='rdd',
+                    help="classify tweets in Python workers one at a time (rdd), with Spark SQL expressions in the JVM "
+                         "(sql), or in Python workers in Arrow batches with pandas UDFs (pandas)")
+parser.add_argument('--batch-size', type=int, default=10000,
+                    help="number of tweets in an Arrow batch in pandas mode")
+parser.add_argument('--period', action='append', choices=list(PERIODS),
+                    help="period to count votes over, can be given several times (default: the poll periods and the "
+                         "two weeks before the election)")
+parser.add_argument('--output', default="/home/s1895508/votes_{period}.csv",
+                    help="file to write the votes of each period to, {period} is replaced by the period name")
+parser.add_argument('--archive', default=ARCHIVE, help="root of the raw tweet archive")
+parser.add_argument('--store', default=STORE,
+                    help="Parquet store of Dutch tweets written by ingest-dutch-tweets.py, read when it has all days")
+parser.add_argument('--manifest', default=MANIFEST,
+                    help="manifest of the raw archive written by build-manifest.py, '' to list the days with globs")
+parser.add_argument('--check-manifest', action='store_true',
+                    help="list the days the manifest has and read those whose files changed since with globs")
+parser.add_argument('--malformed', choices=sorted(MALFORMED_POLICIES), default='count',
+                    help="count, drop or fail on records that are not valid JSON")
+parser.add_argument('--compare-inference', action='store_true',
+                    help="also infer the schema of the input, to report how long that takes")
+parser.add_argument('--keywords-file', action='append',
+                    help="file with more keywords, a keyword,party line per keyword, can be given several times")
+parser.add_argument('--exclude-file', action='append',
+                    help="file with more handles to exclude, a handle per line, can be given several times")
+parser.add_argument('--metrics', default="/home/s1895508/votes_metrics.json",
+                    help="file to write the counters and timings of the run to, as JSON")
+parser.add_argument('--profile', help="file to write a cProfile profile of the classification of tweets to, in rdd "
+                                      "mode")
+parser.add_argument('--skew', choices=['auto', 'off'], default='auto',
+                    help="in rdd mode, find the heavy users from a sample of the classified tweets and spread their "
+                         "counts over several tasks (auto), or not (off)")
+parser.add_argument('--heavy-sample', type=float, default=0.01,
+                    help="fraction of the classified tweets sampled to find the heavy users")
+parser.add_argument('--salts', type=int, default=16, help="number of tasks the counts of a heavy user are spread over")
+parser.add_argument('--max-user-tweets', type=int,
+                    help="in rdd mode, users with more tweets about the parties in a period are taken for bots and do "
+                         "not vote")
+parser.add_argument('--max-tweets-per-day', type=float,
+                    help="in rdd mode, users with more tweets about the parties per day of a period are taken for "
+                         "bots and do not vote")
+parser.add_argument('--bootstrap', type=int, default=0,
+                    help="in rdd mode, number of Poisson bootstrap replicates of the votes, to write a confidence "
+                         "interval next to every count (default: none)")
+parser.add_argument('--bootstrap-seed', type=int, default=2017,
+                    help="seed of the bootstrap weights, the same seed gives the same intervals")
+parser.add_argument('--confidence', type=float, default=0.95,
+                    help="confidence level of the bootstrap intervals and of the intervals of a preview")
+parser.add_argument('--approximate', type=float, metavar='FRACTION',
+                    help="preview: count the votes of a deterministic sample of this fraction of the input in the "
+                         "JVM, and write them extrapolated, with an interval, to --approximate-output")
+parser.add_argument('--sample-by', choices=['files', 'users'], default='files',
+                    help="sample the archive files (or the tweets of the store), which saves the reading, or the "
+                         "users, which gives unbiased votes")
+parser.add_argument('--sample-seed', type=int, default=2017, help="seed of the sample, the same seed gives the same "
+                                                                  "sample")
+parser.add_argument('--rsd', type=float, default=0.02,
+                    help="relative standard deviation of the count of distinct users of a preview")
+parser.add_argument('--approximate-output', default="/home/s1895508/votes_approx_{period}.csv",
+                    help="file to write the preview of each period to, {period} is replaced by the period name")
+parser.add_argument('--dedupe', choices=DEDUPE_MODES, default='exact',
+                    help="drop the duplicate deliveries of a tweet with a shuffle of the Dutch tweets (exact), or, in "
+                         "rdd mode, with a Bloom filter of the ids seen (bloom), or keep them (off)")
+parser.add_argument('--dedupe-fpr', type=float, default=0.001,
+                    help="rate of unique tweets the Bloom filter drops as duplicates")
+parser.add_argument('--dedupe-capacity', type=int, default=100000,
+                    help="tweets per partition the Bloom filter is sized for at first, it grows beyond that")
+parser.add_argument('--cache', default=CACHE,
+                    help="directory on the local disk to cache the votes and per-user counts in, to write them again "
+                         "without reading the tweets when the input, rules and options are the same, '' for none")
+parser.add_argument('--cache-size', type=int, default=2000, help="size of the cache in MB, the entries used least "
+                                                                 "recently are removed beyond it")
+parser.add_argument('--cache-datasets', default=DATASETS,
+                    help="directory on the cluster filesystem to keep the cached per-user counts in, which are as "
+                         "large as the data")
+parser.add_argument('--vectorized', action='store_true',
+                    help="in rdd mode, find the votes of the users of every partition at once with NumPy, over a "
+                         "user x party count matrix")
+parser.add_argument('--matrix-output',
+                    help="in rdd mode, file to write the party counts of every user of each period to, as a sparse "
+                         "matrix scipy.sparse.load_npz reads, {period} is replaced by the period name")
+args = parser.parse_args()
+args.period = args.period or DEFAULT_PERIODS
+if args.mode != 'rdd' and (args.max_user_tweets is not None or args.max_tweets_per_day is not None):
+    parser.error("the bot cutoff is only available in rdd mode")
+if args.mode != 'rdd' and args.bootstrap:
+    parser.error("the bootstrap is only available in rdd mode")
+if args.approximate is not None and not 0 < args.approximate <= 1:
+    parser.error("the fraction of a preview must be larger than 0 and at most 1")
+if args.approximate is not None and (args.bootstrap or args.max_user_tweets is not None or
+                                     args.max_tweets_per_day is not None):
+    parser.error("a preview has no bootstrap and no bot cutoff")
+if args.dedupe == 'bloom' and (args.mode != 'rdd' or args.approximate is not None):
+    parser.error("the Bloom filter de-duplication is only available in rdd mode")
+if (args.vectorized or args.matrix_output) and (args.mode != 'rdd' or args.approximate is not None):
+    parser.error("the count matrices are only available in rdd mode")
+
+# wall-clock time of every stage of the run, see metrics.py
+timings = Timings()
 
 # initialisation
 sc = SparkContext(appName="Count Twitter Votes Per Party Over Time Period")
@@ -10,199 +129,275 @@ sc.setLogLevel('ERROR')
 
 sqlc = SQLContext(sc)
 
-# real dataframe, two weeks before election
-dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/03/{0[0-9],1[0-4]}/*/*")
+# ship the shared modules to the executors
+for module in ['parties.py', 'keyword_matcher.py', 'tweet_schema.py', 'periods.py', 'archive.py', 'approximate.py',
+               'manifest.py', 'votes.py', 'skew.py', 'pandas_classifier.py', 'metrics.py', 'output.py', 'dedupe.py',
+               'cache.py', 'vote_matrix.py']:
+    sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), module))
 
-# real dataframe, poll 4 period
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/02/{1[5-9],2[0-8]}/*/*")
+# imported after the modules are shipped, NumPy is only needed for the count matrices
+if args.vectorized or args.matrix_output:
+    from vote_matrix import partition_votes, write_matrices
 
-# real dataframe, poll 3 period
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/02/{0[0-9],1[0-4]}/*/*")
+# the keywords, and the handles whose tweets are dropped, both extended with those of the given files
+keywords = load_keywords(args.keywords_file)
+excluded = load_exclude_handles(args.exclude_file)
 
-# real dataframe, poll 2 period
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/01/{1[5-9],2[0-8]}/*/*")
+# the keys of the per-user counts and of the votes in the cache: the files of the input, the rules and the options
+# that change them, see cache.py
+cache = ResultCache(args.cache, args.cache_size * 1000000, sc, args.cache_datasets) if args.cache else None
+if cache is not None:
+    with timings.stage('cache lookup'):
+        inputs = input_fingerprint(sc, sqlc, period_days(args.period), args.store, args.archive, args.manifest,
+                                   args.check_manifest)
+    users_key = cache_key('user counts', 'keywords', inputs, content_hash(keywords, excluded), args.period,
+                          args.dedupe, args.dedupe_fpr if args.dedupe == 'bloom' else None)
+    votes_key = cache_key('votes', users_key, args.max_user_tweets, args.max_tweets_per_day,
+                          [args.bootstrap, args.bootstrap_seed] if args.bootstrap else None,
+                          [args.approximate, args.sample_by, args.sample_seed, args.rsd]
+                          if args.approximate is not None else None)
 
-# real dataframe, poll 1 period
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/01/{0[0-9],1[0-4]}/*/*")
+# compile the keywords once, every executor receives a single copy
+matcher = sc.broadcast(KeywordMatcher(keywords))
 
-# test dataframe
-# dataFrame = sqlc.read.json("/data/doina/Twitter-Archive.org/01/01/*/*")
+# the tweets and users every stage in the Python workers keeps or drops
+counters = Counters(sc, ['classified', 'no_party', 'multiple_parties', 'users', 'tied_users', 'bot_users'] +
+                   (['duplicates'] if args.dedupe == 'bloom' else []))
 
-#
-# Dictionary mapping the keywords to the party they belong to.
-#
-KEYWORDS = {
-    "Volkspartij voor Vrijheid en Democratie": 'vvd',
-    "VVD": 'vvd',
-    "Mark Rutte": 'vvd',
-    "Rutte": 'vvd',
-    "Klaas Dijkhoff": 'vvd',
-    "markrutte": 'vvd',
-    "dijkhoff": 'vvd',
-    "Partij voor de Vrijheid": 'pvv',
-    "PVV": 'pvv',
-    "Geert Wilders": 'pvv',
-    "Wilders": 'pvv',
-    "geertwilderspvv": 'pvv',
-    "Christen-Democratish Appel": 'cda',
-    "CDA": 'cda',
-    "Sybrand van Haersma Buma": 'cda',
-    "Sybrand Buma": 'cda',
-    "Buma": 'cda',
-    "cdavandaag": 'cda',
-    "sybrandbuma": 'cda',
-    "Democraten 66": 'd66',
-    "D66": 'd66',
-    "Alexander Pechtold": 'd66',
-    "Pechtold": 'd66',
-    "d66": 'd66',
-    "APechtold": 'd66',
-    "GroenLinks": 'gl',
-    "GL": 'gl',
-    "Jesse Klaver": 'gl',
-    "Klaver": 'gl',
-    "groenlinks": 'gl',
-    "jesseklaver": 'gl',
-    "Socialistische Partij": 'sp',
-    "SP": 'sp',
-    "Emile Roemer": 'sp',
-    "Roemer": 'sp',
-    "Lilian Marijnissen": 'sp',
-    "SPnl": 'sp',
-    "emileroemer": 'sp',
-    "MarijnissenL": 'sp',
-    "Partij van de Arbeid": 'pvda',
-    "PvdA": 'pvda',
-    "Lodewijk Asscher": 'pvda',
-    "Asscher": 'pvda',
-    "LodewijkA": 'pvda',
-    "ChristenUnie": 'cu',
-    "CU": 'cu',
-    "Gert-Jan Segers": 'cu',
-    "Segers": 'cu',
-    "christenunie": 'cu',
-    "gertjansegers": 'cu',
-    "Partij voor de Dieren": 'pvdd',
-    "PvdD": 'pvdd',
-    "Marianne Thieme": 'pvdd',
-    "Thieme": 'pvdd',
-    "PartijvdDieren": 'pvdd',
-    "mariannethieme": 'pvdd',
-    "50Plus": '50p',
-    "Henk Krol": '50p',
-    "Krol": '50p',
-    "50pluspartij": '50p',
-    "HenkKrol": '50p',
-    "Staatkundig Gereformeerde Partij": 'sgp',
-    "SGP": 'sgp',
-    "Kees van der Staaij": 'sgp',
-    "Staaij": 'sgp',
-    "SGPnieuws": 'sgp',
-    "keesvdstaaij": 'sgp',
-    "Denk": 'denk',
-    "Tunahan Kuzu": 'denk',
-    "Kuzu": 'denk',
-    "DenkNL": 'denk',
-    "tunahankuzu": 'denk',
-    "Forum voor Democratie": 'fvd',
-    "FvD": 'fvd',
-    "Thierry Baudet": 'fvd',
-    "Baudet": 'fvd',
-    "fvdemocratie": 'fvd',
-    "thierrybaudet": 'fvd',
-}
+# the profile of mapTweetToParty, if asked for
+profile = profile_accumulator(sc) if args.profile else None
 
 #
-# List of Twitter handles (without the @) that we exclude. Includes parties own handles and major news outlets.
-#
-EXCLUDE_HANDLES = ['VVD', 'markrutte', 'dijkhoff', 'geertwilderspvv', 'cdavandaag', 'sybrandbuma', 'd66',
-                   'APechtold', 'groenlinks', 'jesseklaver', 'SPnl', 'emileroemer', 'MarijnissenL', 'PvdA',
-                   'LodewijkA', 'christenunie', 'gertjansegers', 'PartijvdDieren', 'mariannethieme',
-                   '50pluspartij', 'HenkKrol', 'SGPnieuws', 'keesvdstaaij', 'DenkNL', 'tunahankuzu',
-                   'fvdemocratie', 'thierrybaudet', 'NUnl', 'RTLnieuws', 'NPOpolitiek', 'MarioGibbels',
-                   'nieuwsuittwente', 'telegraaf', 'NOS', 'ADnl', 'FD_Nieuws', 'financieelblad', 'Metro', 'ndnl', 'nrc',
-                   'NRC_commentaar', 'refdag', 'trouw', 'volkskrant', 'BarneveldseKrnt', 'BNDeStem', 'brabantsdagblad',
-                   'delimburger', 'dvhn_nl', 'ED_Eindhoven', 'ED_Regio', 'frieschdagblad', 'DeGelderlander',
-                   'gooieneemlander', 'hdhaarlem', 'lc_nl', 'leidschdagblad', 'nhdagblad', 'parool', 'pzcredactie',
-                   'De_Stentor', 'tubantia', 'foknieuws', 'quotevanvandaag', 'CoronelKart', 'Gemeente', 'Politiek',
-                   '2eKamertweets']
-
-
-#
-# method mapping a tweet to a party based on keywords and excluded handles
+# method mapping a tweet to a party based on keywords
 # see 200-tweets-per-party.py for comments
 #
 def mapTweetToParty(tweet):
     tweet = tweet.asDict()
     text = tweet['text'].encode('utf8')
 
-    # check if we should exclude handle
-    screen_name = tweet['screen_name']
-    if screen_name in EXCLUDE_HANDLES:
-        return (screen_name, [(None, 1)])
+    # votes are counted per user per period
+    user = (tweet['period'], tweet['screen_name'])
 
     # extract party
-    words = text.replace('@', '').replace('#', '').lower().split()
-    parties = set()
-    for keyword, party in KEYWORDS.items():
-        if keyword.lower() in words:
-            parties.add(party)
+    parties = matcher.value.match(text)
 
     if len(parties) != 1:
-        return (screen_name, [(None, 1)])
+        counters.add('multiple_parties' if parties else 'no_party')
+        return user, None
+    else:
+        counters.add('classified')
+        return user, parties.pop()
+
+
+#
+# counts the tweets of every user about every party in a fixed-size array, see votes.py
+#
+counter = PartyCounter(keywords.values())
+
+
+# the users taken for bots, if a limit is given, see votes.py
+bots = BotCutoff(dict((period, len(day_range(*PERIODS[period]))) for period in args.period), args.max_user_tweets,
+                 args.max_tweets_per_day)
+
+
+# the bootstrap replicates of the votes, if asked for, see votes.py
+bootstrap = PoissonBootstrap(args.bootstrap, args.bootstrap_seed) if args.bootstrap else None
+
+
+#
+# the vote of a user: ((period, party), 1), where the party is None if several parties are tied or the user is taken
+# for a bot
+# with the bootstrap, the vote is an array: 1 followed by the weight of the user in every replicate
+#
+def userVote(tuple):
+    counters.add('users')
+    if bots.is_bot(tuple[0][0], tuple[1]):
+        counters.add('bot_users')
+        return (tuple[0][0], None), 1
+    party = counter.winner(tuple[1])
+    if party is None:
+        counters.add('tied_users')
+    elif bootstrap is not None:
+        return (tuple[0][0], party), bootstrap.votes(u'{}\x00{}'.format(*tuple[0]))
+    return (tuple[0][0], party), 1
+
+
+#
+# the line of a party in the output: its votes, and the bootstrap interval if any
+# in a preview, its extrapolated votes and users with their intervals, see approximate.py
+#
+def voteLines(tuple):
+    if args.approximate is not None:
+        return [estimate_line(tuple[0][1], tuple[1][0], tuple[1][1], args.approximate, args.confidence, args.rsd)]
+    if bootstrap is None:
+        return ["{},{}\r\n".format(tuple[0][1], tuple[1])]
+    low, high = bootstrap.interval(tuple[1], args.confidence)
+    return ["{},{},{},{}\r\n".format(tuple[0][1], tuple[1][0], low, high)]
+
+
+#
+# write the vote counts of every period to its own file, a line per party with the number of votes they get, and with
+# the bootstrap the bounds of their interval, below a header; a preview goes to its own files
+# the rows are ((period, party), votes), sorted
+#
+def write_votes(rows):
+    if args.approximate is not None:
+        write_sorted(rows, lambda tuple: tuple[0][0], lambda period: args.approximate_output.format(period=period),
+                     voteLines, args.period, header=ESTIMATE_HEADER)
+    else:
+        write_sorted(rows, lambda tuple: tuple[0][0], lambda period: args.output.format(period=period), voteLines,
+                     args.period, header="party,votes,low,high\r\n" if bootstrap is not None else None)
+
+
+# a run with the same input, rules and options has counted these votes before: write them without reading any tweet
+# the count matrices need the per-user counts, so they are not written from the cached votes
+if cache is not None and votes_key in cache and not args.matrix_output:
+    print("votes from the cache at {}".format(args.cache))
+    write_votes(cache.get(votes_key))
+    write_metrics(args.metrics, os.path.basename(__file__), args, {'cached': 'votes'}, timings.values(),
+                  spark_stages(sc), [])
+    sys.exit(0)
+
+
+#
+# the votes per party per period from the per-user counts ((period, user), [count per party]), a user at a time with
+# userVote, or all users of a partition at once over a count matrix, see vote_matrix.py
+#
+def countVotes(users):
+    if args.vectorized:
+        votes = users.mapPartitions(lambda rows: partition_votes(rows, counter, bots, counters, bootstrap))
     else:
-        return (screen_name, [(parties.pop(), 1)])
+        votes = users.map(userVote).filter(lambda tuple: tuple[0][1] is not None)
+    return votes.reduceByKey(bootstrap.merge if bootstrap is not None else lambda a, b: a + b)
 
 
 #
-# below are the helper functions we need for reduce
+# drop the duplicate deliveries of a tweet from the Dutch tweets, or with a Bloom filter, partition them by id for
+# drop_seen, see dedupe.py
 #
+def dedupe(dutch):
+    if args.dedupe == 'exact':
+        return drop_duplicates(dutch)
+    return partition_by_id(dutch) if args.dedupe == 'bloom' else dutch
 
-# this is the reduceParty function
-# it merges two parties with the same name into one and combine party mention count
-def reduceParty(party1, party2):
-    return (party1[0], party1[1] + party2[1])
 
+# read the tweets of all periods in a single scan, tagged with their period
+# from the Dutch tweet store if it has all their days, otherwise from the raw archive with the pinned schema, so no
+# pass over the archive is needed to infer it
+# the tweets of the excluded handles are dropped right away, in the JVM, by a broadcast anti join
+with timings.stage('read setup'):
+    dataFrame = read_periods(sc, sqlc, args.period, args.store, args.archive, args.malformed, args.compare_inference,
+                             manifest=args.manifest, check_manifest=args.check_manifest,
+                             sample=args.approximate if args.sample_by == 'files' else None, seed=args.sample_seed)
+    dataFrame = exclude_handles(sqlc, dataFrame, excluded)
+    if args.approximate is not None and args.sample_by == 'users':
+        dataFrame = dataFrame.where(sample_condition('user.screen_name', args.approximate, args.sample_seed))
 
+# join => drop the tweets of the excluded handles (above)
 # where => filter so that we only have Dutch tweets remaining
-# select => select, from a tweet, only the text and the screen name of the tweeter
+# select => select, from a tweet, only its period, id, the text and the screen name of the tweeter
+# window, where => drop the duplicate deliveries of a tweet (or with a Bloom filter, mapPartitions in Python)
 # map => for every tweet that is now left, determine what party it matches
 # filter => filter out all tweets that have 'None' as a party (ie. no match, or multiple matches)
-# reduceByKey => combines all tweet-party combination to a tuple (user, [list of parties they tweet about])
-# map => group party count in each user by party and sort by party count.
-#           it transforms (screen_name, [(party1, 1), (party2, 1), (party2, 1)])
-#           to (screen_name, [(party2, 2), (party1, 1)])
-# filter => filter the user that only have 1 party count or doesn't have multiple largest party count
-# map => for each user, get the party with largest party count
-# reduceByKey => combines all user votes into a total party vote count
-tweets = dataFrame.where(dataFrame.lang == 'nl').select('text', 'user.screen_name').rdd \
-    .map(mapTweetToParty) \
-    .filter(lambda tuple: tuple[1][0][0] is not None) \
-    .reduceByKey(lambda a, b: a + b) \
-    .map(lambda tuple: (tuple[0], sorted(
-    [reduce(reduceParty, parties) for _, parties in groupby(sorted(tuple[1], key=itemgetter(0)), key=itemgetter(0))], key=itemgetter(1), reverse=True))) \
-    .filter(lambda tuple: len(tuple[1]) == 1 or tuple[1][0][1] != tuple[1][1][1]) \
-    .map(lambda tuple: (tuple[1][0][0], 1)) \
-    .reduceByKey(lambda a, b: a + b)
-
-# write vote counts to this file
-filename = "/home/s1895508/votes.csv"
-
-# check if folder exists
-# from: https://stackoverflow.com/a/12517490
-if not os.path.exists(os.path.dirname(filename)):
-    try:
-        os.makedirs(os.path.dirname(filename))
-    except OSError as exc:  # Guard against race condition
-        if exc.errno != errno.EEXIST:
-            raise
-
-# open votes file
-f = open(filename, 'w+')
-
-# for each party
-for party, vote in tweets.collect():
-    # write the number of votes they get to file
-    f.writelines("{},{}\r\n".format(party, vote))
-
-f.close()
+# aggregateByKey => counts, map-side, the tweets of every user about every party: ((period, user), [count per party])
+#           the counts of heavy users, found from a sample, are merged by several tasks first, see skew.py
+# map => for each user, get the period and the party with largest party count, or None if several parties are tied
+#           or the user is taken for a bot
+# filter => filter out the users for whom several parties are tied, and the bots
+#           with --vectorized, mapPartitions does both for all users of a partition at once, see vote_matrix.py
+# reduceByKey => combines all user votes into a total party vote count per period, and with the bootstrap the total
+#           of every replicate
+malformed = sc.accumulator(0)
+heavy = {}
+users = None
+computed_users = None
+classified = None
+
+if args.approximate is not None:
+    # a preview: the votes of the sample and its users per party, counted in the JVM, see approximate.py
+    dutch = dedupe(dutch_tweets(dataFrame, 'period', 'id', 'text', 'user.screen_name'))
+    executed = count_votes_and_users(classify_keywords(dutch, keywords), args.rsd)
+    tweets = executed.rdd.map(lambda row: ((row.period, row.party), (row.votes, row.users)))
+elif args.mode == 'sql':
+    # same steps as below, see sql_classifier.py
+    dutch = dedupe(dutch_tweets(dataFrame, 'period', 'id', 'text', 'user.screen_name'))
+    executed = count_votes(classify_keywords(dutch, keywords))
+    tweets = executed.rdd.map(lambda row: ((row.period, row.party), row.votes))
+elif args.mode == 'pandas':
+    # same steps as below, with the tweets classified in Arrow batches, see pandas_classifier.py
+    from pandas_classifier import set_batch_size, classify_keyword_batches
+    set_batch_size(sqlc, args.batch_size)
+    dutch = dedupe(dutch_tweets(dataFrame, 'period', 'id', 'text', 'user.screen_name'))
+    executed = count_votes(classify_keyword_batches(dutch, matcher))
+    tweets = executed.rdd.map(lambda row: ((row.period, row.party), row.votes))
+elif cache is not None and cache.has_rdd(users_key):
+    # a run with the same input and rules has counted the tweets of every user before, only the votes are counted
+    print("per-user counts from the cache at {}".format(args.cache))
+    executed = None
+    users = cache.get_rdd(users_key)
+    tweets = countVotes(users)
+else:
+    executed = dedupe(dutch_tweets_flagging_malformed(dataFrame, 'period', 'id', 'text', 'user.screen_name'))
+    tweets = malformed_rdd(executed, malformed)
+    if args.dedupe == 'bloom':
+        tweets = drop_seen(tweets, counters, capacity=args.dedupe_capacity, fpr=args.dedupe_fpr)
+    tweets = profiled_map(tweets, mapTweetToParty, profile).filter(lambda tuple: tuple[1] is not None)
+
+    # the classified tweets are cached by the sample that finds the heavy users, so they are only classified once
+    if args.skew == 'auto':
+        with timings.stage('heavy users'):
+            classified = tweets = tweets.persist(StorageLevel.MEMORY_AND_DISK)
+            heavy = heavy_keys(tweets, args.heavy_sample)
+        report_heavy(heavy)
+
+    users = salted_aggregate(tweets, heavy, args.salts, counter.zero(), counter.add, counter.merge)
+
+    # the per-user counts are kept by the job, to be stored in the cache or written as count matrices after it
+    if cache is not None or args.matrix_output:
+        computed_users = users = users.persist(StorageLevel.MEMORY_AND_DISK)
+    tweets = countVotes(users)
+
+# write the vote counts, see write_votes, and store them in the cache as they are written
+# this runs the whole job
+with timings.stage('job'):
+    rows = tweets.sortByKey().toLocalIterator()
+    write_votes(cache.store(votes_key, rows) if cache is not None else rows)
+
+# the classified tweets are counted per user by the job, and the per-user counts kept after it if they are needed
+if classified is not None:
+    classified.unpersist()
+
+# write the count matrix of the users of every period, see vote_matrix.py
+if args.matrix_output:
+    with timings.stage('matrix output'):
+        write_matrices(users.sortByKey().toLocalIterator(), counter.parties,
+                       lambda period: args.matrix_output.format(period=period))
+
+# store the per-user counts in the cache, for a run that only changes the options of the votes
+if computed_users is not None:
+    if cache is not None:
+        with timings.stage('cache store'):
+            cache.put_rdd(users_key, computed_users)
+    computed_users.unpersist()
+
+# report the rows read and dropped at every stage of the DataFrame part of the job, if it ran
+plan = report_filters(executed) if executed is not None else []
+counts = plan_counters(plan)
+
+# report the malformed records, counted during the job in rdd mode, or with an extra pass over the input otherwise
+if CORRUPT_RECORD in dataFrame.columns and executed is not None:
+    with timings.stage('malformed count'):
+        counts['malformed'] = malformed.value if args.mode == 'rdd' and args.approximate is None \
+            else count_malformed(dataFrame)
+    print("malformed records: {}".format(counts['malformed']))
+
+# the counters of the Python stages only count in rdd mode, the other modes classify in the JVM or in Arrow batches
+if args.mode == 'rdd' and args.approximate is None:
+    counts.update(counters.values())
+    counts['heavy_users'] = len(heavy)
+if args.dedupe != 'off' and executed is not None:
+    print("duplicate deliveries removed: {}".format(counts['duplicates']))
+write_metrics(args.metrics, os.path.basename(__file__), args, counts, timings.values(), spark_stages(sc), plan)
+
+if profile is not None:
+    write_profile(profile, args.profile)
@@ -0,0 +1,144 @@
+from __future__ import print_function
+
+from pyspark import SparkContext
+from pyspark.sql import SQLContext
+import pyspark.sql.functions as sqlfunc
+
+import argparse
+import os
+
+from parties import load_keywords, load_handles, load_exclude_handles
+from archive import ARCHIVE, STORE, MANIFEST, PERIODS, DEFAULT_PERIODS, period_days, read_days, parse_time_range, \
+    range_days
+from tweet_schema import MALFORMED_POLICIES, CORRUPT_RECORD, dutch_tweets, exclude_handles, count_malformed, \
+    report_filters
+from sql_classifier import classify_keywords, classify_retweets
+from votes import PartyCounter
+from output import write_lines
+from metrics import Timings, plan_counters, spark_stages, write_metrics
+from dedupe import drop_duplicates
+from timeseries import BUCKET_FORMATS, time_bucket, day_buckets, user_series, series_lines, series_header
+
+# command line options
+parser = argparse.ArgumentParser(description="Count Twitter votes per party in every hour or day of the periods, "
+                                             "and cumulatively, in a single job")
+parser.add_argument('--method', choices=['keywords', 'retweets'], default='keywords',
+                    help="classify tweets by keywords or by retweeted party handles")
+parser.add_argument('--bucket', choices=sorted(BUCKET_FORMATS), default='day',
+                    help="count the votes per hour or per day, in UTC")
+parser.add_argument('--period', action='append', choices=list(PERIODS),
+                    help="period whose days are read, can be given several times (default: the poll periods and the "
+                         "two weeks before the election)")
+parser.add_argument('--from', dest='start',
+                    help="instead of the days of the periods, count the tweets from this UTC time (YYYY-MM-DD[ "
+                         "HH:MM:SS]), reading only the files the manifest has tweets of the time range in")
+parser.add_argument('--to', dest='end', help="... up to this UTC time, not included")
+parser.add_argument('--output', default="/home/s1895508/votes_series_{bucket}.csv",
+                    help="file to write the series to, {bucket} is replaced by hour or day")
+parser.add_argument('--archive', default=ARCHIVE, help="root of the raw tweet archive")
+parser.add_argument('--store', default=STORE,
+                    help="Parquet store of Dutch tweets written by ingest-dutch-tweets.py, read when it has all days")
+parser.add_argument('--manifest', default=MANIFEST,
+                    help="manifest of the raw archive written by build-manifest.py, '' to list the days with globs")
+parser.add_argument('--check-manifest', action='store_true',
+                    help="list the days the manifest has and read those whose files changed since with globs")
+parser.add_argument('--malformed', choices=sorted(MALFORMED_POLICIES), default='count',
+                    help="count, drop or fail on records that are not valid JSON")
+parser.add_argument('--keywords-file', action='append',
+                    help="file with more keywords, a keyword,party line per keyword, can be given several times")
+parser.add_argument('--handles-file', action='append',
+                    help="file with more party handles, a handle,party line per handle, can be given several times")
+parser.add_argument('--exclude-file', action='append',
+                    help="file with more handles to exclude, a handle per line, can be given several times")
+parser.add_argument('--metrics', default="/home/s1895508/votes_series_metrics.json",
+                    help="file to write the counters and timings of the run to, as JSON")
+parser.add_argument('--dedupe', choices=['exact', 'off'], default='exact',
+                    help="drop the duplicate deliveries of a tweet with a shuffle of the Dutch tweets (exact), or keep "
+                         "them (off)")
+args = parser.parse_args()
+args.period = args.period or DEFAULT_PERIODS
+if bool(args.start) != bool(args.end):
+    parser.error("give both --from and --to")
+
+# wall-clock time of every stage of the run, see metrics.py
+timings = Timings()
+
+# initialisation
+sc = SparkContext(appName="Count Twitter Votes Per Party Over Time")
+sc.setLogLevel('ERROR')
+
+sqlc = SQLContext(sc)
+# the buckets are whole UTC hours and days, whatever the time zone of the cluster
+sqlc.setConf('spark.sql.session.timeZone', 'UTC')
+
+# ship the shared modules to the executors
+for module in ['parties.py', 'keyword_matcher.py', 'tweet_schema.py', 'periods.py', 'votes.py', 'output.py',
+               'timeseries.py', 'dedupe.py']:
+    sc.addPyFile(os.path.join(os.path.dirname(os.path.abspath(__file__)), module))
+
+# the handles whose tweets are dropped, extended with those of the given files
+excluded = load_exclude_handles(args.exclude_file)
+
+# read the tweets of all days of the periods, or of the time range, in a single scan; a series runs over days, so
+# they are not tagged with their period, which only labels the buckets
+# the tweets of the excluded handles are dropped right away, in the JVM, by a broadcast anti join
+time_range = parse_time_range(args.start, args.end) if args.start else None
+days = range_days(time_range) if time_range is not None else period_days(args.period)
+with timings.stage('read setup'):
+    dataFrame = read_days(sc, sqlc, days, args.store, args.archive, args.malformed, manifest=args.manifest,
+                          time_range=time_range, check_manifest=args.check_manifest)
+    dataFrame = exclude_handles(sqlc, dataFrame, excluded)
+
+# where => filter so that we only have Dutch tweets remaining
+# select => select, from a tweet, only its bucket, id, the screen name of the tweeter and what the method needs
+# window, where => drop the duplicate deliveries of a tweet, see dedupe.py
+# classify => the party of every tweet, in the JVM with the rules of the vote pipelines, see sql_classifier.py
+# a tweet is in a single bucket, so its id alone tells its deliveries apart
+dutch = dutch_tweets(dataFrame, time_bucket(sqlfunc.col('created_at'), args.bucket).alias('bucket'), 'id', 'text',
+                     'user.screen_name', sqlfunc.col('retweeted_status.user.screen_name').alias('rt_screen_name'))
+if args.dedupe == 'exact':
+    dutch = drop_duplicates(dutch, keys=())
+if args.method == 'keywords':
+    keywords = load_keywords(args.keywords_file)
+    executed = classify_keywords(dutch, keywords, ['bucket', 'screen_name'])
+    counter = PartyCounter(keywords.values())
+else:
+    handles = load_handles(args.handles_file)
+    executed = classify_retweets(sqlc, dutch, handles, ['bucket', 'screen_name'])
+    counter = PartyCounter(handles.values())
+
+# aggregateByKey => counts, map-side, the tweets of every user about every party in every bucket:
+#           ((user, bucket), [count per party])
+# map, groupByKey => the counts of every user in all their buckets: (user, [(bucket, [count per party]), ...])
+# flatMap => the vote of the user in every bucket, and the changes of their cumulative vote, see timeseries.py
+# reduceByKey => combines all of them into the votes and the change of the cumulative votes per party per bucket
+tweets = executed.rdd.map(lambda row: ((row.screen_name, row.bucket), row.party)) \
+    .aggregateByKey(counter.zero(), counter.add, counter.merge) \
+    .map(lambda tuple: (tuple[0][0], (tuple[0][1], tuple[1]))) \
+    .groupByKey() \
+    .flatMap(lambda tuple: user_series(counter, tuple[1])) \
+    .reduceByKey(lambda a, b: (a[0] + b[0], a[1] + b[1]))
+
+# a party per bucket at most, so the totals are small enough for the driver, which adds up the cumulative votes and
+# writes a row per bucket, with a column per party
+# this runs the whole job
+with timings.stage('job'):
+    totals = tweets.collectAsMap()
+write_lines(args.output.format(bucket=args.bucket),
+            series_lines(totals, day_buckets(days, args.bucket), counter.parties, args.period),
+            header=series_header(counter.parties))
+
+# report the rows read and dropped at every stage of the DataFrame part of the job
+plan = report_filters(executed)
+counts = plan_counters(plan)
+counts['buckets'] = len(set(bucket for bucket, _ in totals))
+if args.dedupe != 'off':
+    print("duplicate deliveries removed: {}".format(counts['duplicates']))
+
+# report the malformed records, with an extra pass over the input
+if CORRUPT_RECORD in dataFrame.columns:
+    with timings.stage('malformed count'):
+        counts['malformed'] = count_malformed(dataFrame)
+    print("malformed records: {}".format(counts['malformed']))
+
+write_metrics(args.metrics, os.path.basename(__file__), args, counts, timings.values(), spark_stages(sc), plan)
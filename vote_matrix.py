@@ -0,0 +1,122 @@
+from array import array
+from itertools import groupby
+
+import numpy as np
+
+from output import atomic_file
+
+#
+# The final stage of the vote pipelines over NumPy count matrices.
+#
+# The per-user counts of a partition, ((period, user), [count per party]) with the party ids of votes.PartyCounter,
+# are stacked into a matrix with a row per user and a column per party, of the smallest unsigned integer type that
+# holds the largest count, so a user takes one to four bytes per party. The vote of every user (the party with the
+# largest count unless several are tied), the bot cutoff and the votes per period and party are then computed for all
+# rows at once, with argmax, comparisons and a single bincount, instead of a call per user in Python.
+#
+# The matrices can also be written to a file per period, to analyse the counts of the users with NumPy or SciPy
+# without running the job again.
+#
+# NumPy is only needed on the driver and the executors with --vectorized or --matrix-output, the scripts only import
+# this module then.
+#
+
+# rows converted to a matrix at once, which bounds the memory the lists of arrays take before they are converted
+CHUNK = 65536
+
+
+#
+# (keys, matrix) of (key, counts) pairs with counts for the given number of parties
+#
+def count_matrix(rows, parties):
+    keys, chunks, chunk = [], [], []
+    for key, counts in rows:
+        keys.append(key)
+        chunk.append(counts)
+        if len(chunk) == CHUNK:
+            chunks.append(np.array(chunk, dtype=np.uint32))
+            chunk = []
+    if chunk:
+        chunks.append(np.array(chunk, dtype=np.uint32))
+    matrix = np.concatenate(chunks) if chunks else np.zeros((0, parties), dtype=np.uint32)
+    return keys, matrix.astype(np.min_scalar_type(matrix.max() if matrix.size else 0))
+
+
+#
+# the column of the largest count of every row of a matrix, or -1 if several columns are tied for it or the row has
+# no counts, as PartyCounter.winner
+#
+def winners(matrix):
+    if not matrix.shape[1]:
+        return np.full(len(matrix), -1, dtype=np.intp)
+    winner = matrix.argmax(axis=1)
+    top = matrix[np.arange(len(matrix)), winner]
+    tied = (matrix == top[:, np.newaxis]).sum(axis=1) > 1
+    winner[tied | (top == 0)] = -1
+    return winner
+
+
+#
+# whether every row of a matrix is the counts of a bot, as BotCutoff.is_bot, with the index of the period of every row
+# in periods
+#
+def bot_rows(bots, matrix, period_ids, periods):
+    limits = np.full(len(periods), np.inf)
+    if bots.max_tweets is not None:
+        limits = np.minimum(limits, bots.max_tweets)
+    if bots.max_rate is not None:
+        limits = np.minimum(limits, bots.max_rate * np.array([bots.days[period] for period in periods]))
+    return matrix.sum(axis=1, dtype=np.int64) > limits[period_ids]
+
+
+#
+# mapPartitions function counting the votes of the users ((period, user), [count per party]) of a partition per period
+# and party: ((period, party), votes) pairs, with counter the PartyCounter of the counts and bots the BotCutoff of the
+# periods; the users, tied users and bots are counted in the given Counters (see metrics.py)
+# with a PoissonBootstrap, the votes are arrays: the votes followed by their total in every replicate
+#
+def partition_votes(rows, counter, bots, counters, bootstrap=None):
+    parties, periods = counter.parties, sorted(bots.days)
+    keys, matrix = count_matrix(rows, len(parties))
+    if not keys:
+        return
+
+    # every user gets the index of their period and party in the (period, party) cells of the votes
+    period_ids = np.array([periods.index(period) for period, _ in keys], dtype=np.intp)
+    winner = winners(matrix)
+    bot = bot_rows(bots, matrix, period_ids, periods)
+    voting = (winner >= 0) & ~bot
+    cells = (period_ids * len(parties) + winner)[voting]
+
+    counters.add('users', len(keys))
+    counters.add('bot_users', int(bot.sum()))
+    counters.add('tied_users', int(((winner < 0) & ~bot).sum()))
+
+    if bootstrap is None:
+        votes = np.bincount(cells, minlength=len(periods) * len(parties))
+        for cell in np.flatnonzero(votes):
+            yield (periods[cell // len(parties)], parties[cell % len(parties)]), int(votes[cell])
+    else:
+        weights = np.array([bootstrap.votes(u'{}\x00{}'.format(*keys[i])) for i in np.flatnonzero(voting)],
+                           dtype=np.int64).reshape(-1, bootstrap.replicates + 1)
+        votes = np.zeros((len(periods) * len(parties), bootstrap.replicates + 1), dtype=np.int64)
+        np.add.at(votes, cells, weights)
+        for cell in np.flatnonzero(votes[:, 0]):
+            yield (periods[cell // len(parties)], parties[cell % len(parties)]), array('l', votes[cell].tolist())
+
+
+#
+# write the count matrix of the users of every period to the file filename(period), from the per-user counts
+# ((period, user), [count per party]) sorted by key, in the format of scipy.sparse.save_npz: scipy.sparse.load_npz
+# reads it as a CSR matrix with a row per user and a column per party, and numpy.load reads the arrays users and
+# parties with the screen names of the rows and the names of the columns
+#
+def write_matrices(rows, parties, filename):
+    for period, rows in groupby(rows, lambda row: row[0][0]):
+        keys, matrix = count_matrix(rows, len(parties))
+        nonzero = matrix != 0
+        with atomic_file(filename(period), 'wb') as f:
+            np.savez_compressed(f, format=np.array(b'csr'), shape=np.array(matrix.shape), data=matrix[nonzero],
+                                indices=np.nonzero(nonzero)[1].astype(np.int32),
+                                indptr=np.concatenate([[0], np.cumsum(nonzero.sum(axis=1))]).astype(np.int32),
+                                users=np.array([user for _, user in keys]), parties=np.array(parties))
@@ -0,0 +1,155 @@
+from array import array
+from bisect import bisect
+import hashlib
+import math
+import random
+
+#
+# Fixed-size per-user party counters for the vote pipelines.
+#
+# Every party gets a small int id, and the tweets of a user about each party are counted in an array indexed by that
+# id. When tweets are classified by several methods at once, the array holds the counts of every method one after
+# the other. The arrays are combined map-side by aggregateByKey, so a user costs a few bytes per party in the shuffle
+# and in executor memory, however many tweets they send, and finding the party a user votes for is a scan over the
+# array. The same counts tell which users tweet so much they are taken for bots, if a limit is given.
+#
+# The vote of a user can also carry bootstrap weights, so the vote totals come with confidence intervals from a
+# single run, see PoissonBootstrap.
+#
+
+
+class PartyCounter(object):
+
+    #
+    # build the party ids from the parties (any iterable, duplicates are ignored), for a number of methods
+    #
+    def __init__(self, parties, methods=1):
+        self.parties = sorted(set(parties))
+        self.index = dict((party, i) for i, party in enumerate(self.parties))
+        self.methods = methods
+
+    #
+    # zero value of aggregateByKey: a count of zero for every party, for every method
+    #
+    def zero(self):
+        return array('l', [0] * (len(self.parties) * self.methods))
+
+    #
+    # seqFunc of aggregateByKey: count one tweet about a party
+    #
+    def add(self, counts, party):
+        counts[self.index[party]] += 1
+        return counts
+
+    #
+    # seqFunc of aggregateByKey with several methods: count one tweet about the party (or None) of every method
+    #
+    def add_methods(self, counts, parties):
+        size = len(self.parties)
+        for method, party in enumerate(parties):
+            if party is not None:
+                counts[method * size + self.index[party]] += 1
+        return counts
+
+    #
+    # combFunc of aggregateByKey: add the counts of two arrays into the first
+    #
+    def merge(self, counts1, counts2):
+        for i, count in enumerate(counts2):
+            counts1[i] += count
+        return counts1
+
+    #
+    # the party with the largest count, or None if several parties are tied for the largest count
+    #
+    def winner(self, counts):
+        best = 0
+        winner = None
+        for i, count in enumerate(counts):
+            if count > best:
+                best = count
+                winner = i
+            elif count == best:
+                winner = None
+        return None if winner is None else self.parties[winner]
+
+    #
+    # the winner (or None) of every method
+    #
+    def winners(self, counts):
+        size = len(self.parties)
+        return [self.winner(counts[method * size:(method + 1) * size]) for method in range(self.methods)]
+
+
+class BotCutoff(object):
+
+    #
+    # users whose tweets about the parties in a period are more than max_tweets, or more than max_rate per day of the
+    # period, are taken for bots and do not vote; without either limit nobody is cut off
+    # days is the number of days of every period
+    #
+    def __init__(self, days, max_tweets=None, max_rate=None):
+        self.days = days
+        self.max_tweets = max_tweets
+        self.max_rate = max_rate
+
+    def is_bot(self, period, counts):
+        tweets = sum(counts)
+        if self.max_tweets is not None and tweets > self.max_tweets:
+            return True
+        return self.max_rate is not None and tweets > self.max_rate * self.days[period]
+
+
+#
+# cumulative probabilities of the Poisson(1) distribution, up to where the rest is below double precision
+#
+def _poisson_cumulative():
+    cumulative = []
+    probability, total, k = math.exp(-1), 0.0, 0
+    while total < 1 - 1e-16 and k < 20:
+        total += probability
+        cumulative.append(total)
+        k += 1
+        probability /= k
+    return cumulative
+
+
+class PoissonBootstrap(object):
+
+    #
+    # Poisson bootstrap of the vote totals: every user gets a weight drawn from Poisson(1) in each of a number of
+    # replicates, and the total of a party in a replicate is the sum of the weights of its voters. This resamples the
+    # users, as rerunning the job on resampled data would, in the same pass as the votes.
+    # The weights of a user are drawn from a generator seeded with a hash of the user and the seed, so they are the
+    # same in every task, process and run.
+    #
+    def __init__(self, replicates=200, seed=2017):
+        self.replicates = replicates
+        self.seed = seed
+        self.cumulative = _poisson_cumulative()
+
+    #
+    # the vote of a user (a string) with its weights: [1, weight in replicate 1, weight in replicate 2, ...]
+    #
+    def votes(self, user):
+        digest = hashlib.md5(u'{}\x00{}'.format(self.seed, user).encode('utf8')).hexdigest()
+        generator = random.Random(int(digest[:16], 16))
+        weights = array('l', [1])
+        weights.extend(bisect(self.cumulative, generator.random()) for _ in range(self.replicates))
+        return weights
+
+    #
+    # add the votes of two arrays into the first, for reduceByKey
+    #
+    def merge(self, votes1, votes2):
+        for i, count in enumerate(votes2):
+            votes1[i] += count
+        return votes1
+
+    #
+    # the percentile interval of the totals of the replicates of an array of votes, for a confidence level
+    #
+    def interval(self, votes, confidence=0.95):
+        totals = sorted(votes[1:])
+        alpha = (1 - confidence) / 2
+        return totals[int(round(alpha * (len(totals) - 1)))], totals[int(round((1 - alpha) * (len(totals) - 1)))]